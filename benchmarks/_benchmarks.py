@@ -0,0 +1,121 @@
+"""
+Some stuff needed for all the benchmarks.
+"""
+
+# Add the parent directory to the PATH so the benchmarks can be run without the
+# ninja package needing to be installed.
+import sys; sys.path.append('../')
+
+import gc, math, time
+
+# The best timer for short intervals, as in `timeit`.
+from timeit import default_timer as clock
+
+
+def timeRuns(fn, repeat=5, number=1):
+    """
+    Call `fn` `number` times per run, for `repeat` runs, and return the
+    fastest run's time per call in seconds.
+    """
+    best = float('inf')
+    for r in range(repeat):
+        start = time.time()
+        for n in range(number):
+            fn()
+        best = min(best, (time.time() - start) / number)
+    return best
+
+
+def _percentile(ordered, fraction):
+    # Linear interpolation between the closest ranks.
+    position = (len(ordered) - 1) * fraction
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+def measure(fn, ops=1, repeat=7, min_time=0.1):
+    """
+    Time `fn`, which does `ops` operations per call, and return statistics on
+    the time per operation.
+
+    `fn` is called once to warm up, then a number of times per run chosen so
+    each run takes at least `min_time` seconds, for `repeat` runs. The garbage
+    collector is paused during runs, as in `timeit`. The median is the figure
+    to go by; `rsd` (the standard deviation relative to the mean) and `iqr`
+    show how noisy the runs were.
+    """
+    fn()
+    number = 1
+    while True:
+        start = clock()
+        for n in xrange(number):
+            fn()
+        elapsed = clock() - start
+        if elapsed >= min_time or number >= 1000000:
+            break
+        number *= 2 if elapsed == 0 else max(2, min(10, int(min_time / elapsed) + 1))
+
+    times = []
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        for r in range(repeat):
+            start = clock()
+            for n in xrange(number):
+                fn()
+            times.append((clock() - start) / (number * ops))
+    finally:
+        if collecting:
+            gc.enable()
+
+    ordered = sorted(times)
+    mean = sum(times) / len(times)
+    stdev = math.sqrt(sum((t - mean) ** 2 for t in times) / max(len(times) - 1, 1))
+    median = _percentile(ordered, 0.5)
+    return {
+        'median'    : median,
+        'min'       : ordered[0],
+        'max'       : ordered[-1],
+        'mean'      : mean,
+        'stdev'     : stdev,
+        'rsd'       : stdev / mean if mean else 0.0,
+        'iqr'       : _percentile(ordered, 0.75) - _percentile(ordered, 0.25),
+        'ops_per_s' : 1.0 / median if median else float('inf'),
+        'runs'      : repeat,
+        'number'    : number,
+        'ops'       : ops,
+    }
+
+
+def compareResults(results, baseline, threshold=0.1):
+    """
+    Compare `results` with `baseline` (both dicts of `measure` statistics by
+    name), and return `(name, ratio, verdict)` for each name in both, where
+    `ratio` is the new median over the baseline's. The verdict is 'slower' or
+    'faster' when the medians differ by more than `threshold` (10% by
+    default), '~' when they do but by no more than twice the noise of the
+    noisier side (its `rsd`), and '' otherwise.
+    """
+    rows = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        new, old = results[name], baseline[name]
+        ratio = new['median'] / old['median'] if old['median'] else float('inf')
+        change = abs(ratio - 1)
+        verdict = ''
+        if change > threshold:
+            if change <= 2 * max(new['rsd'], old['rsd']):
+                verdict = '~'
+            else:
+                verdict = 'slower' if ratio > 1 else 'faster'
+        rows.append((name, ratio, verdict))
+    return rows
+
+
+def formatTime(seconds):
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return '%7.2f %-2s' % (seconds / scale, unit)
+    return '%7.1f ns' % (seconds / 1e-9,)
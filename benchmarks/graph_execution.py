@@ -0,0 +1,51 @@
+"""
+Compares the recursive emit path with a compiled `ExecutionPlan`, on a long
+chain of Channels and on a wide fan-out.
+"""
+
+from _benchmarks import *
+
+from ninja.nodes import Channel, Sink, Source, compileGraph
+
+
+def buildChain(length):
+    source = Source(1)
+    previous = source
+    for i in range(length):
+        channel = Channel(transform=lambda d: d)
+        channel.i.connect(previous.o)
+        previous = channel
+    previous.o.connect(Sink(on_receive=lambda d: None).i)
+    return source
+
+def buildFanOut(width):
+    source = Source(1)
+    for i in range(width):
+        channel = Channel()
+        channel.i.connect(source.o)
+        channel.o.connect(Sink(on_receive=lambda d: None).i)
+    return source
+
+
+def compare(name, source, number):
+    recursive = timeRuns(source.emitData, number=number)
+    plan = compileGraph(source)
+    compiled = timeRuns(plan.tick, number=number)
+    plan.release()
+    print '%-16s recursive: %8.1f us/tick   compiled: %8.1f us/tick   (%.2fx)' % (
+        name, recursive * 1e6, compiled * 1e6, recursive / compiled,
+    )
+
+
+compare('chain of 100', buildChain(100), 1000)
+compare('chain of 150', buildChain(150), 500)
+compare('fan-out of 1000', buildFanOut(1000), 100)
+
+# Past the recursion limit only the compiled plan can run at all.
+deep = buildChain(10000)
+try:
+    deep.emitData()
+except RuntimeError as e:
+    print 'chain of 10000   recursive: failed (%s)' % (e,)
+plan = compileGraph(deep)
+print 'chain of 10000   compiled: %8.1f us/tick' % (timeRuns(plan.tick, number=10) * 1e6,)
@@ -0,0 +1,52 @@
+"""
+Records per second for the whole-file `JSONWriter` (rewriting a growing list
+of records on every item, which is how it has to be used to keep a log)
+against the append-only `JSONLinesWriter`.
+"""
+
+from _benchmarks import *
+
+import os, shutil, tempfile
+from datetime       import datetime
+
+from ninja.nodes    import JSONWriter, JSONLinesWriter
+from ninja.units    import Temperature
+
+
+def record(n):
+    return {
+        'guid'      : '1012BB013000_0101_0_31',
+        'last_read' : datetime(2013, 1, 1, 0, 0, n % 60),
+        'data'      : Temperature(c=20 + n % 10),
+    }
+
+directory = tempfile.mkdtemp()
+
+def runJSONWriter(count):
+    writer = JSONWriter()
+    path = os.path.join(directory, 'log.json')
+    records = []
+    for n in range(count):
+        records.append(record(n))
+        writer.i({ 'file': path, 'data': records })
+
+def runJSONLinesWriter(count, **kwargs):
+    path = os.path.join(directory, 'log.jsonl')
+    if os.path.exists(path):
+        os.remove(path)
+    writer = JSONLinesWriter(file=path, **kwargs)
+    for n in range(count):
+        writer.i(record(n))
+    writer.close()
+
+
+try:
+    for count in (100, 1000):
+        whole = timeRuns(lambda: runJSONWriter(count), repeat=3)
+        lines = timeRuns(lambda: runJSONLinesWriter(count), repeat=3)
+        grouped = timeRuns(lambda: runJSONLinesWriter(count, commit_every=100), repeat=3)
+        print '%5d records  JSONWriter: %9.0f rec/s   JSONLinesWriter: %9.0f rec/s   (commit_every=100: %9.0f rec/s)' % (
+            count, count / whole, count / lines, count / grouped,
+        )
+finally:
+    shutil.rmtree(directory)
@@ -0,0 +1,301 @@
+"""
+Throughput and latency of the library's hot paths, as one standalone run:
+
+    python suite.py                         # run everything
+    python suite.py graph writers           # only names containing these
+    python suite.py --save results.json     # keep the results
+    python suite.py --compare results.json  # compare against kept results
+
+Each benchmark reports the median time per operation, the operations per
+second that works out to, and how noisy its runs were (see `measure`). With
+`--compare`, medians that moved by more than `--threshold` are flagged, and
+the exit status is 1 if anything got slower.
+"""
+
+from _benchmarks import *
+
+import itertools, json, os, platform, shutil, tempfile
+from contextlib     import contextmanager
+from datetime       import datetime
+from optparse       import OptionParser
+
+import requests
+
+from ninja.api          import NinjaAPI, Watcher
+from ninja.devices      import Device, TemperatureSensor
+from ninja.events       import Events
+from ninja.nodes        import (Channel, CSVWriter, Join, JSONLinesWriter, JSONWriter,
+                            Sink, Source, compileGraph)
+from ninja.simulation   import Fleet, FleetServer
+from ninja.units        import Color, Temperature
+
+
+
+BENCHMARKS = []
+
+def benchmark(name, setup, *args, **kwargs):
+    """
+    Add a benchmark. `setup(*args)` is a generator that prepares whatever is
+    needed, yields the function to time, and cleans up once it resumes.
+    `ops` is the number of operations one call of that function does; `repeat`
+    and `min_time` are passed to `measure`.
+    """
+    BENCHMARKS.append((name, contextmanager(setup), args, kwargs))
+
+
+
+# Device heartbeats: decoding the response, parsing the data, and firing the
+# events, without the network.
+
+class Stub_NinjaAPI(object):
+    def __init__(self, values):
+        self._bodies = [json.dumps({
+            'id'    : 0,
+            'data'  : { 'DA': value, 'timestamp': 1357000000000 },
+        }) for value in values]
+        self._count = 0
+
+    def getDeviceHeartbeat(self, guid):
+        self._count += 1
+        return json.loads(self._bodies[self._count % len(self._bodies)])
+
+def heartbeat(device_class, values, handlers):
+    device = device_class(Stub_NinjaAPI(values), '1012BB013000_0101_0_31', {
+        'device_type'   : 'temperature',
+        'default_name'  : 'Temperature',
+    })
+    for n in range(handlers):
+        device.on(Device.Events.HEARTBEAT, lambda *args: None)
+        device.on(Device.Events.CHANGE, lambda *args: None)
+    yield device.heartbeat
+
+benchmark('heartbeat/device', heartbeat, Device, [20], 1)
+benchmark('heartbeat/device changed', heartbeat, Device, [20, 21], 1)
+benchmark('heartbeat/temperature changed', heartbeat, TemperatureSensor, [20.5, 21.5], 1)
+
+
+
+# Units
+
+def call(fn, *args):
+    yield lambda: fn(*args)
+
+benchmark('units/Temperature(c=)', call, lambda: Temperature(c=21.5))
+benchmark('units/Temperature.f', call, lambda t: t.f, Temperature(c=21.5))
+benchmark('units/Temperature +', call, lambda t: t + 1, Temperature(c=21.5))
+benchmark('units/Color(hex)', call, lambda: Color('FF8000'))
+benchmark('units/Color(r, g, b)', call, lambda: Color(255, 128, 0))
+benchmark('units/Color.hex', call, lambda c: c.hex, Color(255, 128, 0))
+benchmark('units/Color.hls', call, lambda c: c.hls, Color(255, 128, 0))
+
+
+
+# Events
+
+def fire(handlers):
+    events = Events()
+    for n in range(handlers):
+        events.on('heartbeat', lambda *args: None)
+    yield lambda: events._fire('heartbeat', 20)
+
+for handlers in (0, 1, 10, 100):
+    benchmark('events/_fire %d handlers' % (handlers,), fire, handlers)
+
+
+
+# Node graphs, through the recursive emit path and compiled. The chains are
+# kept short enough for the recursive path to stay under the recursion limit.
+
+def _sink(previous):
+    previous.o.connect(Sink(on_receive=lambda d: None).i)
+
+def buildChain(length):
+    source = previous = Source(1)
+    for n in range(length):
+        channel = Channel(transform=lambda d: d)
+        channel.i.connect(previous.o)
+        previous = channel
+    _sink(previous)
+    return source
+
+def buildFanOut(width):
+    source = Source(1)
+    for n in range(width):
+        channel = Channel()
+        channel.i.connect(source.o)
+        _sink(channel)
+    return source
+
+def buildJoin(width):
+    # One source feeding `width` channels that are joined back together, one
+    # group per tick.
+    source = Source(itertools.count().next)
+    join = Join(key=lambda d: d)
+    for n in range(width):
+        channel = Channel()
+        channel.i.connect(source.o)
+        join.i.connect(channel.o)
+    _sink(join)
+    return source
+
+def graph(build, size, compiled):
+    source = build(size)
+    if compiled:
+        plan = compileGraph(source)
+        yield plan.tick
+        plan.release()
+    else:
+        yield source.emitData
+
+for compiled in (False, True):
+    mode = 'compiled' if compiled else 'recursive'
+    for size in (10, 100):
+        benchmark('graph/chain %d %s' % (size, mode), graph, buildChain, size, compiled)
+    benchmark('graph/fan-out 100 %s' % (mode,), graph, buildFanOut, 100, compiled)
+    benchmark('graph/join 10 %s' % (mode,), graph, buildJoin, 10, compiled)
+
+
+
+# File writers, in rows (or records) per operation.
+
+def record(n):
+    return {
+        'guid'      : '1012BB013000_0101_0_31',
+        'last_read' : datetime(2013, 1, 1, 0, 0, n % 60),
+        'data'      : Temperature(c=20 + n % 10),
+    }
+
+RECORDS = [record(n) for n in range(100)]
+ROWS = [(r['guid'], r['last_read'].isoformat(), float(r['data'].c)) for r in RECORDS]
+
+@contextmanager
+def temporaryDirectory():
+    directory = tempfile.mkdtemp()
+    try:
+        yield directory
+    finally:
+        shutil.rmtree(directory)
+
+def csvWriter(**kwargs):
+    with temporaryDirectory() as directory:
+        writer = CSVWriter(file=os.path.join(directory, 'log.csv'), **kwargs)
+        def run():
+            for row in ROWS:
+                writer.i(row)
+        yield run
+        writer.close()
+
+def csvWriterBatch(**kwargs):
+    with temporaryDirectory() as directory:
+        writer = CSVWriter(file=os.path.join(directory, 'log.csv'), **kwargs)
+        yield lambda: writer.i.callBatch(ROWS, None)
+        writer.close()
+
+def jsonLinesWriter(**kwargs):
+    with temporaryDirectory() as directory:
+        writer = JSONLinesWriter(file=os.path.join(directory, 'log.jsonl'), **kwargs)
+        def run():
+            for item in RECORDS:
+                writer.i(item)
+        yield run
+        writer.close()
+
+def jsonWriter(count):
+    # The whole file is rewritten with every item, so this is per file written.
+    with temporaryDirectory() as directory:
+        writer = JSONWriter()
+        item = { 'file': os.path.join(directory, 'log.json'), 'data': RECORDS[:count] }
+        yield lambda: writer.i(item)
+
+benchmark('writers/CSVWriter', csvWriter, ops=len(ROWS))
+benchmark('writers/CSVWriter batch_size=100', csvWriter, batch_size=100, ops=len(ROWS))
+benchmark('writers/CSVWriter receiveBatch', csvWriterBatch, batch_size=100, ops=len(ROWS))
+benchmark('writers/JSONLinesWriter', jsonLinesWriter, ops=len(RECORDS))
+benchmark('writers/JSONLinesWriter commit_every=100', jsonLinesWriter, commit_every=100,
+    ops=len(RECORDS))
+benchmark('writers/JSONWriter 100 records', jsonWriter, 100)
+
+
+
+# A full Watcher cycle, heartbeating every device of a simulated fleet over
+# HTTP on localhost, in heartbeats per operation.
+
+def watcherCycle(size):
+    server = FleetServer(Fleet({ 'temperature': size }), seed=0).start()
+    try:
+        session = requests.Session()
+        api = NinjaAPI('benchmark', api_root_url=server.url, session=session)
+        watcher = Watcher(*api.getDevices())
+        yield lambda: watcher.start(period=1, duration=1)
+        session.close()
+    finally:
+        server.stop()
+
+for size in (10, 100, 1000):
+    benchmark('watcher/cycle %d devices' % (size,), watcherCycle, size, ops=size,
+        repeat=3 if size == 1000 else 5, min_time=0)
+
+
+
+def run(names, repeat=None, min_time=None, verbose=True):
+    results = {}
+    for name, setup, args, kwargs in BENCHMARKS:
+        if names and not any(n in name for n in names):
+            continue
+        kwargs = dict(kwargs)
+        options = {
+            'ops'       : kwargs.pop('ops', 1),
+            'repeat'    : kwargs.pop('repeat', 7),
+            'min_time'  : kwargs.pop('min_time', 0.1),
+        }
+        if repeat is not None:
+            options['repeat'] = min(repeat, options['repeat'])
+        if min_time is not None:
+            options['min_time'] = min(min_time, options['min_time'])
+        with setup(*args, **kwargs) as fn:
+            stats = results[name] = measure(fn, **options)
+        if verbose:
+            print '%-44s %s/op %12.0f op/s   rsd %5.1f%%' % (
+                name, formatTime(stats['median']), stats['ops_per_s'], stats['rsd'] * 100,
+            )
+    return results
+
+
+def main():
+    parser = OptionParser(usage='%prog [options] [name ...]')
+    parser.add_option('--save', metavar='FILE', help='save the results as JSON')
+    parser.add_option('--compare', metavar='FILE', help='compare with results saved earlier')
+    parser.add_option('--threshold', type='float', default=0.1,
+        help='the change in median to flag, as a fraction (default 0.1)')
+    parser.add_option('--quick', action='store_true',
+        help='fewer, shorter runs, for a rough idea')
+    options, names = parser.parse_args()
+
+    if options.quick:
+        results = run(names, repeat=3, min_time=0.02)
+    else:
+        results = run(names)
+
+    if options.save:
+        with open(options.save, 'w') as f:
+            json.dump({
+                'python'    : platform.python_version(),
+                'platform'  : platform.platform(),
+                'date'      : datetime.utcnow().isoformat(),
+                'results'   : results,
+            }, f, indent=2, sort_keys=True)
+
+    if options.compare:
+        with open(options.compare) as f:
+            baseline = json.load(f)['results']
+        print
+        slower = False
+        for name, ratio, verdict in compareResults(results, baseline, options.threshold):
+            print '%-44s %6.2fx  %s' % (name, ratio, verdict)
+            slower = slower or verdict == 'slower'
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,22 @@
+"""
+An example that serves a live dashboard of every device, using the built-in
+DashboardServer instead of a web framework. The devices are heartbeated every
+10 seconds in the background, no matter how many browsers are open, and the
+page updates itself as readings change.
+
+Open http://127.0.0.1:8000/ to see the dashboard, or
+http://127.0.0.1:8000/devices.json for the raw data.
+"""
+
+from _examples import *
+
+from ninja.api      import NinjaAPI
+from ninja.server   import DashboardServer
+
+
+
+api = NinjaAPI(secrets.ACCESS_TOKEN)
+
+server = DashboardServer(api, period=10, port=8000, verbose=True)
+print 'Serving on', server.url
+server.serveForever()
@@ -55,6 +55,7 @@ from ninja.nodes    import (
     And,
     Channel,
     CSVWriter,
+    Dedupe,
     Echo,
     LEDNode,
     TemperatureNode,
@@ -134,9 +135,12 @@ Connect the nodes to build the graph.
 #     [A]
 channel.i.connect(accel_node.o)
 
-# ...and to the LED node (and an Echo to print the rgb value).
+# ...and to the LED node (and an Echo to print the rgb value). A Dedupe in
+# front of the LED node skips the PUT when the color hasn't changed.
 #     [B,C]         [5]
-channel.o.connect(Echo('RGB').i, led_node.i)
+led_dedupe = Dedupe()
+led_dedupe.o.connect(led_node.i)
+channel.o.connect(Echo('RGB').i, led_dedupe.i)
 
 # Create an And node to join the temperature and orientation data together.
 #   [6]
@@ -3,7 +3,8 @@ An example web app that displays a list of devices, with links to a page for
 each device's data. The device page updates every 2 seconds with the latest
 heartbeat.
 
-Note: requires Flask
+Note: requires Flask. Each open device page triggers its own heartbeats; see
+`dashboard_server.py` for a server that heartbeats once for every client.
 """
 
 from _examples import *
@@ -1,6 +1,6 @@
 import json
 import requests
-import time
+import threading
 
 from datetime   import datetime
 from exceptions import Exception, ValueError
@@ -20,6 +20,10 @@ class NinjaAPIError(Exception):
 class NinjaAPI(object):
     """
     Carries authentication information
+
+    `api_root_url` points the API somewhere other than the Ninja servers (eg
+    a `ninja.simulation.FleetServer`), and `session` sends the requests
+    through a `requests` session, to reuse pooled connections.
     """
 
     API_ROOT_URL    = 'https://api.ninja.is/rest/'
@@ -31,19 +35,27 @@ class NinjaAPI(object):
     DEVICE_ROOT_URL = API_ROOT_URL + API_VERSION + 'device'
 
 
-    def __init__(self, *args):
+    def __init__(self, *args, **kwargs):
         if len(args) != 1:
             raise ValueError('NinjaAPI instance requires an access token')
         
         self.access_token = args[0]
 
+        root = kwargs.get('api_root_url', self.API_ROOT_URL)
+        if not root.endswith('/'):
+            root += '/'
+        self.USER_URL           = root + self.API_VERSION + 'user'
+        self.DEVICES_URL        = root + self.API_VERSION + 'devices'
+        self.DEVICE_ROOT_URL    = root + self.API_VERSION + 'device'
+        self._http = kwargs.get('session') or requests
+
     def _makeGETRequest(self, url, binary=False):
 
         params = {
             'user_access_token': self.access_token,
         }
 
-        res = requests.get(url, params=params)   
+        res = self._http.get(url, params=params)   
 
         if res.status_code == 200:
             if binary:
@@ -61,7 +73,7 @@ class NinjaAPI(object):
         params = {
             'user_access_token': self.access_token,
         }
-        res = requests.post(url, params=params, data=data)
+        res = self._http.post(url, params=params, data=data)
         if res.status_code == 200:
             try:
                 content = json.loads(res.content)
@@ -77,7 +89,7 @@ class NinjaAPI(object):
         params = {
             'user_access_token': self.access_token,
         }
-        res = requests.put(url, params=params, data=data)   
+        res = self._http.put(url, params=params, data=data)   
 
         if res.status_code == 200:
             try:
@@ -92,7 +104,7 @@ class NinjaAPI(object):
         params = {
             'user_access_token': self.access_token,
         }
-        res = requests.delete(url, params=params)   
+        res = self._http.delete(url, params=params)   
 
         if res.status_code == 200:
             try:
@@ -168,6 +180,7 @@ class Watcher(object):
         for device in args:
             self.watch(device)
         self.active = False
+        self._stopping = threading.Event()
         self._post_cycle = kwargs.get('post_cycle')
         self._pre_cycle = kwargs.get('pre_cycle')
         return super(Watcher, self).__init__()
@@ -181,11 +194,12 @@ class Watcher(object):
     def start(self, period=10, duration=float('inf'), silent=False):
         self.active = True
         self._elapsed = 0
+        self._stopping.clear()
 
         if not self._devices:
             raise Exception('Watcher instance does not have any devices')
 
-        while self._elapsed < duration:
+        while self._elapsed < duration and not self._stopping.is_set():
             if self._pre_cycle:
                 self._pre_cycle()
 
@@ -199,8 +213,13 @@ class Watcher(object):
                 self._post_cycle()
 
             if duration - self._elapsed > period:
-                time.sleep(period)
+                self._stopping.wait(period)
 
         self.active = False
 
+    # Ends the cycle started by `start` (which may be running on another
+    # thread) after the current round of heartbeats.
+    def stop(self):
+        self._stopping.set()
+
 
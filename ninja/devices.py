@@ -1,7 +1,8 @@
-import copy, time
+import copy
 from datetime import datetime
 
 from .events    import Events
+from .scheduler import sharedScheduler
 from .units     import Temperature
 
 
@@ -17,6 +18,7 @@ class Device(Events):
         device.data
         device.last_heartbeat
         device.last_read
+        device.changed          (whether the last heartbeat changed the data)
 
 
     """
@@ -37,6 +39,7 @@ class Device(Events):
         self.data           = None
         self.last_heartbeat = None
         self.last_read      = None
+        self.changed        = False
 
     def __str__(self):
         return '{device_name} ({class_name})'.format(
@@ -48,6 +51,8 @@ class Device(Events):
         return str(self)
 
     def heartbeat(self, silent=False):
+        # Cleared first, so a failed heartbeat does not leave it set.
+        self.changed = False
         data = self.api.getDeviceHeartbeat(self.guid)
         if data['id'] == 0:
             previous_data       = copy.deepcopy(self.data)
@@ -55,11 +60,12 @@ class Device(Events):
             self.data           = self._parse(data['data']['DA'])
             last_read           = data['data']['timestamp']
             self.last_read      = datetime.utcfromtimestamp(last_read / 1000)
+            self.changed        = (self.data != previous_data)
 
             # Fire the events unless suppressed.
             if not silent:
                 self._fire(Device.Events.HEARTBEAT, self.data)
-                if self.data != previous_data:
+                if self.changed:
                     self._fire(Device.Events.CHANGE, self.data, previous_data)
 
         return self.last_read, self.data
@@ -80,7 +86,8 @@ class Device(Events):
             device_dict[field] = getattr(self, field)
 
         if for_json:
-            device_dict['data'] = self._dataToJSON()
+            if self.data is not None:
+                device_dict['data'] = self._dataToJSON()
             if self.last_read:
                 device_dict['last_read'] = self.last_read.isoformat()
             if self.last_heartbeat:
@@ -91,11 +98,20 @@ class Device(Events):
     def onHeartbeat(self, callback):
         return self.on(Device.Events.HEARTBEAT, callback)
 
-    def pulse(self, period=10):
-        while True:
-            self.heartbeat()
-            time.sleep(period)
-        return
+    # Heartbeat every `period` seconds on a Scheduler (the shared one by
+    # default), until the returned Repeat is cancelled. Blocks until then
+    # unless `wait=False`. The heartbeats run on the scheduler's workers.
+    # While waiting, an error in a heartbeat (eg a bad token) stops the pulse
+    # and is raised here; otherwise errors are counted on the Repeat, in
+    # `errors` and `last_error`.
+    def pulse(self, period=10, wait=True, scheduler=None):
+        timer = (scheduler or sharedScheduler()).repeat(period, self.heartbeat,
+            delay=0, background=True, stop_on_error=wait)
+        if wait:
+            timer.wait()
+            if timer.last_error is not None:
+                raise timer.last_error
+        return timer
 
     def setWebhookURL(self, url):
         return self.api.setDeviceWebhookURL(self.guid, url)
@@ -1,6 +1,14 @@
 from .core      import *
+from .graph     import *
+from .edges     import *
+from .partitions import *
+from .profiling import *
 from .basic     import *
+from .windows   import *
+from .downsample import *
+from .anomaly   import *
 from .devices   import *
 from .fileio    import *
 from .logic     import *
+from .flow      import *
 from .network   import *
@@ -0,0 +1,161 @@
+import math
+from collections import OrderedDict
+
+from .core import Node, HasInput, HasOutput, Output, readingGuid, readingValue
+
+
+class _DeviceStats(object):
+    """
+    The running statistics of one device: an exponentially weighted mean and
+    variance, a frugal-streaming estimate of the median and the median
+    absolute deviation, and the length of the current run of repeated
+    values. Each update is O(1), and the state is a handful of floats.
+    """
+    __slots__ = ('count', 'mean', 'var', 'median', 'mad', 'last', 'repeats')
+
+    def __init__(self, value):
+        self.count = 1
+        self.mean = value
+        self.var = 0.0
+        self.median = value
+        self.mad = 0.0
+        self.last = value
+        self.repeats = 0
+
+    def update(self, value, alpha, rate, tolerance):
+        diff = value - self.mean
+        increment = alpha * diff
+        self.mean += increment
+        self.var = (1 - alpha) * (self.var + diff * increment)
+
+        # Frugal streaming: nudge each estimate towards the new value by a
+        # step that scales with the spread, so it adapts to any unit.
+        step = rate * max(self.mad, math.sqrt(self.var), 1e-9)
+        if value > self.median:
+            self.median += step
+        elif value < self.median:
+            self.median -= step
+        deviation = abs(value - self.median)
+        if deviation > self.mad:
+            self.mad += step
+        elif deviation < self.mad:
+            self.mad = max(self.mad - step, 0.0)
+
+        if abs(value - self.last) <= tolerance:
+            self.repeats += 1
+        else:
+            self.repeats = 0
+        self.last = value
+        self.count += 1
+
+
+
+class AnomalyDetector(Node, HasInput, HasOutput):
+    """
+    Public (I/O): flags anomalous readings as they arrive, without keeping any
+    history. Normal readings are passed through `o`; anomalies are sent to the
+    `anomaly` output instead, as a dict of the reading (`data`), its `guid`
+    and `value`, the `reasons` it was flagged, and the statistics it was
+    judged against.
+
+    Each device (`group(data)`, the `guid` of device node data by default)
+    keeps its own statistics, updated in O(1) per reading. A reading is
+    flagged for:
+
+        'zscore'    - being more than `threshold` (3 by default) standard
+                      deviations from the exponentially weighted mean
+                      (weighted by `alpha`, 0.1 by default)
+        'robust'    - being more than `threshold` robust deviations from the
+                      streaming estimate of the median, using the median
+                      absolute deviation, which a burst of outliers cannot
+                      drag along as easily as the mean
+        'stuck'     - repeating the previous value (within `tolerance`) for
+                      `stuck_after` readings in a row, if `stuck_after` is set
+
+    Nothing is flagged until a device has sent `warmup` readings (10 by
+    default). Every device is tracked (a few hundred bytes each) unless
+    `max_devices` is set; past that many, the least recently seen device is
+    forgotten. Devices read in turn (eg by a `Ticker`) are each forgotten
+    before they are seen again if the fleet is larger than the cap, and never
+    get past warmup, so the cap must be above the number of devices.
+    """
+    def __init__(self, *args, **kwargs):
+        super(AnomalyDetector, self).__init__(*args, **kwargs)
+        self._value = kwargs.get('value', readingValue)
+        self._group = kwargs.get('group', readingGuid)
+        self._alpha = kwargs.get('alpha', 0.1)
+        self._rate = kwargs.get('rate', 0.05)
+        self._threshold = kwargs.get('threshold', 3.0)
+        self._warmup = kwargs.get('warmup', 10)
+        self._stuck_after = kwargs.get('stuck_after', None)
+        self._tolerance = kwargs.get('tolerance', 0.0)
+        self._max_devices = kwargs.get('max_devices', None)
+        if not 0 < self._alpha <= 1:
+            raise ValueError('alpha must be greater than 0 and at most 1')
+        if self._threshold <= 0:
+            raise ValueError('threshold must be greater than 0')
+        if self._max_devices is not None and self._max_devices <= 0:
+            raise ValueError('max_devices must be an int greater than 0')
+
+        # Only a capped detector needs the devices kept in LRU order.
+        self._devices = OrderedDict() if self._max_devices is not None else {}
+        self.anomalies = 0
+        self.evicted = 0
+        self.attachConnector('anomaly', Output)
+
+    def statsFor(self, guid):
+        return self._devices.get(guid)
+
+    def receiveData(self, data, from_id):
+        guid = self._group(data)
+        value = self._value(data)
+        devices = self._devices
+
+        if self._max_devices is not None:
+            stats = devices.pop(guid, None)
+            devices[guid] = stats
+        else:
+            stats = devices.get(guid)
+        if stats is None:
+            devices[guid] = _DeviceStats(value)
+            if self._max_devices is not None and len(devices) > self._max_devices:
+                devices.popitem(last=False)
+                self.evicted += 1
+            self.o.emit(data)
+            return
+
+        # Judge the reading against the statistics from before it.
+        reasons = []
+        zscore = robust = None
+        if stats.count >= self._warmup:
+            if stats.var > 0:
+                zscore = (value - stats.mean) / math.sqrt(stats.var)
+                if abs(zscore) > self._threshold:
+                    reasons.append('zscore')
+            if stats.mad > 0:
+                # 0.6745 scales the MAD to a standard deviation for normal data.
+                robust = 0.6745 * (value - stats.median) / stats.mad
+                if abs(robust) > self._threshold:
+                    reasons.append('robust')
+        report = {
+            'guid'      : guid,
+            'value'     : value,
+            'zscore'    : zscore,
+            'robust'    : robust,
+            'mean'      : stats.mean,
+            'stddev'    : math.sqrt(stats.var),
+            'median'    : stats.median,
+            'mad'       : stats.mad,
+        }
+
+        stats.update(value, self._alpha, self._rate, self._tolerance)
+        if self._stuck_after and stats.repeats >= self._stuck_after:
+            reasons.append('stuck')
+
+        if reasons:
+            self.anomalies += 1
+            report['reasons'] = reasons
+            report['data'] = data
+            self.anomaly.emit(report)
+        else:
+            self.o.emit(data)
@@ -1,5 +1,7 @@
-import time
-from .core import Node, HasInput, HasOutput
+import sys, threading, time
+from collections import deque
+
+from .core import Node, HasInput, HasOutput, _PollTimer
 
 # Basic nodes
 
@@ -17,24 +19,29 @@ class Echo(Node, HasInput):
     def receiveData(self, data, from_id):
         label = self.label
         if not label:
-            label = 'Echo ' + self.id.split('-')[0]
+            label = 'Echo %s' % (self.id,)
         print label,':', self._message, data
 
 
 class Source(Node, HasOutput):
     """
     Public (O): emits a static value, or the return value of a callable.
+    With `batch=True`, the value is a list that is emitted as one batch.
     """
     def __init__(self, data_to_emit, *args, **kwargs):
         super(Source, self).__init__(*args, **kwargs)
         self._data_to_emit = data_to_emit
+        self._batch = kwargs.get('batch', False)
 
     def emitData(self):
         if hasattr(self._data_to_emit, '__call__'):
             d = self._data_to_emit()
         else:
             d = self._data_to_emit
-        self.o.emit(d)
+        if self._batch:
+            self.o.emitBatch(d)
+        else:
+            self.o.emit(d)
 
 
 class Sink(Node, HasInput):
@@ -51,28 +58,53 @@ class Sink(Node, HasInput):
         self._onReceive(data)
 
 
+class BatchSink(Node, HasInput):
+    """
+    Public (I): receives batches of data, passing each batch (as a list) to a
+    callable. Data emitted one item at a time arrives as one-item batches.
+    """
+    def __init__(self, *args, **kwargs):
+        super(BatchSink, self).__init__(*args, **kwargs)
+        self._onReceive = kwargs.get('on_receive')
+        if not self._onReceive:
+            raise ValueError('on_receive must be specified')
+
+    def receiveData(self, data, from_id):
+        self._onReceive([data])
+
+    def receiveBatch(self, items, from_id):
+        self._onReceive(items)
+
+
 class Counter(Node, HasOutput):
     """
     Public (O): emits a counter value, or the return value of a callable.
     (The callable is given the current value of the counter.)
+
+    `startCounter` emits `to` values, one every `delay` seconds, on a
+    `Scheduler` (the shared one by default). It blocks until the count is
+    done unless `wait=False`; either way it returns the `Repeat`, which can
+    be cancelled to stop the count early.
     """
     def emitData(self):
-        for i in range(self._count_to):
-            if self._data_to_emit:
-                if hasattr(self._data_to_emit, '__call__'):
-                    d = self._data_to_emit(i)
-                else:
-                    d = self._data_to_emit
+        i = self._count
+        self._count += 1
+        if self._data_to_emit:
+            if hasattr(self._data_to_emit, '__call__'):
+                d = self._data_to_emit(i)
             else:
-                d = i
-            self.o.emit(d)
-            time.sleep(self._delay)
+                d = self._data_to_emit
+        else:
+            d = i
+        self.o.emit(d)
 
-    def startCounter(self, to=10, delay=1, data=None):
-        self._count_to = to
-        self._delay = delay
+    def startCounter(self, to=10, delay=1, data=None, wait=True, scheduler=None):
+        self._count = 0
         self._data_to_emit = data
-        self.emitData()
+        timer = self.emitEvery(delay, scheduler, delay=0, times=to)
+        if wait:
+            timer.wait()
+        return timer
 
 
 
@@ -93,6 +125,11 @@ class Channel(Node, HasInput, HasOutput):
             data = self._transform(data)
         self.o.emit(data)
 
+    def receiveBatch(self, items, from_id):
+        if self._transform:
+            items = list(map(self._transform, items))
+        self.o.emitBatch(items)
+
     def setTransform(self, fn):
         self._transform = fn
 
@@ -102,42 +139,107 @@ class Channel(Node, HasInput, HasOutput):
 
 
 class Buffer(Channel):
+    """
+    Public (I/O): holds the data it receives, emitting it when flushed.
+
+    With `keep`, only the most recent `keep` items are held (older ones are
+    dropped as new ones arrive) until `flush()` is called. Otherwise, the
+    buffer flushes itself when any of its triggers is reached:
+
+        flush_at    - number of items held
+        flush_bytes - total size of the items held, measured with `sizeof`
+                      (`sys.getsizeof` by default)
+        flush_age   - seconds since the oldest held item arrived (checked as
+                      data arrives, and by a timer on `scheduler`, the shared
+                      `Scheduler` by default, so a buffer is still flushed
+                      after its source goes quiet)
+
+    By default a flush emits each item separately. With `batch=True` it emits
+    all of them as one batch (see `Output.emitBatch`), for sinks that can
+    write in bulk.
+    """
     def __init__(self, *args, **kwargs):
         super(Buffer, self).__init__(*args, **kwargs)
-        self._queue = []
         self._keep = kwargs.get('keep', None)
         self._flush_at = kwargs.get('flush_at', None)
-        if self._keep is not None and self._flush_at is not None:
-            raise ValueError('Either keep or flush_at may be specified, but not both.')
-
-        if self._keep is not None:
-            if self._keep <= 0:
-                raise ValueError('keep must be an int greater than 0')
-        else:
-            self._keep = float('inf')
-
-        if self._flush_at is not None:
-            if self._flush_at <= 0:
-                raise ValueError('flush_at must be an int greater than 0')
-        else:
-            self._flush_at = float('inf')
+        self._flush_bytes = kwargs.get('flush_bytes', None)
+        self._flush_age = kwargs.get('flush_age', None)
+        self._batch = kwargs.get('batch', False)
+        self._sizeof = kwargs.get('sizeof', sys.getsizeof)
+
+        triggers = (self._flush_at, self._flush_bytes, self._flush_age)
+        if self._keep is not None and triggers != (None, None, None):
+            raise ValueError('Either keep or a flush trigger may be specified, but not both.')
+
+        if self._keep is not None and self._keep <= 0:
+            raise ValueError('keep must be an int greater than 0')
+        for name, value in zip(('flush_at', 'flush_bytes', 'flush_age'), triggers):
+            if value is not None and value <= 0:
+                raise ValueError('%s must be greater than 0' % (name,))
+
+        self._queue = deque(maxlen=self._keep)
+        self._bytes = 0
+        self._oldest = None
+        # The age timer flushes from the scheduler's thread.
+        self._lock = threading.RLock()
+        self._age_timer = _PollTimer(self.poll, kwargs.get('scheduler'))
 
     def receiveData(self, data, from_id):
         if self._transform:
             data = self._transform(data)
-        self._queue.append(data)
-
-        # `keep` and `flush_at` are exclusive, so only one of these will happen, if any.
-        if len(self._queue) >= self._flush_at:
-            self.flush()
-        if len(self._queue) > self._keep:
-            self._queue = self._queue[1:]
-
-    def flush(self):
-        for data in self._queue:
-            self.o.emit(data)
-        self._queue = []
 
+        with self._lock:
+            # With `keep`, the deque drops the oldest item itself.
+            self._queue.append(data)
+            if self._keep is not None:
+                return
 
+            if self._flush_bytes is not None:
+                self._bytes += self._sizeof(data)
+            if self._oldest is None:
+                self._oldest = time.time()
+            self._checkTriggers()
 
+    def receiveBatch(self, items, from_id):
+        if self._transform:
+            items = list(map(self._transform, items))
+        with self._lock:
+            self._queue.extend(items)
+            if self._keep is not None:
+                return
+
+            if self._flush_bytes is not None:
+                self._bytes += sum(map(self._sizeof, items))
+            if self._oldest is None:
+                self._oldest = time.time()
+            self._checkTriggers()
+
+    def _checkTriggers(self):
+        if self._flush_at is not None and len(self._queue) >= self._flush_at:
+            self.flush()
+        elif self._flush_bytes is not None and self._bytes >= self._flush_bytes:
+            self.flush()
+        else:
+            self.poll()
+
+    def poll(self):
+        with self._lock:
+            if self._flush_age is not None and self._oldest is not None:
+                remaining = self._oldest + self._flush_age - time.time()
+                if remaining <= 0:
+                    self.flush()
+                else:
+                    self._age_timer.arm(remaining)
 
+    def flush(self):
+        with self._lock:
+            self._age_timer.cancel()
+            queue = self._queue
+            self._queue = deque(maxlen=self._keep)
+            self._bytes = 0
+            self._oldest = None
+            if self._batch:
+                self.o.emitBatch(list(queue))
+            else:
+                for data in queue:
+                    self.o.emit(data)
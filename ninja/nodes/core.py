@@ -1,48 +1,192 @@
-import time
+import calendar, heapq, re, threading, time, weakref
+from collections import deque
+from datetime   import datetime
 from uuid       import uuid4
 
 from ninja.api  import Watcher
+from ninja.scheduler import sharedScheduler
+
+
+class NodeRegistry(object):
+    """
+    Hands out dense integer ids to nodes and looks nodes up by id. Nodes are
+    held weakly, so the registry does not keep them alive. The id of a node
+    that has been collected is given to the next node created (lowest first),
+    so a process that keeps building short-lived graphs does not grow the
+    registry. A node is kept alive by anything connected to it, so the ids in
+    a graph's connections always refer to the same nodes.
+    """
+    def __init__(self):
+        self._nodes = []
+        self._free = []
+        # Ids freed by weakref callbacks, which can run during garbage
+        # collection at any point (even inside `register`), so they only
+        # append here, without taking the lock.
+        self._freed = deque()
+        self._lock = threading.Lock()
+
+    def _release(self, node_id):
+        self._freed.append(node_id)
+
+    def _collectFreed(self):
+        freed = self._freed
+        while freed:
+            heapq.heappush(self._free, freed.popleft())
+
+    def register(self, node):
+        with self._lock:
+            self._collectFreed()
+            if self._free:
+                node_id = heapq.heappop(self._free)
+            else:
+                node_id = len(self._nodes)
+                self._nodes.append(None)
+            release = self._release
+            self._nodes[node_id] = weakref.ref(node, lambda ref: release(node_id))
+        return node_id
+
+    def lookup(self, node_id):
+        if 0 <= node_id < len(self._nodes):
+            ref = self._nodes[node_id]
+            if ref is not None:
+                return ref()
+        return None
+
+    def __len__(self):
+        # The number of live nodes.
+        with self._lock:
+            self._collectFreed()
+            return len(self._nodes) - len(self._free)
+
+registry = NodeRegistry()
+
+
+
+class Connections(object):
+    """
+    A dict-like view of a connector's connections, keyed by the id of the
+    node at the other end. Setting an item routes a connection through
+    another connector (as `queueEdge` does), without a reciprocal connect.
+    """
+    def __init__(self, connector):
+        self._connector = connector
+
+    def __len__(self):
+        return len(self._connector._ids)
+
+    def __iter__(self):
+        return iter(self._connector._ids)
+
+    def __contains__(self, connector_id):
+        return connector_id in self._connector._ids
+
+    def __getitem__(self, connector_id):
+        try:
+            return self._connector.targets[self._connector._ids.index(connector_id)]
+        except ValueError:
+            raise KeyError(connector_id)
+
+    def __setitem__(self, connector_id, target):
+        self._connector._setConnection(connector_id, target)
+
+    def __delitem__(self, connector_id):
+        self._connector._removeConnection(connector_id)
+
+    def get(self, connector_id, default=None):
+        if connector_id in self._connector._ids:
+            return self[connector_id]
+        return default
+
+    def keys(self):
+        return list(self._connector._ids)
+
+    def values(self):
+        return list(self._connector.targets)
+
+    def items(self):
+        return zip(self._connector._ids, self._connector.targets)
+
 
 
 class NodeConnector(object):
+    # Connections are kept as two parallel tuples, rebuilt whenever the
+    # connector is rewired, so the emit path only iterates a tuple.
 
     def __init__(self):
-        self.connected = {}
+        self._ids = ()
+        self.targets = ()
 
     @property
     def id(self):
         return self.node.id
 
+    @property
+    def connected(self):
+        return Connections(self)
+
     def setNode(self, node):
         self.node = node
 
+    def _setConnection(self, connector_id, target):
+        ids = self._ids
+        if connector_id in ids:
+            index = ids.index(connector_id)
+            self.targets = self.targets[:index] + (target,) + self.targets[index + 1:]
+        else:
+            self._ids = ids + (connector_id,)
+            self.targets = self.targets + (target,)
+
+    def _removeConnection(self, connector_id):
+        try:
+            index = self._ids.index(connector_id)
+        except ValueError:
+            raise KeyError(connector_id)
+        self._ids = self._ids[:index] + self._ids[index + 1:]
+        self.targets = self.targets[:index] + self.targets[index + 1:]
+
     def connect(self, *args, **kwargs):
         reciprocal = kwargs.get('reciprocal', True)
         for connector in args:
             if isinstance(connector, self.__class__):
                 raise Exception('Cannot connect %s to %s' % (type(connector), type(self)))
-            self.connected[connector.id] = connector
+            self._setConnection(connector.id, connector)
             if reciprocal:
                 connector.connect(self, reciprocal=False)
 
     def disconnect(self, *args, **kwargs):
         reciprocal = kwargs.get('reciprocal', True)
         for connector in args:
-            if not connector.id in self._connected:
+            if not connector.id in self._ids:
                 raise Exception('%s not connected' % (connector.id,))
-            del self.connected[connector.id]
+            self._removeConnection(connector.id)
             if reciprocal:
                 connector.disconnect(self, reciprocal=False)
 
 
 class Input(NodeConnector):
+    # The active `NodeProfiler`, if any (see `ninja.nodes.profiling`).
+    profiler = None
+
     def __call__(self, data, from_id=None):
         self.node.receiveData(data, from_id)
         self.node.last_data = data
         return self
 
+    def callBatch(self, items, from_id=None):
+        # Nodes that can take a whole batch in one call implement
+        # `receiveBatch`; the rest get one `receiveData` call per item.
+        node = self.node
+        if hasattr(node, 'receiveBatch'):
+            node.receiveBatch(items, from_id)
+        else:
+            receive = node.receiveData
+            for data in items:
+                receive(data, from_id)
+        node.last_data = items[-1]
+        return self
+
     def readAll(self):
-        return [self._connected[id]() for id in self._connected]
+        return [output() for output in self.targets]
 
 
 class Output(NodeConnector):
@@ -51,8 +195,24 @@ class Output(NodeConnector):
 
     def emit(self, data):
         self.node.last_data = data
-        for input_id, i in self.connected.items():
-            i(data, from_id=self.id)
+        from_id = self.node.id
+        for i in self.targets:
+            i(data, from_id=from_id)
+
+    def emitBatch(self, items):
+        """
+        Emit a list of items as one batch (see `Input.callBatch`).
+        """
+        if not items:
+            return
+        self.node.last_data = items[-1]
+        from_id = self.id
+        for i in self.targets:
+            if isinstance(i, Input):
+                i.callBatch(items, from_id=from_id)
+            else:
+                for data in items:
+                    i(data, from_id=from_id)
 
 
 
@@ -74,6 +234,108 @@ class HasOutput(object):
     def emitData(self):
         raise NotImplementedError('')
 
+    def emitEvery(self, period, scheduler=None, **kwargs):
+        """
+        Call `emitData` every `period` seconds on a `Scheduler` (the shared one
+        by default), and return the `Repeat`. Cancel it to stop. Keyword
+        arguments are passed to `Scheduler.repeat`.
+        """
+        scheduler = scheduler or sharedScheduler()
+        return scheduler.repeat(period, self.emitData, **kwargs)
+
+
+
+class _PollTimer(object):
+    """
+    Calls a node's `poll` once, `delay` seconds after it is armed, on a
+    `Scheduler` (the shared one by default), so time-based triggers fire even
+    when no more data arrives. Arming a timer that is already armed does
+    nothing; `cancel()` disarms it. The scheduler is only looked up the first
+    time the timer is armed. With `background=True`, `poll` runs on the
+    scheduler's workers rather than its thread, for polls that can block.
+    """
+    def __init__(self, poll, scheduler=None, background=False):
+        self._poll = poll
+        self._scheduler = scheduler
+        self._background = background
+        self._timer = None
+
+    def arm(self, delay):
+        if self._timer is None:
+            if self._scheduler is None:
+                self._scheduler = sharedScheduler()
+            self._timer = self._scheduler.callLater(max(delay, 0), self._fire)
+
+    def _fire(self):
+        self._timer = None
+        if self._background:
+            self._scheduler._runInWorker(self._poll)
+        else:
+            self._poll()
+
+    def cancel(self):
+        timer, self._timer = self._timer, None
+        if timer is not None:
+            timer.cancel()
+
+
+
+_ISO_TIME = re.compile(r'^(\d{4})-(\d\d)-(\d\d)[T ](\d\d):(\d\d):(\d\d)(?:\.(\d+))?'
+    r'(Z|[+-]\d\d:?\d\d)?$')
+
+def parseTime(text):
+    """
+    An ISO 8601 time (as `datetime.isoformat()` writes them, eg in logs from
+    `JSONLinesWriter`) in seconds since the epoch. Times without an offset
+    are taken as UTC, like the `last_read` of devices.
+    """
+    match = _ISO_TIME.match(text.strip())
+    if not match:
+        raise ValueError('Not an ISO 8601 time: %r' % (text,))
+    year, month, day, hour, minute, second, fraction, offset = match.groups()
+    seconds = calendar.timegm((int(year), int(month), int(day), int(hour), int(minute), int(second)))
+    if fraction:
+        seconds += float('0.' + fraction)
+    if offset and offset != 'Z':
+        sign = -1 if offset[0] == '-' else 1
+        digits = offset[1:].replace(':', '')
+        seconds -= sign * (int(digits[:2]) * 3600 + int(digits[2:]) * 60)
+    return seconds
+
+
+def readingTime(data):
+    """
+    The time of a reading, in seconds since the epoch: the `last_read` of
+    device node data, or the current time for anything else. `last_read` can
+    be a `datetime`, a number of seconds, or an ISO 8601 string (see
+    `parseTime`), so recorded logs keep their times when they are replayed.
+    """
+    last_read = data.get('last_read') if hasattr(data, 'get') else None
+    if last_read is None:
+        return time.time()
+    if isinstance(last_read, datetime):
+        return calendar.timegm(last_read.utctimetuple()) + last_read.microsecond / 1e6
+    if isinstance(last_read, basestring):
+        return parseTime(last_read)
+    return float(last_read)
+
+
+def readingValue(data):
+    """
+    The value of a reading, as a float: the `data` of device node data, or
+    the data itself for anything else.
+    """
+    if hasattr(data, 'get') and 'data' in data:
+        data = data['data']
+    return float(data)
+
+
+def readingGuid(data):
+    """
+    The `guid` of device node data, or None for anything else.
+    """
+    return data.get('guid') if hasattr(data, 'get') else None
+
 
 
 # Base Node object
@@ -82,13 +344,22 @@ class Node(object):
 
     def __init__(self, label=None, *args, **kwargs):
         self.label = label
-        self.id = str(uuid4())
+        self.id = registry.register(self)
+        self._uuid = None
         self.last_data = None
+        self.connectors = []
         if self.hasOutput():
             self.setupOutput()
         if self.hasInput():
             self.setupInput()
 
+    @property
+    def uuid(self):
+        # A globally unique id, for logs and debugging. Only made if asked for.
+        if self._uuid is None:
+            self._uuid = str(uuid4())
+        return self._uuid
+
     def hasOutput(self):
         return hasattr(self, 'setupOutput')
 
@@ -99,16 +370,43 @@ class Node(object):
         connector = connector_class()
         setattr(self, attr, connector)
         connector.setNode(self)
+        self.connectors.append(connector)
+
+
+
+class TickReadings(Node, HasOutput):
+    """
+    Public (O): the output of a batching `Ticker`, which emits each tick's
+    device readings from here as one batch.
+    """
+    def emitData(self):
+        pass
 
 
 
 class Ticker(object):
     """
-    
+    Drives a node graph in tick cycles: each tick, the watched device nodes'
+    devices are heartbeated (via a `Watcher`), then every watched node emits.
+
+    With `changed_only=True`, device nodes only emit when their device's data
+    changed in that heartbeat (so only their downstream subgraph runs), except
+    on every `full_refresh`-th tick, when every node emits regardless.
+
+    With `batch=True`, the device nodes do not emit individually. Instead, the
+    readings of the tick from nodes with an output are emitted as one batch
+    from `ticker.readings.o` (see `Output.emitBatch`).
     """
     def __init__(self, *args, **kwargs):
         self.counter = 0
         self._nodes = {}
+        self.plan = None
+        self._changed_only = kwargs.get('changed_only', False)
+        self._full_refresh = kwargs.get('full_refresh', None)
+        self.emitted = 0
+        self.readings = None
+        if kwargs.get('batch', False):
+            self.readings = TickReadings(label='ticker readings')
 
         self._pre_tick_fns = kwargs.get('pre_tick', [])
         self._post_tick_fns = kwargs.get('post_tick', [])
@@ -137,11 +435,37 @@ class Ticker(object):
             fn(self)
 
     def _doEmits(self):
+        full = not self._changed_only or (
+            self._full_refresh and self.counter % self._full_refresh == 0)
+        emitted = 0
+        batch = []
         for node_id in self._nodes:
-            self._nodes[node_id].emitData()
+            node = self._nodes[node_id]
+            if full or getattr(node, 'dirty', True):
+                if self.readings and hasattr(node, 'reading'):
+                    # Input-only device nodes, like LEDs, have no readings
+                    # to pass on.
+                    if not node.hasOutput():
+                        continue
+                    batch.append(node.reading())
+                else:
+                    node.emitData()
+                emitted += 1
+        if batch:
+            self.readings.o.emitBatch(batch)
+        self.emitted = emitted
         self.counter += 1
         self._doPostTick()
 
+    def compile(self):
+        # Compile the graph(s) fed by the watched nodes so each tick runs
+        # iteratively instead of through nested emit calls.
+        from .graph import compileGraph
+        if self.plan:
+            self.plan.release()
+        self.plan = compileGraph(*self._nodes.values())
+        return self.plan
+
     def start(self, period=10, duration=float('inf')):
         self._watcher.start(period=period, duration=duration, silent=True)
 
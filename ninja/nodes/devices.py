@@ -13,17 +13,25 @@ class DeviceNode(Node):
                 self.emitData()
             self.device.onHeartbeat(cb)
 
+    @property
+    def dirty(self):
+        # Whether the device's data changed in its last heartbeat.
+        return self.device.changed
+
     @property
     def device_class(self):
         raise NotImplementedError('')
 
+    def reading(self):
+        return {
+            'guid'      : self.device.guid,
+            'last_read' : self.device.last_read,
+            'data'      : self.device.data,
+        }
+
     def emitData(self):
         if self.hasOutput():
-            self.o.emit({
-                'guid'      : self.device.guid,
-                'last_read' : self.device.last_read,
-                'data'      : self.device.data,
-            })
+            self.o.emit(self.reading())
             
 
 
@@ -0,0 +1,219 @@
+from .core      import readingGuid
+from .windows   import _Window
+
+
+def _first(point):
+    return point[0]
+
+def _second(point):
+    return point[1]
+
+
+def lttb(points, threshold, x=None, y=None):
+    """
+    Downsample `points` to `threshold` points with Largest-Triangle-Three-
+    Buckets, which keeps the points that matter most to the shape of a line
+    chart: the first and last points, and from each bucket in between, the
+    point making the largest triangle with the point kept before it and the
+    average of the next bucket.
+
+    Points are `(x, y)` pairs unless `x` and `y` callables are given, eg
+    `x=readingTime, y=readingValue` for recorded readings. The points kept
+    are returned as they were given, in order.
+    """
+    x = x or _first
+    y = y or _second
+    points = list(points)
+    n = len(points)
+    if threshold < 3:
+        raise ValueError('threshold must be an int of at least 3')
+    if n <= threshold:
+        return points
+
+    xs = [float(x(p)) for p in points]
+    ys = [float(y(p)) for p in points]
+    every = (n - 2) / float(threshold - 2)
+    sampled = [points[0]]
+    a = 0
+    for i in range(threshold - 2):
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, n)
+        count = avg_end - avg_start
+        avg_x = sum(xs[avg_start:avg_end]) / count
+        avg_y = sum(ys[avg_start:avg_end]) / count
+
+        ax, ay = xs[a], ys[a]
+        best, best_area = None, -1.0
+        for j in range(int(i * every) + 1, int((i + 1) * every) + 1):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        sampled.append(points[best])
+        a = best
+    sampled.append(points[-1])
+    return sampled
+
+
+def minMaxBuckets(points, buckets, y=None):
+    """
+    Downsample `points` by splitting them into `buckets` equal runs and
+    keeping the lowest and highest point of each, in order. Unlike `lttb`, no
+    peak is ever dropped, at the cost of up to two points per bucket.
+
+    Points are `(x, y)` pairs unless a `y` callable is given, and are kept in
+    the order given.
+    """
+    y = y or _second
+    points = list(points)
+    n = len(points)
+    if buckets < 1:
+        raise ValueError('buckets must be an int greater than 0')
+    if n <= buckets * 2:
+        return points
+
+    sampled = []
+    every = n / float(buckets)
+    for i in range(buckets):
+        start, end = int(i * every), int((i + 1) * every)
+        low = high = start
+        low_y = high_y = float(y(points[start]))
+        for j in range(start + 1, end):
+            value = float(y(points[j]))
+            if value < low_y:
+                low, low_y = j, value
+            elif value > high_y:
+                high, high_y = j, value
+        for j in sorted(set((low, high))):
+            sampled.append(points[j])
+    return sampled
+
+
+
+class Downsample(_Window):
+    """
+    Public (I/O): passes on a bounded number of the items it receives, for
+    charts that cannot draw every reading. Each window of `size` items or
+    `duration` seconds is reduced to about `points` items, as they stream
+    through, so a window never has to be held in memory.
+
+    With `method='lttb'` (the default) items are picked as in `lttb`: each
+    bucket of `size / points` items (or `duration / points` seconds) is
+    emitted as soon as the next bucket is complete, as the one item that
+    makes the largest triangle with the previous item emitted and the
+    average of the next bucket. With `method='minmax'` each bucket emits its
+    lowest and highest item, so buckets are twice as wide.
+
+    Each device (`group(data)`, the `guid` of device node data by default) is
+    downsampled separately. The value of an item is `value(data)` (the
+    reading's `data`, as a float, by default), and its time is
+    `timestamp(data)` (the reading's `last_read` by default). Items are
+    emitted unchanged. `flush()` emits what is still pending, eg at the end of
+    a replayed log, and starts every device afresh.
+    """
+    LTTB    = 'lttb'
+    MINMAX  = 'minmax'
+
+    def __init__(self, *args, **kwargs):
+        super(Downsample, self).__init__(*args, **kwargs)
+        self._method = kwargs.get('method', self.LTTB)
+        if self._method not in (self.LTTB, self.MINMAX):
+            raise ValueError('method must be one of lttb or minmax')
+        self._points = kwargs.get('points', None)
+        if not self._points or self._points < 2:
+            raise ValueError('points must be an int of at least 2')
+        self._group = kwargs.get('group', readingGuid)
+
+        buckets = self._points if self._method == self.LTTB else self._points // 2
+        self._width = float(self._size or self._duration) / buckets
+        self._state = {}
+
+    def _bucket(self, state, now):
+        if self._size is not None:
+            count = state['count']
+            state['count'] += 1
+            return int(count / self._width)
+        return int(now // self._width)
+
+    def receiveData(self, data, from_id):
+        group = self._group(data)
+        now = self._now(data)
+        point = (now, self._value(data), data)
+        state = self._state.get(group)
+        if state is None:
+            state = self._state[group] = self._newState()
+            if self._method == self.LTTB:
+                # The first item of a stream is always kept.
+                state['a'] = point
+                self.o.emit(data)
+                return
+        bucket = self._bucket(state, now)
+        if self._method == self.LTTB:
+            self._addLTTB(state, bucket, point)
+        else:
+            self._addMinMax(state, bucket, point)
+
+    def _newState(self):
+        if self._method == self.LTTB:
+            return { 'count': 0, 'a': None, 'cur': [], 'cur_id': None, 'next': [], 'next_id': None }
+        return { 'count': 0, 'id': None, 'low': None, 'high': None }
+
+    def _addLTTB(self, state, bucket, point):
+        if state['cur_id'] is None or bucket <= state['cur_id']:
+            state['cur_id'] = bucket if state['cur_id'] is None else state['cur_id']
+            state['cur'].append(point)
+        elif state['next_id'] is None or bucket <= state['next_id']:
+            state['next_id'] = bucket if state['next_id'] is None else state['next_id']
+            state['next'].append(point)
+        else:
+            self._closeLTTB(state)
+            state['next'] = [point]
+            state['next_id'] = bucket
+
+    def _closeLTTB(self, state):
+        # Pick from the current bucket against the average of the next one,
+        # which then becomes the current bucket.
+        following = state['next']
+        avg_x = sum(p[0] for p in following) / len(following)
+        avg_y = sum(p[1] for p in following) / len(following)
+        ax, ay = state['a'][0], state['a'][1]
+        best, best_area = None, -1.0
+        for p in state['cur']:
+            area = abs((ax - avg_x) * (p[1] - ay) - (ax - p[0]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = p, area
+        state['a'] = best
+        state['cur'] = following
+        state['cur_id'] = state['next_id']
+        self.o.emit(best[2])
+
+    def _addMinMax(self, state, bucket, point):
+        if state['id'] is not None and bucket > state['id']:
+            self._closeMinMax(state)
+        if state['id'] is None:
+            state['id'] = bucket
+            state['low'] = state['high'] = point
+        elif point[1] < state['low'][1]:
+            state['low'] = point
+        elif point[1] > state['high'][1]:
+            state['high'] = point
+
+    def _closeMinMax(self, state):
+        low, high = state['low'], state['high']
+        state['id'] = state['low'] = state['high'] = None
+        if low is high:
+            self.o.emit(low[2])
+        else:
+            for point in sorted((low, high), key=_first):
+                self.o.emit(point[2])
+
+    def flush(self):
+        states, self._state = self._state, {}
+        for state in states.values():
+            if self._method == self.MINMAX:
+                if state['id'] is not None:
+                    self._closeMinMax(state)
+            elif state['next']:
+                self._closeLTTB(state)
+                self.o.emit(state['cur'][-1][2])
+            elif state['cur']:
+                self.o.emit(state['cur'][-1][2])
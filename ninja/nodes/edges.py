@@ -0,0 +1,161 @@
+import threading, time
+from collections import deque
+
+
+class QueuedEdge(object):
+    """
+    A bounded queue that stands in for an `Input` on a single connection, with
+    a worker thread delivering the queued data to the real input. The emitting
+    side only pays for an append, so a slow sink (a `CSVWriter`, an
+    `HTTPReader` chain) no longer stalls the node that feeds it. Data is
+    delivered in the order it was emitted.
+
+    When the queue is full, `overflow` decides what happens to new data:
+
+        'block'     - the emitter waits for space (the default)
+        'drop'      - the new data is discarded
+        'coalesce'  - the newest queued item is replaced by the new data, or by
+                      `merge(queued, new)` if a merge callable is given
+
+    Created with `queueEdge`; `close()` restores the plain connection. Data
+    that arrives once the edge is closing (including data an emitter was
+    blocked on) is counted in `dropped`, not queued.
+    """
+
+    BLOCK       = 'block'
+    DROP        = 'drop'
+    COALESCE    = 'coalesce'
+
+    def __init__(self, output, input, maxsize=100, overflow='block', merge=None):
+        if maxsize <= 0:
+            raise ValueError('maxsize must be an int greater than 0')
+        if overflow not in (self.BLOCK, self.DROP, self.COALESCE):
+            raise ValueError('overflow must be one of block, drop, or coalesce')
+
+        self.output     = output
+        self.input      = input
+        self.node       = input.node
+        self.maxsize    = maxsize
+        self.overflow   = overflow
+        self._merge     = merge
+
+        self._queue     = deque()
+        self._cond      = threading.Condition()
+        self._closing   = False
+
+        self.received   = 0
+        self.delivered  = 0
+        self.dropped    = 0
+        self.coalesced  = 0
+        self.errors     = 0
+        self.last_error = None
+        self.max_depth  = 0
+        self._wait_total = 0.0
+        self._wait_max  = 0.0
+
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def id(self):
+        return self.input.id
+
+    @property
+    def depth(self):
+        return len(self._queue)
+
+    def __call__(self, data, from_id=None):
+        cond = self._cond
+        with cond:
+            self.received += 1
+            queue = self._queue
+            if self._closing:
+                # The worker may already have exited.
+                self.dropped += 1
+                return self
+            if len(queue) >= self.maxsize:
+                if self.overflow == self.DROP:
+                    self.dropped += 1
+                    return self
+                elif self.overflow == self.COALESCE:
+                    queued_data, queued_from, queued_at = queue[-1]
+                    if self._merge:
+                        data = self._merge(queued_data, data)
+                    queue[-1] = (data, from_id, queued_at)
+                    self.coalesced += 1
+                    return self
+                while len(queue) >= self.maxsize and not self._closing:
+                    cond.wait()
+                if self._closing:
+                    self.dropped += 1
+                    return self
+            queue.append((data, from_id, time.time()))
+            if len(queue) > self.max_depth:
+                self.max_depth = len(queue)
+            cond.notify_all()
+        return self
+
+    def _run(self):
+        cond = self._cond
+        queue = self._queue
+        while True:
+            with cond:
+                while not queue and not self._closing:
+                    cond.wait()
+                if not queue:
+                    return
+                data, from_id, queued_at = queue.popleft()
+                cond.notify_all()
+
+            wait = time.time() - queued_at
+            self._wait_total += wait
+            if wait > self._wait_max:
+                self._wait_max = wait
+            try:
+                self.input(data, from_id=from_id)
+            except Exception as e:
+                self.errors += 1
+                self.last_error = e
+            self.delivered += 1
+
+    def stats(self):
+        delivered = self.delivered
+        return {
+            'depth'         : self.depth,
+            'max_depth'     : self.max_depth,
+            'received'      : self.received,
+            'delivered'     : delivered,
+            'dropped'       : self.dropped,
+            'coalesced'     : self.coalesced,
+            'errors'        : self.errors,
+            'mean_latency'  : (self._wait_total / delivered) if delivered else 0.0,
+            'max_latency'   : self._wait_max,
+        }
+
+    def close(self, wait=True):
+        """
+        Deliver whatever is still queued, stop the worker, and put the plain
+        input back on the output.
+        """
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        if wait:
+            self._thread.join()
+        if self.output.connected.get(self.input.id) is self:
+            self.output.connected[self.input.id] = self.input
+
+
+
+def queueEdge(output, input, **kwargs):
+    """
+    Put a `QueuedEdge` on the connection from `output` to `input`, connecting
+    them first if needed, and return it. Keyword arguments are passed to
+    `QueuedEdge`. (Compile any `ExecutionPlan` after queueing its edges.)
+    """
+    if input.id not in output.connected:
+        output.connect(input)
+    edge = QueuedEdge(output, input, **kwargs)
+    output.connected[input.id] = edge
+    return edge
@@ -1,16 +1,110 @@
-from .core import Node, HasInput, HasOutput
+from .core import Node, HasInput, HasOutput, _PollTimer
 
 class FileWriter(Node, HasInput):
     pass
 
 class FileReader(Node, HasOutput):
-    pass
-    # emitData() - reads and emits
-    # .o() - reads and returns
+    """
+    Public (O): replays records from a file. Subclasses implement `records()`
+    as a generator, so files are parsed incrementally and never loaded whole.
+
+    `emitData()` emits the next record (returning False once the file is
+    exhausted, after which it starts over). `replay()` emits every record,
+    paced by `speed`: 1 replays in real time, N replays N times faster, and
+    None (the default) replays as fast as possible. Pacing follows
+    `timestamp(record)`, in seconds; without a `timestamp` callable, records
+    are always replayed as fast as possible.
+    """
+    def __init__(self, *args, **kwargs):
+        super(FileReader, self).__init__(*args, **kwargs)
+        self._file = kwargs.get('file', None)
+        self._speed = kwargs.get('speed', None)
+        self._timestamp = kwargs.get('timestamp', None)
+        self._parse = kwargs.get('parse', None)
+        if self._speed is not None and self._speed <= 0:
+            raise ValueError('speed must be greater than 0')
+        self._iterator = None
+
+    def records(self):
+        raise NotImplementedError('')
+
+    def _parsed(self):
+        if self._parse:
+            return (self._parse(record) for record in self.records())
+        return self.records()
+
+    def emitData(self):
+        if self._iterator is None:
+            self._iterator = self._parsed()
+        try:
+            record = next(self._iterator)
+        except StopIteration:
+            self._iterator = None
+            return False
+        self.o.emit(record)
+        return True
+
+    def rewind(self):
+        self._iterator = None
+
+    def replay(self, limit=None):
+        """
+        Emit every record (or the first `limit`), returning how many were
+        emitted.
+        """
+        paced = self._speed is not None and self._timestamp is not None
+        emit = self.o.emit
+        count = 0
+        for record in self._parsed():
+            if limit is not None and count >= limit:
+                break
+            if paced:
+                timestamp = self._timestamp(record)
+                if count == 0:
+                    first, started = timestamp, time.time()
+                else:
+                    delay = started + (timestamp - first) / self._speed - time.time()
+                    if delay > 0:
+                        time.sleep(delay)
+            emit(record)
+            count += 1
+        return count
+
+
+import atexit, csv, gzip, os, shutil, threading, time, weakref
+from datetime import datetime
+
+# Writers that hold open files, so they can be closed cleanly on exit.
+_open_writers = weakref.WeakSet()
+
+@atexit.register
+def closeWriters():
+    for writer in list(_open_writers):
+        writer.close()
 
 
-import csv
 class CSVWriter(Node, HasInput):
+    """
+    Public (I): writes each row of data it receives to a CSV file.
+
+    The file is kept open, and rows are written to a buffered handle that is
+    flushed every `batch_size` rows (1 by default), or once `flush_interval`
+    seconds have passed since the last flush (checked as rows arrive, and by
+    a timer on `scheduler`, the shared `Scheduler` by default, so rows are
+    not held back when no more arrive).
+
+    `fsync` controls when flushed rows are forced to disk: 'none' (the
+    default, leaving it to the OS), 'batch' (after every flush), or 'interval'
+    (at most every `fsync_interval` seconds).
+
+    With `rotate_bytes` and/or `rotate_interval` (seconds), the file is moved
+    aside to `<file>.<timestamp>` once it grows past that size or age, and a
+    new file is started (with the headers, if any). `compress=True` gzips the
+    rotated files.
+
+    `close()` flushes and closes the file; open writers are also closed when
+    the interpreter exits.
+    """
     def __init__(self, *args, **kwargs):
         super(CSVWriter, self).__init__(*args, **kwargs)
         self._file = kwargs.get('file', None)
@@ -18,30 +112,199 @@ class CSVWriter(Node, HasInput):
             raise ValueError('file not specified')
 
         self._write_mode = kwargs.get('mode', 'a')
+        self._batch_size = kwargs.get('batch_size', 1)
+        self._flush_interval = kwargs.get('flush_interval', None)
+        self._fsync = kwargs.get('fsync', 'none')
+        self._fsync_interval = kwargs.get('fsync_interval', 1)
+        self._rotate_bytes = kwargs.get('rotate_bytes', None)
+        self._rotate_interval = kwargs.get('rotate_interval', None)
+        self._compress = kwargs.get('compress', False)
+        if self._fsync not in ('none', 'batch', 'interval'):
+            raise ValueError('fsync must be one of none, batch, or interval')
+        if self._batch_size <= 0:
+            raise ValueError('batch_size must be an int greater than 0')
 
+        self._handle = None
+        self._pending = 0
         self._headers = kwargs.get('headers', None)
-        if self._headers:
-            self._writeToFile(self._headers, mode='w')
+        # The flush timer writes from the scheduler's thread.
+        self._lock = threading.RLock()
+        self._flush_timer = _PollTimer(self.poll, kwargs.get('scheduler'))
+        self._open(mode='w' if self._headers else self._write_mode)
 
-    def _writeToFile(self, data, mode=None):
-        if not mode:
-            mode = self._write_mode
-        with open(self._file, mode) as f:
-            writer = csv.writer(f)
-            writer.writerow(data)
+    def _open(self, mode=None):
+        mode = mode or self._write_mode
+        self._handle = open(self._file, mode, 65536)
+        self._writer = csv.writer(self._handle)
+        self._opened_at = time.time()
+        self._last_flush = self._last_fsync = self._opened_at
+        _open_writers.add(self)
+        if self._headers and 'w' in mode:
+            self._writer.writerow(self._headers)
+            self._pending += 1
 
     def receiveData(self, data, from_id):
-        self._writeToFile(data)
+        with self._lock:
+            if self._handle is None:
+                self._open()
+            self._writer.writerow(data)
+            self._pending += 1
+            if self._pending >= self._batch_size:
+                self.flush()
+            else:
+                self.poll()
+
+    def receiveBatch(self, items, from_id):
+        with self._lock:
+            if self._handle is None:
+                self._open()
+            self._writer.writerows(items)
+            self._pending += len(items)
+            if self._pending >= self._batch_size:
+                self.flush()
+            else:
+                self.poll()
+
+    def poll(self):
+        with self._lock:
+            if self._handle is None:
+                return
+            if self._flush_interval is not None and self._pending:
+                remaining = self._last_flush + self._flush_interval - time.time()
+                if remaining <= 0:
+                    self.flush()
+                else:
+                    self._flush_timer.arm(remaining)
+
+    def flush(self):
+        with self._lock:
+            self._flush_timer.cancel()
+            handle = self._handle
+            if handle is None:
+                return
+            handle.flush()
+            self._pending = 0
+            now = self._last_flush = time.time()
+
+            if self._fsync == 'batch' or (
+                    self._fsync == 'interval' and now - self._last_fsync >= self._fsync_interval):
+                os.fsync(handle.fileno())
+                self._last_fsync = now
+
+            if self._rotate_bytes is not None and handle.tell() >= self._rotate_bytes:
+                self.rotate()
+            elif self._rotate_interval is not None and now - self._opened_at >= self._rotate_interval:
+                self.rotate()
+
+    def rotate(self):
+        """
+        Move the current file aside (compressing it if `compress` is set) and
+        start a new one. Returns the rotated file's path.
+        """
+        with self._lock:
+            self.close()
+            rotated = '%s.%s' % (self._file, datetime.now().strftime('%Y%m%d-%H%M%S-%f'))
+            while os.path.exists(rotated) or os.path.exists(rotated + '.gz'):
+                rotated = '%s.%s' % (self._file, datetime.now().strftime('%Y%m%d-%H%M%S-%f'))
+            os.rename(self._file, rotated)
+            if self._compress:
+                with open(rotated, 'rb') as f_in:
+                    with gzip.open(rotated + '.gz', 'wb') as f_out:
+                        shutil.copyfileobj(f_in, f_out)
+                os.remove(rotated)
+                rotated += '.gz'
+            self._open(mode='w')
+            return rotated
+
+    def close(self):
+        with self._lock:
+            self._flush_timer.cancel()
+            handle = self._handle
+            if handle is None:
+                return
+            handle.flush()
+            if self._fsync != 'none':
+                os.fsync(handle.fileno())
+            handle.close()
+            self._handle = None
+            self._pending = 0
+        _open_writers.discard(self)
+
+
+import json, stat, tempfile
+from decimal        import Decimal
+from ninja.units    import Temperature, Color
+
+class NinjaJSONEncoder(json.JSONEncoder):
+    """
+    JSON encoder that also handles the types found in device data: datetimes
+    (as ISO 8601 strings), Temperatures (as Kelvin), Decimals, and Colors (as
+    hex strings).
+    """
+    def default(self, obj):
+        if isinstance(obj, datetime):
+            return obj.isoformat()
+        if isinstance(obj, (Temperature, Decimal)):
+            return float(obj)
+        if isinstance(obj, Color):
+            return obj.hex
+        return super(NinjaJSONEncoder, self).default(obj)
+
+_encoder = NinjaJSONEncoder(separators=(',', ':'))
+
+
+def writeFileAtomic(file_name, content, fsync=True):
+    """
+    Write `content` to a temporary file in the same directory, then rename it
+    over `file_name`, so readers never see a partially written file. The file
+    keeps its permissions (or gets the usual ones for a new file). With
+    `fsync=False` the content is not forced to disk before the rename.
+    """
+    directory = os.path.dirname(os.path.abspath(file_name))
+    try:
+        mode = stat.S_IMODE(os.stat(file_name).st_mode)
+    except OSError:
+        umask = os.umask(0)
+        os.umask(umask)
+        mode = 0666 & ~umask
+    fd, temp_name = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+            f.flush()
+            if fsync:
+                os.fsync(f.fileno())
+        os.chmod(temp_name, mode)
+        os.rename(temp_name, file_name)
+    except:
+        os.remove(temp_name)
+        raise
+
+
+class CSVReader(FileReader):
+    """
+    Public (O): replays the rows of a CSV file, as lists, or as dicts keyed
+    by the header row with `headers=True`.
+    """
+    def __init__(self, *args, **kwargs):
+        super(CSVReader, self).__init__(*args, **kwargs)
+        self._headers = kwargs.get('headers', False)
+
+    def records(self):
+        with open(self._file) as f:
+            reader = csv.DictReader(f) if self._headers else csv.reader(f)
+            for row in reader:
+                yield row
 
 
 # {
 #     'file': 'filename.json',
 #     'data': {}
 # }
-import json
 class JSONWriter(Node, HasInput):
     def _writeToFile(self, file_name, data_to_write):
-        file(file_name, 'w').write(json.dumps(data_to_write))
+        # Rewritten for every item, so not forced to disk each time.
+        writeFileAtomic(file_name, _encoder.encode(data_to_write), fsync=False)
 
     def receiveData(self, data, from_id):
         file_name       = data.get('file')
@@ -50,5 +313,415 @@ class JSONWriter(Node, HasInput):
             raise ValueError('file not specified')
         self._writeToFile(file_name, data_to_write)
 
-class JSONReader(Node, HasOutput):
-    pass
+
+class JSONLinesWriter(Node, HasInput):
+    """
+    Public (I): appends each item it receives to a JSON Lines file, one record
+    per line.
+
+    Records are encoded as they arrive and committed to the file in groups:
+    every `commit_every` records (1 by default), or once `commit_interval`
+    seconds have passed since the last commit (checked as records arrive, and
+    by a timer on `scheduler`, the shared `Scheduler` by default, so records
+    are not held back when no more arrive). With `fsync=True`, each commit is
+    forced to disk. Each commit is a single write, so a crash loses at most
+    the records of one uncommitted group.
+
+    `snapshot(file_name)` atomically writes everything logged so far to
+    `file_name` as a single JSON array.
+    """
+    def __init__(self, *args, **kwargs):
+        super(JSONLinesWriter, self).__init__(*args, **kwargs)
+        self._file = kwargs.get('file', None)
+        if not self._file:
+            raise ValueError('file not specified')
+        self._commit_every = kwargs.get('commit_every', 1)
+        self._commit_interval = kwargs.get('commit_interval', None)
+        self._fsync = kwargs.get('fsync', False)
+        if self._commit_every <= 0:
+            raise ValueError('commit_every must be an int greater than 0')
+
+        self._encode = kwargs.get('encoder', _encoder).encode
+        self._lines = []
+        self._handle = None
+        self._last_commit = time.time()
+        # The commit timer writes from the scheduler's thread.
+        self._lock = threading.RLock()
+        self._commit_timer = _PollTimer(self.poll, kwargs.get('scheduler'))
+        # Registered from the start, so records still waiting for a commit
+        # are written when the interpreter exits.
+        _open_writers.add(self)
+
+    def receiveData(self, data, from_id):
+        line = self._encode(data) + '\n'
+        with self._lock:
+            self._lines.append(line)
+            if len(self._lines) >= self._commit_every:
+                self.commit()
+            else:
+                self.poll()
+
+    def receiveBatch(self, items, from_id):
+        encode = self._encode
+        lines = [encode(data) + '\n' for data in items]
+        with self._lock:
+            self._lines.extend(lines)
+            if len(self._lines) >= self._commit_every:
+                self.commit()
+            else:
+                self.poll()
+
+    def poll(self):
+        with self._lock:
+            if self._commit_interval is not None and self._lines:
+                remaining = self._last_commit + self._commit_interval - time.time()
+                if remaining <= 0:
+                    self.commit()
+                else:
+                    self._commit_timer.arm(remaining)
+
+    def commit(self):
+        with self._lock:
+            self._commit_timer.cancel()
+            self._last_commit = time.time()
+            if not self._lines:
+                return
+            if self._handle is None:
+                self._handle = open(self._file, 'a', 65536)
+                _open_writers.add(self)
+            self._handle.write(''.join(self._lines))
+            self._handle.flush()
+            if self._fsync:
+                os.fsync(self._handle.fileno())
+            self._lines = []
+
+    def snapshot(self, file_name):
+        with self._lock:
+            self.commit()
+            with open(self._file) as f:
+                records = ','.join(line.rstrip('\n') for line in f if line.strip())
+        writeFileAtomic(file_name, '[' + records + ']')
+
+    def close(self):
+        with self._lock:
+            self.commit()
+            if self._handle is not None:
+                self._handle.close()
+                self._handle = None
+        _open_writers.discard(self)
+
+
+class JSONReader(FileReader):
+    """
+    Public (O): replays the records of a JSON Lines file, like those written
+    by `JSONLinesWriter`.
+    """
+    def records(self):
+        decode = json.JSONDecoder().decode
+        with open(self._file) as f:
+            for line in f:
+                if line.strip():
+                    yield decode(line)
+
+
+
+import mmap, struct, sys
+from array  import array
+from bisect import bisect_left, bisect_right
+from .core  import readingTime
+
+try:
+    from urllib import quote, unquote
+except ImportError:
+    from urllib.parse import quote, unquote
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+_RECORD = struct.Struct('<d')
+_INDEX_ENTRY = struct.Struct('<dq')
+
+def _seriesPath(directory, guid, extension):
+    # Guids are %-escaped, so every guid gets its own files and the name
+    # can be turned back into the guid. Device guids need no escaping.
+    return os.path.join(directory, quote(guid, safe='') + extension)
+
+def _closeMap(buf):
+    """
+    Close a map from `TimeSeriesReader`, unless views from `_view` still
+    use it; it is then unmapped when the last of them is freed.
+    """
+    if numpy is not None and sys.version_info[0] < 3:
+        # Python 2's mmap cannot tell whether numpy still has a view of it.
+        return
+    try:
+        buf.close()
+    except BufferError:
+        pass
+
+def _view(buf, start, stop):
+    """
+    The float64 records `start` to `stop` of `buf`. This is a zero-copy view
+    when numpy (or Python 3's `memoryview.cast`) is available, and an array
+    copy of just that range otherwise.
+    """
+    if numpy is not None:
+        return numpy.frombuffer(buf, dtype='<f8', count=stop - start, offset=start * 8)
+    if hasattr(memoryview, 'cast'):
+        return memoryview(buf)[start * 8:stop * 8].cast('d')
+    values = array('d')
+    values.fromstring(buf[start * 8:stop * 8])
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+class TimeSeriesStore(Node, HasInput):
+    """
+    Public (I): appends the readings it receives to per-device column files
+    in `directory`, for fast time range queries with `TimeSeriesReader`.
+
+    Each device gets three files named after its guid (with characters
+    other than letters, digits, `_`, `.` and `-` %-escaped): `.ts` holds the
+    timestamps and `.val` the values, as fixed-width little-endian float64s,
+    and `.idx` is a sparse index holding the timestamp of every
+    `index_every`-th record. The guid, time, and value of a reading are taken
+    from `guid(data)`, `timestamp(data)`, and `value(data)`, which default to
+    the fields of device node data.
+
+    Readings for a device must arrive in time order; older ones are counted
+    in `out_of_order` and dropped. Files are flushed every `flush_every`
+    readings per device, and on `flush()` and `close()`. On startup, a
+    partially written trailing record (from a crash) is trimmed away.
+    """
+    def __init__(self, *args, **kwargs):
+        super(TimeSeriesStore, self).__init__(*args, **kwargs)
+        self._directory = kwargs.get('directory', None)
+        if not self._directory:
+            raise ValueError('directory not specified')
+        if not os.path.isdir(self._directory):
+            os.makedirs(self._directory)
+
+        self._guid = kwargs.get('guid', lambda data: data['guid'])
+        self._timestamp = kwargs.get('timestamp', readingTime)
+        self._value = kwargs.get('value', lambda data: float(data['data']))
+        self._index_every = kwargs.get('index_every', 1024)
+        self._flush_every = kwargs.get('flush_every', 64)
+        self._series = {}
+        self.out_of_order = 0
+
+    def _open(self, guid):
+        paths = [_seriesPath(self._directory, guid, ext) for ext in ('.ts', '.val', '.idx')]
+        sizes = [os.path.getsize(p) if os.path.exists(p) else 0 for p in paths]
+        count = min(sizes[0], sizes[1]) // 8
+        last = None
+        if count:
+            with open(paths[0], 'rb') as f:
+                f.seek((count - 1) * 8)
+                last = _RECORD.unpack(f.read(8))[0]
+
+        handles = []
+        for path, size, keep in zip(paths, sizes, (count * 8, count * 8, None)):
+            handle = open(path, 'ab')
+            if keep is None:
+                keep = (size // _INDEX_ENTRY.size) * _INDEX_ENTRY.size
+            if size != keep:
+                handle.truncate(keep)
+            handles.append(handle)
+
+        series = self._series[guid] = {
+            'handles'   : handles,
+            'count'     : count,
+            'last'      : last,
+            'unflushed' : 0,
+        }
+        _open_writers.add(self)
+        return series
+
+    def receiveData(self, data, from_id):
+        self.append(self._guid(data), self._timestamp(data), self._value(data))
+
+    def append(self, guid, timestamp, value):
+        series = self._series.get(guid) or self._open(guid)
+        if series['last'] is not None and timestamp < series['last']:
+            self.out_of_order += 1
+            return
+        ts_file, val_file, idx_file = series['handles']
+        if series['count'] % self._index_every == 0:
+            idx_file.write(_INDEX_ENTRY.pack(timestamp, series['count']))
+        ts_file.write(_RECORD.pack(timestamp))
+        val_file.write(_RECORD.pack(value))
+        series['count'] += 1
+        series['last'] = timestamp
+        series['unflushed'] += 1
+        if series['unflushed'] >= self._flush_every:
+            self._flushSeries(series)
+
+    def _flushSeries(self, series):
+        for handle in series['handles']:
+            handle.flush()
+        series['unflushed'] = 0
+
+    def flush(self):
+        for series in self._series.values():
+            self._flushSeries(series)
+
+    def close(self):
+        for series in self._series.values():
+            for handle in series['handles']:
+                handle.close()
+        self._series = {}
+        _open_writers.discard(self)
+
+    def reader(self):
+        self.flush()
+        return TimeSeriesReader(self._directory)
+
+
+
+class TimeSeriesReader(object):
+    """
+    Reads the column files written by a `TimeSeriesStore`. The files are
+    memory-mapped, and `read` finds a time range by searching the sparse
+    index and then one index block of the timestamps, so a query touches only
+    the pages it returns.
+    """
+    def __init__(self, directory):
+        self._directory = directory
+        self._series = {}
+
+    def _load(self, guid):
+        ts_path = _seriesPath(self._directory, guid, '.ts')
+        val_path = _seriesPath(self._directory, guid, '.val')
+        if not os.path.exists(ts_path):
+            return None
+        count = min(os.path.getsize(ts_path), os.path.getsize(val_path)) // 8
+        series = self._series.get(guid)
+        if series and series['count'] == count:
+            return series
+        if series:
+            # The files have grown; views of the old maps stay valid.
+            del self._series[guid]
+            _closeMap(series['timestamps'])
+            _closeMap(series['values'])
+        if not count:
+            return None
+
+        maps = []
+        for path in (ts_path, val_path):
+            with open(path, 'rb') as f:
+                maps.append(mmap.mmap(f.fileno(), count * 8, access=mmap.ACCESS_READ))
+
+        index_times, index_records = [], []
+        idx_path = _seriesPath(self._directory, guid, '.idx')
+        if os.path.exists(idx_path):
+            with open(idx_path, 'rb') as f:
+                content = f.read()
+            for offset in range(0, len(content) - _INDEX_ENTRY.size + 1, _INDEX_ENTRY.size):
+                timestamp, record = _INDEX_ENTRY.unpack_from(content, offset)
+                if record < count:
+                    index_times.append(timestamp)
+                    index_records.append(record)
+
+        series = self._series[guid] = {
+            'count'         : count,
+            'timestamps'    : maps[0],
+            'values'        : maps[1],
+            'index_times'   : index_times,
+            'index_records' : index_records,
+        }
+        return series
+
+    def _search(self, series, timestamp, right):
+        # Narrow to one index block, then binary search within it.
+        times, records = series['index_times'], series['index_records']
+        position = (bisect_right if right else bisect_left)(times, timestamp)
+        low = records[position - 1] if position > 0 else 0
+        high = records[position] if position < len(records) else series['count']
+        buf = series['timestamps']
+        while low < high:
+            middle = (low + high) // 2
+            value = _RECORD.unpack_from(buf, middle * 8)[0]
+            if value < timestamp or (right and value == timestamp):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def guids(self):
+        return sorted(unquote(name[:-3]) for name in os.listdir(self._directory) if name.endswith('.ts'))
+
+    def count(self, guid):
+        series = self._load(guid)
+        return series['count'] if series else 0
+
+    def read(self, guid, start=None, end=None):
+        """
+        Return `(timestamps, values)` for the readings of `guid` with
+        `start <= timestamp <= end` (either bound may be omitted).
+        """
+        series = self._load(guid)
+        if not series:
+            return _view(b'', 0, 0), _view(b'', 0, 0)
+        first = self._search(series, start, False) if start is not None else 0
+        last = self._search(series, end, True) if end is not None else series['count']
+        last = max(first, last)
+        return (
+            _view(series['timestamps'], first, last),
+            _view(series['values'], first, last),
+        )
+
+    def close(self):
+        for series in self._series.values():
+            _closeMap(series['timestamps'])
+            _closeMap(series['values'])
+        self._series = {}
+
+
+
+import heapq
+
+def _readAt(path, offset, size):
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        return f.read(size)
+
+class SeriesReader(FileReader):
+    """
+    Public (O): replays readings from a `TimeSeriesStore` directory, in time
+    order across the devices in `guids` (every device by default), as
+    device-node-shaped dicts with `guid`, `last_read`, and `data` fields.
+    Readings are read in blocks of `chunk` records, opening the files only
+    while a block is read, so merging any number of devices holds no files
+    open between blocks.
+    """
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('timestamp', readingTime)
+        super(SeriesReader, self).__init__(*args, **kwargs)
+        self._directory = kwargs.get('directory', None)
+        if not self._directory:
+            raise ValueError('directory not specified')
+        self._guids = kwargs.get('guids', None)
+        self._chunk = kwargs.get('chunk', 4096)
+
+    def _readings(self, guid):
+        paths = [_seriesPath(self._directory, guid, ext) for ext in ('.ts', '.val')]
+        count = min(os.path.getsize(p) for p in paths) // 8
+        start = 0
+        while start < count:
+            n = min(count - start, self._chunk)
+            timestamps, values = [_view(_readAt(path, start * 8, n * 8), 0, n) for path in paths]
+            for timestamp, value in zip(timestamps, values):
+                yield timestamp, guid, value
+            start += n
+
+    def records(self):
+        guids = self._guids or TimeSeriesReader(self._directory).guids()
+        for timestamp, guid, value in heapq.merge(*[self._readings(g) for g in guids]):
+            yield {
+                'guid'      : guid,
+                'last_read' : datetime.utcfromtimestamp(timestamp),
+                'data'      : value,
+            }
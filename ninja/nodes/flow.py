@@ -0,0 +1,200 @@
+import threading
+
+from .core          import Node, HasInput, HasOutput
+from ninja.scheduler import sharedScheduler
+
+
+class Dedupe(Node, HasInput, HasOutput):
+    """
+    Public (I/O): passes data through only when `key(data)` differs from the
+    key of the last data it passed (the data itself by default). With a
+    `group` callable, repeats are tracked separately for each group, eg each
+    device's `guid`.
+
+        dedupe = Dedupe(key=lambda d: d['data'], group=lambda d: d['guid'])
+    """
+    def __init__(self, *args, **kwargs):
+        super(Dedupe, self).__init__(*args, **kwargs)
+        self._key = kwargs.get('key', None)
+        self._group = kwargs.get('group', None)
+        self._last = {}
+        self.suppressed = 0
+
+    def receiveData(self, data, from_id):
+        key = self._key(data) if self._key else data
+        group = self._group(data) if self._group else None
+        if group in self._last and self._last[group] == key:
+            self.suppressed += 1
+            return
+        self._last[group] = key
+        self.o.emit(data)
+
+    def reset(self):
+        self._last = {}
+
+
+
+class _TimedNode(Node, HasInput, HasOutput):
+    """
+    Shared setup for the flow-control nodes that hold data back for a time.
+    Their timers run on a `Scheduler` (the shared one by default), so held
+    data is emitted from the scheduler's thread.
+    """
+    def __init__(self, *args, **kwargs):
+        super(_TimedNode, self).__init__(*args, **kwargs)
+        self._scheduler = kwargs.get('scheduler') or sharedScheduler()
+        self._lock = threading.RLock()
+        self._timer = None
+        self._pending = None
+        self._has_pending = False
+
+    def _takePending(self):
+        data = self._pending
+        self._pending = None
+        self._has_pending = False
+        return data
+
+    def flush(self):
+        """
+        Emit any held data now, instead of waiting for its timer.
+        """
+        with self._lock:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+            if not self._has_pending:
+                return
+            data = self._takePending()
+        self.o.emit(data)
+
+    def cancel(self):
+        """
+        Discard any held data and stop its timer.
+        """
+        with self._lock:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+            self._takePending()
+
+
+
+class Throttle(_TimedNode):
+    """
+    Public (I/O): passes at most `limit` items (1 by default) per `interval`
+    seconds (1 by default). The interval starts with the first item passed.
+
+    With `leading=True` (the default), items are passed as they arrive until
+    the limit is reached. With `trailing=True`, the latest item held back
+    during an interval is passed when the interval ends, and starts the next
+    one. Anything else received over the limit is dropped.
+    """
+    def __init__(self, *args, **kwargs):
+        super(Throttle, self).__init__(*args, **kwargs)
+        self._limit = kwargs.get('limit', 1)
+        self._interval = kwargs.get('interval', 1)
+        self._leading = kwargs.get('leading', True)
+        self._trailing = kwargs.get('trailing', False)
+        if self._limit <= 0:
+            raise ValueError('limit must be an int greater than 0')
+        if self._interval <= 0:
+            raise ValueError('interval must be greater than 0')
+        if not (self._leading or self._trailing):
+            raise ValueError('At least one of leading or trailing must be True')
+        self._count = 0
+        self.dropped = 0
+
+    def receiveData(self, data, from_id):
+        with self._lock:
+            if self._timer is None:
+                self._timer = self._scheduler.callLater(self._interval, self._endInterval)
+                self._count = 0
+            if self._leading and self._count < self._limit:
+                self._count += 1
+            else:
+                if self._has_pending or not self._trailing:
+                    self.dropped += 1
+                if self._trailing:
+                    self._pending = data
+                    self._has_pending = True
+                return
+        self.o.emit(data)
+
+    def _endInterval(self):
+        with self._lock:
+            self._timer = None
+            if not self._has_pending:
+                return
+            data = self._takePending()
+            # The trailing item counts towards the next interval.
+            self._timer = self._scheduler.callLater(self._interval, self._endInterval)
+            self._count = 1
+        self.o.emit(data)
+
+
+
+class Debounce(_TimedNode):
+    """
+    Public (I/O): waits for its input to go quiet for `quiet` seconds, then
+    emits the latest item received. With `max_wait`, an item is emitted at
+    least every `max_wait` seconds during a steady stream of input.
+    """
+    def __init__(self, *args, **kwargs):
+        super(Debounce, self).__init__(*args, **kwargs)
+        self._quiet = kwargs.get('quiet', None)
+        self._max_wait = kwargs.get('max_wait', None)
+        if not self._quiet or self._quiet <= 0:
+            raise ValueError('quiet must be specified, and greater than 0')
+        self._first = None
+
+    def receiveData(self, data, from_id):
+        scheduler = self._scheduler
+        with self._lock:
+            now = scheduler.now()
+            if not self._has_pending:
+                self._first = now
+            self._pending = data
+            self._has_pending = True
+            when = now + self._quiet
+            if self._max_wait is not None:
+                when = min(when, self._first + self._max_wait)
+            if self._timer:
+                self._timer.cancel()
+            self._timer = scheduler.callAt(when, self._fire)
+
+    def _fire(self):
+        with self._lock:
+            self._timer = None
+            if not self._has_pending:
+                return
+            data = self._takePending()
+        self.o.emit(data)
+
+
+
+class Sample(_TimedNode):
+    """
+    Public (I/O): emits the latest item received, at most once every
+    `interval` seconds. Items that arrive in between replace each other, and
+    nothing is emitted for an interval with no input.
+    """
+    def __init__(self, *args, **kwargs):
+        super(Sample, self).__init__(*args, **kwargs)
+        self._interval = kwargs.get('interval', None)
+        if not self._interval or self._interval <= 0:
+            raise ValueError('interval must be specified, and greater than 0')
+
+    def receiveData(self, data, from_id):
+        with self._lock:
+            self._pending = data
+            self._has_pending = True
+            if self._timer is None:
+                self._timer = self._scheduler.callLater(self._interval, self._fire)
+
+    def _fire(self):
+        with self._lock:
+            self._timer = None
+            if not self._has_pending:
+                return
+            data = self._takePending()
+        self.o.emit(data)
@@ -0,0 +1,213 @@
+import threading
+
+from .core import Input, Output
+
+
+class GraphCycleError(Exception):
+    pass
+
+
+
+class ExecutionPlan(object):
+    """
+    A node graph compiled into a flat, iterative form.
+
+    Normally `Output.emit` calls each connected `Input`, which calls
+    `receiveData`, which emits again, so data moves through the graph as a
+    chain of nested calls (about three Python frames per hop). A plan replaces
+    `emit` on every output in the graph with pre-bound call sites that push
+    the work onto a stack, and drains the stack in a loop. Delivery is
+    depth-first, as on the recursive path: each emit reaches its inputs in
+    order, and the items emitted while one is received (eg every item a
+    `Buffer` flushes) are delivered in the order they were emitted, each
+    through the rest of the graph before the next. Unlike the recursive path,
+    the receiving node has returned by the time they are delivered, but the
+    call depth stays constant no matter how long the graph is.
+
+    That bounded depth is the main gain: graphs deeper than the recursion
+    limit can run at all. Delivery itself is only somewhat faster, about 1.25x
+    on chains and fan-outs of 100 nodes, and no faster on short chains.
+
+    Each thread gets its own stack, so outputs fed from queued edges (see
+    `queueEdge`) can emit from worker threads.
+
+    Plans are created with `compileGraph`. The graph must not be rewired while
+    a plan is bound; call `release()` first and compile again afterward.
+    """
+    def __init__(self, nodes):
+        self.nodes = nodes
+        self.sources = [node for node in nodes if _isSource(node)]
+        self._local = threading.local()
+        self._bound = []
+        self.bind()
+
+    def bind(self):
+        self.release()
+        for node in self.nodes:
+            for connector in node.connectors:
+                if isinstance(connector, Output):
+                    connector.emit = self._makeEmit(connector)
+                    self._bound.append(connector)
+
+    def release(self):
+        for output in self._bound:
+            output.__dict__.pop('emit', None)
+        self._bound = []
+
+    def tick(self, *nodes):
+        """
+        Trigger `emitData` on the given nodes, or on every source node of the
+        graph (nodes with an output and no connected input) if none are given.
+        """
+        for node in (nodes or self.sources):
+            node.emitData()
+
+    def _makeEmit(self, output):
+        node = output.node
+        from_id = output.id
+
+        # With a profiler active, deliver through the instrumented
+        # `Input.__call__` and count emits, instead of binding directly.
+        profiler = Input.profiler
+        call_sites = []
+        for connector in output.targets:
+            if isinstance(connector, Input) and not profiler:
+                call_sites.append((connector.node.receiveData, connector.node))
+            else:
+                call_sites.append((connector, None))
+        call_sites = tuple(call_sites)
+
+        local = self._local
+        drain = self._drain
+
+        if profiler:
+            def emit(data):
+                profiler.statsFor(node).items_out += 1
+                deliver(data)
+        if len(call_sites) == 1 and not profiler:
+            # Most outputs have one input; skip the loop for them.
+            (receive, target), = call_sites
+            def emit(data):
+                node.last_data = data
+                try:
+                    stack = local.stack
+                except AttributeError:
+                    stack = local.stack = _WorkStack()
+                stack.append((receive, target, data, from_id))
+                if not stack.draining:
+                    drain(stack)
+            return emit
+
+        def deliver(data):
+            node.last_data = data
+            try:
+                stack = local.stack
+            except AttributeError:
+                stack = local.stack = _WorkStack()
+            append = stack.append
+            for receive, target in call_sites:
+                append((receive, target, data, from_id))
+            if not stack.draining:
+                drain(stack)
+        return emit if profiler else deliver
+
+    def _drain(self, stack):
+        pop = stack.pop
+        stack.draining = True
+        try:
+            # Items are pushed in the order they are emitted; reversing them
+            # puts the first on top of the stack.
+            if len(stack) > 1:
+                stack.reverse()
+            while stack:
+                receive, target, data, from_id = pop()
+                size = len(stack) + 1
+                receive(data, from_id)
+                if target is not None:
+                    target.last_data = data
+                if len(stack) > size:
+                    # Reverse what this receive emitted, so each item goes
+                    # through the rest of the graph before its later siblings.
+                    emitted = stack[size - 1:]
+                    emitted.reverse()
+                    stack[size - 1:] = emitted
+        except:
+            del stack[:]
+            raise
+        finally:
+            stack.draining = False
+
+
+
+class _WorkStack(list):
+    draining = False
+
+
+
+def _isSource(node):
+    if not node.hasOutput():
+        return False
+    return not node.hasInput() or not node.i.targets
+
+
+def _label(node):
+    return node.label or node.id
+
+
+def findGraph(*nodes):
+    """
+    Return every node reachable from the given nodes, following connections
+    in both directions.
+    """
+    seen = {}
+    pending = list(nodes)
+    while pending:
+        node = pending.pop()
+        if node.id in seen:
+            continue
+        seen[node.id] = node
+        for connector in node.connectors:
+            for other in connector.targets:
+                other_node = getattr(other, 'node', None)
+                if other_node is not None and other_node.id not in seen:
+                    pending.append(other_node)
+    return list(seen.values())
+
+
+def compileGraph(*nodes):
+    """
+    Topologically sort the graph containing the given nodes and return a bound
+    `ExecutionPlan` for it. Raises `GraphCycleError` if the graph has a cycle,
+    since a cycle would emit forever.
+    """
+    graph = findGraph(*nodes)
+
+    downstream = {}
+    in_degree = dict((node.id, 0) for node in graph)
+    for node in graph:
+        targets = []
+        for connector in node.connectors:
+            if not isinstance(connector, Output):
+                continue
+            for other in connector.targets:
+                other_node = getattr(other, 'node', None)
+                if other_node is not None:
+                    targets.append(other_node)
+                    in_degree[other_node.id] += 1
+        downstream[node.id] = targets
+
+    ordered = []
+    ready = [node for node in graph if in_degree[node.id] == 0]
+    while ready:
+        node = ready.pop()
+        ordered.append(node)
+        for target in downstream[node.id]:
+            in_degree[target.id] -= 1
+            if in_degree[target.id] == 0:
+                ready.append(target)
+
+    if len(ordered) != len(graph):
+        cycle = [_label(node) for node in graph if in_degree[node.id] > 0]
+        raise GraphCycleError('Node graph has a cycle through: %s' % (', '.join(map(str, cycle)),))
+
+    return ExecutionPlan(ordered)
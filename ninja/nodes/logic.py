@@ -28,7 +28,298 @@ class And(Channel):
 
     def receiveData(self, data, from_id):
         self._data_set[from_id] = data
-        if len(self._data_set) == len(self.i.connected):
+        if len(self._data_set) == len(self.i.targets):
             self.o.emit(self._data_set)
             self._data_set = {}
 
+
+
+
+import threading, time
+from .core import readingTime, _PollTimer
+
+class _Missing(object):
+    def __repr__(self):
+        return 'MISSING'
+
+    def __nonzero__(self):
+        return False
+    __bool__ = __nonzero__
+
+MISSING = _Missing()
+
+class Join(Node, HasInput, HasOutput):
+    """
+    Public (I/O): joins the data from its connected outputs into one dict,
+    keyed by output id (like `And`), aligning the data by tick or time.
+
+    Each item is assigned to a group by one of:
+
+        ticker  - the `Ticker` counter when the item arrives
+        bucket  - `timestamp(data)` divided into buckets of this many seconds
+                  (the `last_read` of device node data by default)
+        key     - any callable of the data
+
+    A group is emitted as soon as every input has contributed to it. If
+    `timeout` seconds pass after a group's first item without that happening
+    (checked as data arrives, and by a timer on `scheduler`, the shared
+    `Scheduler` by default), it is emitted anyway, with `MISSING` for the
+    absent inputs, so one slow or failed device cannot stall the join. Groups are always emitted in order: completing a
+    group also emits any older, still-partial groups.
+
+    At most `max_pending` groups are held; past that, the oldest is emitted
+    partial. Items for a group that has already been emitted are counted in
+    `late` and dropped.
+
+    In `mode='latest'`, absent inputs are filled with the most recent data
+    received from them, instead of `MISSING` (until they have sent anything).
+    The default is `mode='strict'`.
+    """
+    MISSING = MISSING
+
+    def __init__(self, *args, **kwargs):
+        super(Join, self).__init__(*args, **kwargs)
+        self._ticker = kwargs.get('ticker', None)
+        self._bucket = kwargs.get('bucket', None)
+        self._key = kwargs.get('key', None)
+        self._timestamp = kwargs.get('timestamp', readingTime)
+        if [self._ticker, self._bucket, self._key].count(None) != 2:
+            raise ValueError('Exactly one of ticker, bucket, or key must be specified')
+
+        self._timeout = kwargs.get('timeout', None)
+        self._max_pending = kwargs.get('max_pending', 16)
+        self._mode = kwargs.get('mode', 'strict')
+        if self._mode not in ('strict', 'latest'):
+            raise ValueError('mode must be strict or latest')
+
+        self._pending = {}
+        self._started = {}
+        self._latest = {}
+        self._last_key = None
+        self.late = 0
+        # The timeout timer emits from the scheduler's thread.
+        self._lock = threading.RLock()
+        self._timeout_timer = _PollTimer(self.poll, kwargs.get('scheduler'))
+
+    def _groupKey(self, data):
+        if self._ticker is not None:
+            return self._ticker.counter
+        elif self._bucket is not None:
+            return int(self._timestamp(data) // self._bucket)
+        return self._key(data)
+
+    def receiveData(self, data, from_id):
+        key = self._groupKey(data)
+        with self._lock:
+            if self._last_key is not None and key <= self._last_key:
+                self.late += 1
+                return
+
+            if self._mode == 'latest':
+                self._latest[from_id] = data
+
+            group = self._pending.get(key)
+            if group is None:
+                group = self._pending[key] = {}
+                self._started[key] = time.time()
+            group[from_id] = data
+
+            if len(group) >= len(self.i.targets):
+                self._emitThrough(key)
+            elif len(self._pending) > self._max_pending:
+                self._emitThrough(min(self._pending))
+            self.poll()
+
+    def poll(self):
+        with self._lock:
+            if self._timeout is None:
+                return
+            if not self._pending:
+                self._timeout_timer.cancel()
+                return
+            cutoff = time.time() - self._timeout
+            expired = [key for key in self._pending if self._started[key] <= cutoff]
+            if expired:
+                self._emitThrough(max(expired))
+            if self._pending:
+                self._timeout_timer.arm(min(self._started.itervalues()) - cutoff)
+            else:
+                self._timeout_timer.cancel()
+
+    def _emitThrough(self, last_key):
+        for key in sorted(k for k in self._pending if k <= last_key):
+            group = self._pending.pop(key)
+            del self._started[key]
+            for input_id in self.i.connected:
+                if input_id not in group:
+                    group[input_id] = self._latest.get(input_id, MISSING)
+            self._last_key = key
+            self.o.emit(group)
+
+
+
+from bisect import bisect_left, bisect_right
+
+class _SortedRules(object):
+    """
+    Rule names sorted by a numeric key, for finding the rules whose keys fall
+    in a range with `bisect`.
+    """
+    def __init__(self):
+        self.keys = []
+        self.names = []
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, key, name):
+        i = bisect_right(self.keys, key)
+        self.keys.insert(i, key)
+        self.names.insert(i, name)
+
+    def remove(self, key, name):
+        i = bisect_left(self.keys, key)
+        while self.names[i] != name:
+            i += 1
+        del self.keys[i]
+        del self.names[i]
+
+    def below(self, value):
+        # Rules with key < value.
+        return self.names[:bisect_left(self.keys, value)]
+
+    def above(self, value):
+        # Rules with key > value.
+        return self.names[bisect_right(self.keys, value):]
+
+    def between(self, low, high):
+        # Rules with low < key <= high.
+        return self.names[bisect_right(self.keys, low):bisect_right(self.keys, high)]
+
+    def betweenLow(self, low, high):
+        # Rules with low <= key < high.
+        return self.names[bisect_left(self.keys, low):bisect_left(self.keys, high)]
+
+
+class Rules(Node, HasInput, HasOutput):
+    """
+    Public (I/O): evaluates declarative alert rules against device readings.
+
+    Rules are added per device guid, by name:
+
+        addRange(name, guid, low=None, high=None)
+            matches readings outside [low, high]
+        addThreshold(name, guid, threshold, direction='above')
+            matches a reading that crosses the threshold from the previous
+            reading ('above', 'below', or 'both')
+        addRateOfChange(name, guid, max_rate)
+            matches when the value changes faster than `max_rate` per second
+
+    The rules for each guid are kept in sorted lists, so a reading only
+    touches the rules it matches (found with `bisect`), not every rule.
+    Readings for guids without rules cost a single dict lookup.
+
+    For each match, the reading is emitted on the rule's named output
+    (`rules.output(name)`, like `If.fail`), and a dict with `rule`, `guid`,
+    `value`, and `data` is emitted on `o`. The guid, time, and value of a
+    reading are taken from `guid(data)`, `timestamp(data)`, and `value(data)`,
+    which default to the fields of device node data.
+    """
+    def __init__(self, *args, **kwargs):
+        super(Rules, self).__init__(*args, **kwargs)
+        self._guid = kwargs.get('guid', lambda data: data['guid'])
+        self._timestamp = kwargs.get('timestamp', readingTime)
+        self._value = kwargs.get('value', lambda data: float(data['data']))
+        self._devices = {}
+        self._rules = {}
+        self.outputs = {}
+
+    def output(self, name):
+        connector = self.outputs.get(name)
+        if connector is None:
+            connector = self.outputs[name] = Output()
+            connector.setNode(self)
+            self.connectors.append(connector)
+        return connector
+
+    def _index(self, guid):
+        index = self._devices.get(guid)
+        if index is None:
+            index = self._devices[guid] = {
+                'lows'      : _SortedRules(),   # matched below the key
+                'highs'     : _SortedRules(),   # matched above the key
+                'above'     : _SortedRules(),   # upward crossings
+                'below'     : _SortedRules(),   # downward crossings
+                'rates'     : _SortedRules(),   # matched faster than the key
+                'previous'  : None,             # (timestamp, value)
+            }
+        return index
+
+    def _add(self, name, guid, entries):
+        if name in self._rules:
+            raise ValueError('rule %s already exists' % (name,))
+        index = self._index(guid)
+        for kind, key in entries:
+            index[kind].add(key, name)
+        self._rules[name] = (guid, entries)
+        self.output(name)
+
+    def addRange(self, name, guid, low=None, high=None):
+        if low is None and high is None:
+            raise ValueError('low or high must be specified')
+        entries = []
+        if low is not None:
+            entries.append(('lows', low))
+        if high is not None:
+            entries.append(('highs', high))
+        self._add(name, guid, entries)
+
+    def addThreshold(self, name, guid, threshold, direction='above'):
+        if direction not in ('above', 'below', 'both'):
+            raise ValueError('direction must be above, below, or both')
+        kinds = ('above', 'below') if direction == 'both' else (direction,)
+        self._add(name, guid, [(kind, threshold) for kind in kinds])
+
+    def addRateOfChange(self, name, guid, max_rate):
+        self._add(name, guid, [('rates', abs(max_rate))])
+
+    def removeRule(self, name):
+        guid, entries = self._rules.pop(name)
+        index = self._devices[guid]
+        for kind, key in entries:
+            index[kind].remove(key, name)
+
+    def receiveData(self, data, from_id):
+        guid = self._guid(data)
+        index = self._devices.get(guid)
+        if index is None:
+            return
+        value = self._value(data)
+        timestamp = self._timestamp(data)
+        previous = index['previous']
+        index['previous'] = (timestamp, value)
+
+        matched = []
+        if index['lows']:
+            matched += index['lows'].above(value)
+        if index['highs']:
+            matched += index['highs'].below(value)
+
+        if previous is not None:
+            previous_time, previous_value = previous
+            if index['above'] and value > previous_value:
+                matched += index['above'].between(previous_value, value)
+            if index['below'] and value < previous_value:
+                matched += index['below'].betweenLow(value, previous_value)
+            if index['rates'] and timestamp > previous_time:
+                rate = abs(value - previous_value) / (timestamp - previous_time)
+                matched += index['rates'].below(rate)
+
+        for name in matched:
+            self.outputs[name].emit(data)
+            self.o.emit({
+                'rule'  : name,
+                'guid'  : guid,
+                'value' : value,
+                'data'  : data,
+            })
@@ -1,43 +1,391 @@
-from .core import Node, HasInput, HasOutput
+import gzip, os, threading, time
+from cStringIO import StringIO
+from Queue import Queue
+from collections import OrderedDict
+
+from .core      import Node, HasInput, HasOutput, _PollTimer
+from .fileio    import NinjaJSONEncoder, _open_writers
 
 import requests
-# class HTTPWriter(Node, HasInput):
-#     def __init__(self, *args, **kwargs):
-#         super(HTTPWriter, self).__init__(*args, **kwargs)
-#         self._opts = kwargs
 
-#     def _validateOptions(self):
-#         self._opts
-#         return True
 
-#     def setOptions(self, **kwargs):
-#         self._opts = kwargs
-#         self._validateOptions()
+_session = None
+_session_lock = threading.Lock()
+
+def sharedSession():
+    """
+    The keep-alive `requests` session shared by the network nodes, so
+    repeated requests to the same host reuse pooled connections.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.session(config={
+                'keep_alive'        : True,
+                'pool_connections'  : 32,
+                'pool_maxsize'      : 32,
+            })
+    return _session
+
+
+
+class HTTPCache(object):
+    """
+    A thread-safe LRU cache of HTTP responses, holding at most `max_entries`
+    bodies along with their `ETag` and `Last-Modified` validators.
+    """
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        with self._lock:
+            entry = self._entries.pop(url, None)
+            if entry is not None:
+                self._entries[url] = entry
+            return entry
+
+    def put(self, url, entry):
+        with self._lock:
+            self._entries.pop(url, None)
+            self._entries[url] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+shared_cache = HTTPCache()
+
+
+
+class _WorkerPool(object):
+    """
+    Daemon threads that run the calls passed to `map`, up to `size` at a
+    time. Threads are started as they are first needed and then kept, so
+    repeated calls do not start threads of their own.
+    """
+    def __init__(self, size):
+        self.size = size
+        self._work = Queue()
+        self._threads = 0
+        self._lock = threading.Lock()
+
+    def _run(self):
+        while True:
+            self._work.get()()
+
+    def map(self, fn, items):
+        """
+        Return `[fn(item) for item in items]`, computed on the pool. If any
+        call raises, the items not yet started are skipped and the first
+        exception is raised.
+        """
+        items = list(items)
+        results = [None] * len(items)
+        errors = []
+        done = threading.Semaphore(0)
 
-#     def _sendRequest(self, data):
-#         self._validateOptions()
+        def call(n, item):
+            try:
+                if not errors:
+                    results[n] = fn(item)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                done.release()
+
+        with self._lock:
+            while self._threads < min(self.size, len(items)):
+                thread = threading.Thread(target=self._run)
+                thread.daemon = True
+                thread.start()
+                self._threads += 1
+        for n, item in enumerate(items):
+            self._work.put(lambda n=n, item=item: call(n, item))
+        for item in items:
+            done.acquire()
+        if errors:
+            raise errors[0]
+        return results
 
-#     def receiveData(self, data):
-#         self._writeToFile(data)
 
 
 class HTTPReader(Node, HasOutput):
+    """
+    Public (O): GETs `url` and emits the response body. If `url` is a list,
+    the URLs are fetched concurrently (up to `max_workers` at a time, on
+    threads the reader keeps between pulls) and a dict of bodies keyed by URL
+    is emitted.
+
+    Requests go through a shared keep-alive session, and responses are kept
+    in an LRU `HTTPCache` (a shared one by default). A cached body younger
+    than `ttl` seconds is used without a request at all; after that, the
+    request is sent with `If-None-Match` / `If-Modified-Since`, and a `304 Not
+    Modified` reuses the cached body. Any other status outside 2xx raises a
+    `requests.HTTPError`, and nothing is cached or emitted. With
+    `changed_only=True`, nothing is emitted when no body has changed since
+    the last emit.
+
+    `emitEvery(period)` pulls periodically on the shared scheduler. The
+    requests run on its worker threads, and a pull is skipped if the last
+    one is still waiting on the network.
+    """
     def __init__(self, *args, **kwargs):
         super(HTTPReader, self).__init__(*args, **kwargs)
         self._opts = kwargs
+        self._pool = None
+        self.requests_sent = 0
+        self.not_modified = 0
+        self.cache_hits = 0
 
     def _validateOptions(self):
-        self._opts
+        if not self._opts.get('url'):
+            raise ValueError('url not specified')
         return True
 
     def setOptions(self, **kwargs):
         self._opts = kwargs
         self._validateOptions()
 
-    def _sendRequest(self):
-        response = requests.get(self._opts.get('url'))
-        return response.content
+    def _sendRequest(self, url=None):
+        """
+        Return `(body, changed)` for `url` (the configured URL by default).
+        """
+        url = url or self._opts.get('url')
+        cache = self._opts.get('cache', shared_cache)
+        ttl = self._opts.get('ttl', None)
+        now = time.time()
+
+        entry = cache.get(url)
+        if entry is not None and ttl is not None and now - entry['fetched_at'] < ttl:
+            self.cache_hits += 1
+            return entry['content'], False
+
+        headers = {}
+        if entry is not None:
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        session = self._opts.get('session') or sharedSession()
+        response = session.get(url, headers=headers, timeout=self._opts.get('timeout', 10))
+        self.requests_sent += 1
+
+        if response.status_code == 304 and entry is not None:
+            self.not_modified += 1
+            entry['fetched_at'] = now
+            cache.put(url, entry)
+            return entry['content'], False
+
+        if not 200 <= response.status_code < 300:
+            error = requests.HTTPError('Got status code %s for %s' % (response.status_code, url))
+            error.response = response
+            raise error
+
+        content = response.content
+        changed = entry is None or entry['content'] != content
+        cache.put(url, {
+            'content'       : content,
+            'etag'          : response.headers.get('etag'),
+            'last_modified' : response.headers.get('last-modified'),
+            'fetched_at'    : now,
+        })
+        return content, changed
+
+    def _sendRequests(self, urls):
+        size = self._opts.get('max_workers', 8)
+        if self._pool is None:
+            self._pool = _WorkerPool(size)
+        self._pool.size = size
+        return dict(zip(urls, self._pool.map(self._sendRequest, urls)))
 
     def emitData(self):
-        data = self._sendRequest()
-        self.o.emit(self.id, data)
\ No newline at end of file
+        self._validateOptions()
+        url = self._opts.get('url')
+        if isinstance(url, (list, tuple)):
+            results = self._sendRequests(url)
+            data = dict((u, results[u][0]) for u in url)
+            changed = any(results[u][1] for u in url)
+        else:
+            data, changed = self._sendRequest()
+        if changed or not self._opts.get('changed_only', False):
+            self.o.emit(data)
+
+    def emitEvery(self, period, scheduler=None, **kwargs):
+        kwargs.setdefault('background', True)
+        return super(HTTPReader, self).emitEvery(period, scheduler, **kwargs)
+
+
+
+class HTTPWriter(Node, HasInput):
+    """
+    Public (I): POSTs the data it receives to `url`, in batches, as JSON
+    arrays.
+
+    A batch is sent once it holds `batch_size` records (100 by default), or
+    once `batch_interval` seconds have passed since the last send (checked as
+    data arrives, and by a timer on `scheduler`, the shared `Scheduler` by
+    default, whose sends run on its workers). With `gzip=True` the body is
+    compressed. Requests go through the shared keep-alive session.
+
+    A failed send is retried `retries` times (3 by default), waiting
+    `backoff` seconds (0.5 by default) before the first retry and doubling
+    each time. If it still fails, the batch is written to `spill_dir` (if
+    given; otherwise it is dropped and counted in `dropped`), and spilled
+    batches are resent, oldest first, after the next successful send. The
+    spill directory is kept under `spill_max_bytes` by discarding the oldest
+    batches.
+
+    Sending happens on the emitting thread, so retries block it; put the
+    writer behind a `queueEdge` to keep them off the polling path.
+    """
+    def __init__(self, *args, **kwargs):
+        super(HTTPWriter, self).__init__(*args, **kwargs)
+        self._opts = kwargs
+        self._validateOptions()
+        self._encode = NinjaJSONEncoder(separators=(',', ':')).encode
+        self._batch = []
+        self._last_send = time.time()
+        self._spill_seq = 0
+        self._lock = threading.RLock()
+        self._send_timer = _PollTimer(self.poll, kwargs.get('scheduler'), background=True)
+
+        self.batches_sent = 0
+        self.records_sent = 0
+        self.failures = 0
+        self.spilled = 0
+        self.dropped = 0
+
+        spill_dir = self._opts.get('spill_dir')
+        if spill_dir and not os.path.isdir(spill_dir):
+            os.makedirs(spill_dir)
+        _open_writers.add(self)
+
+    def _validateOptions(self):
+        if not self._opts.get('url'):
+            raise ValueError('url not specified')
+        if self._opts.get('batch_size', 100) <= 0:
+            raise ValueError('batch_size must be an int greater than 0')
+        return True
+
+    def setOptions(self, **kwargs):
+        self._opts = kwargs
+        self._validateOptions()
+
+    def receiveData(self, data, from_id):
+        with self._lock:
+            self._batch.append(data)
+            if len(self._batch) >= self._opts.get('batch_size', 100):
+                self.flush()
+            else:
+                self.poll()
+
+    def receiveBatch(self, items, from_id):
+        with self._lock:
+            self._batch.extend(items)
+            if len(self._batch) >= self._opts.get('batch_size', 100):
+                self.flush()
+            else:
+                self.poll()
+
+    def poll(self):
+        with self._lock:
+            interval = self._opts.get('batch_interval')
+            if interval is not None and self._batch:
+                remaining = self._last_send + interval - time.time()
+                if remaining <= 0:
+                    self.flush()
+                else:
+                    self._send_timer.arm(remaining)
+
+    def flush(self):
+        with self._lock:
+            self._send_timer.cancel()
+            batch, self._batch = self._batch, []
+            self._last_send = time.time()
+            if not batch:
+                return
+            body = self._encode(batch)
+            if self._opts.get('gzip'):
+                body = _gzip(body)
+            if self._sendRequest(body):
+                self.batches_sent += 1
+                self.records_sent += len(batch)
+                self._resendSpilled()
+            else:
+                self._spill(body)
+
+    def _sendRequest(self, body):
+        headers = { 'Content-Type': 'application/json' }
+        if self._opts.get('gzip'):
+            headers['Content-Encoding'] = 'gzip'
+        session = self._opts.get('session') or sharedSession()
+        delay = self._opts.get('backoff', 0.5)
+        for attempt in range(self._opts.get('retries', 3) + 1):
+            if attempt:
+                time.sleep(delay)
+                delay *= 2
+            try:
+                response = session.post(self._opts['url'], data=body, headers=headers,
+                    timeout=self._opts.get('timeout', 10))
+                if 200 <= response.status_code < 300:
+                    return True
+            except requests.RequestException:
+                pass
+            self.failures += 1
+        return False
+
+    def _spillFiles(self):
+        spill_dir = self._opts['spill_dir']
+        return [os.path.join(spill_dir, name) for name in sorted(os.listdir(spill_dir)) if name.endswith('.batch')]
+
+    def _spill(self, body):
+        spill_dir = self._opts.get('spill_dir')
+        if not spill_dir:
+            self.dropped += 1
+            return
+        self._spill_seq += 1
+        name = '%017.6f-%06d.batch' % (time.time(), self._spill_seq)
+        with open(os.path.join(spill_dir, name), 'wb') as f:
+            f.write(body)
+        self.spilled += 1
+
+        files = self._spillFiles()
+        sizes = [os.path.getsize(path) for path in files]
+        total = sum(sizes)
+        limit = self._opts.get('spill_max_bytes', 64 * 1024 * 1024)
+        for path, size in zip(files, sizes):
+            if total <= limit:
+                break
+            os.remove(path)
+            total -= size
+            self.dropped += 1
+
+    def _resendSpilled(self):
+        if not self._opts.get('spill_dir'):
+            return
+        for path in self._spillFiles():
+            with open(path, 'rb') as f:
+                body = f.read()
+            if not self._sendRequest(body):
+                return
+            os.remove(path)
+            self.batches_sent += 1
+
+    def close(self):
+        self.flush()
+        _open_writers.discard(self)
+
+
+def _gzip(body):
+    buf = StringIO()
+    with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+        f.write(body)
+    return buf.getvalue()
@@ -0,0 +1,194 @@
+import threading
+from multiprocessing import Pipe, Process
+
+from .core import Input
+
+_STOP = '__stop__'
+
+
+class _PipeSender(object):
+    """
+    Stands in for an `Input` on a connection that crosses a process boundary.
+    Data is collected into batches, and each batch is pickled and sent down
+    the pipe in one piece.
+    """
+    def __init__(self, connection, lock, edge, input, batch_size):
+        self.connection = connection
+        self.edge = edge
+        self.input = input
+        self.node = input.node
+        self.batch_size = batch_size
+        self._batch = []
+        # Shared by every sender on the connection.
+        self._lock = lock
+
+    @property
+    def id(self):
+        return self.input.id
+
+    def __call__(self, data, from_id=None):
+        with self._lock:
+            self._batch.append((self.edge, data, from_id))
+            if len(self._batch) >= self.batch_size:
+                self._send()
+        return self
+
+    def flush(self):
+        with self._lock:
+            self._send()
+
+    def _send(self):
+        if self._batch:
+            self.connection.send(self._batch)
+            self._batch = []
+
+
+
+class ProcessPartition(object):
+    """
+    Runs part of a node graph in a separate worker process, so CPU-heavy
+    transforms are not all competing for one GIL.
+
+    The graph is built and connected as usual. When `start()` is called, the
+    worker is forked with a copy of the graph, and every connection between a
+    node in the partition and a node outside it is replaced by a pipe. Data
+    crossing a pipe is batched (`batch_size` items, or whatever has collected
+    after `flush_interval` seconds) and pickled a batch at a time, so it must
+    be picklable. In this process, data coming back from the partition is
+    delivered on a receiver thread.
+
+    The partition should hold the transform part of a graph, not its sources:
+    device nodes and other emitters inside it will not be driven by anything
+    in the worker. `stop()` flushes both directions and waits for the worker
+    to exit; the original connections are then restored.
+
+    An `ExecutionPlan` delivers straight to its inputs, past the pipes, so
+    `start()` raises `ValueError` if a plan is bound to an output that
+    crosses the boundary. Compile plans after starting the partition (and
+    release them before stopping it).
+    """
+    def __init__(self, *nodes, **kwargs):
+        self.nodes = nodes
+        self._batch_size = kwargs.get('batch_size', 64)
+        self._flush_interval = kwargs.get('flush_interval', 0.05)
+        self._process = None
+        self.errors = 0
+
+    def _boundary(self):
+        inside = set(node.id for node in self.nodes)
+        inbound, outbound = [], []
+        for node in self.nodes:
+            for connector in node.connectors:
+                for other in connector.targets:
+                    if other.node.id in inside:
+                        continue
+                    if isinstance(connector, Input):
+                        inbound.append((other, connector))
+                    else:
+                        outbound.append((connector, other))
+        return inbound, outbound
+
+    def start(self):
+        inbound, outbound = self._boundary()
+        for output, input in inbound + outbound:
+            if 'emit' in output.__dict__:
+                raise ValueError('%r is bound by an ExecutionPlan; release it, and compile '
+                    'again after starting the partition' % (output.node,))
+        to_worker_recv, to_worker_send = Pipe(duplex=False)
+        from_worker_recv, from_worker_send = Pipe(duplex=False)
+
+        self._process = Process(target=self._runWorker,
+            args=(inbound, outbound, to_worker_recv, from_worker_send))
+        self._process.daemon = True
+        self._process.start()
+        to_worker_recv.close()
+        from_worker_send.close()
+
+        self._inbound = inbound
+        self._senders = []
+        lock = threading.Lock()
+        for edge, (output, input) in enumerate(inbound):
+            sender = _PipeSender(to_worker_send, lock, edge, input, self._batch_size)
+            output.connected[input.id] = sender
+            self._senders.append(sender)
+        self._connection = to_worker_send
+
+        self._receiver = threading.Thread(target=self._receive,
+            args=(from_worker_recv, [input for output, input in outbound]))
+        self._receiver.daemon = True
+        self._receiver.start()
+        self._flusher = _startFlusher(self._senders, self._flush_interval)
+        return self
+
+    def _receive(self, connection, inputs):
+        while True:
+            try:
+                batch = connection.recv()
+            except EOFError:
+                return
+            if batch == _STOP:
+                self.errors = connection.recv()
+                return
+            for edge, data, from_id in batch:
+                inputs[edge](data, from_id=from_id)
+
+    def _runWorker(self, inbound, outbound, connection, results):
+        senders = []
+        lock = threading.Lock()
+        for edge, (output, input) in enumerate(outbound):
+            sender = _PipeSender(results, lock, edge, input, self._batch_size)
+            output.connected[input.id] = sender
+            senders.append(sender)
+        _startFlusher(senders, self._flush_interval)
+
+        inputs = [input for output, input in inbound]
+        errors = 0
+        while True:
+            batch = connection.recv()
+            if batch == _STOP:
+                break
+            for edge, data, from_id in batch:
+                try:
+                    inputs[edge](data, from_id=from_id)
+                except Exception:
+                    errors += 1
+        for sender in senders:
+            sender.flush()
+        with lock:
+            results.send(_STOP)
+            results.send(errors)
+        results.close()
+
+    def flush(self):
+        for sender in self._senders:
+            sender.flush()
+
+    def stop(self):
+        if not self._process:
+            return
+        self._flusher.set()
+        self.flush()
+        self._connection.send(_STOP)
+        self._receiver.join()
+        self._process.join()
+        self._connection.close()
+        for output, input in self._inbound:
+            output.connected[input.id] = input
+        self._process = None
+
+
+
+def _startFlusher(senders, interval):
+    """
+    Flush `senders` every `interval` seconds on a daemon thread, until the
+    returned event is set.
+    """
+    stopped = threading.Event()
+    def run():
+        while not stopped.wait(interval):
+            for sender in senders:
+                sender.flush()
+    thread = threading.Thread(target=run)
+    thread.daemon = True
+    thread.start()
+    return stopped
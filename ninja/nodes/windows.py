@@ -0,0 +1,348 @@
+import math, random, threading, time
+from collections    import deque
+
+from .core import Node, HasInput, HasOutput, _PollTimer, readingTime, readingValue
+
+
+class _End(object):
+    # Sorts after every value, to end each level of a skiplist.
+    def __lt__(self, other):
+        return False
+    __le__ = __lt__
+
+    def __gt__(self, other):
+        return True
+    __ge__ = __gt__
+
+
+class _SkipNode(object):
+    __slots__ = ('value', 'next', 'width')
+
+    def __init__(self, value, next, width):
+        self.value = value
+        self.next = next
+        self.width = width
+
+_NIL = _SkipNode(_End(), [], [])
+
+
+class _IndexableSkiplist(object):
+    """
+    A sorted multiset of values, indexable by rank. Each link records how
+    many values it skips, so `insert`, `remove`, and `[i]` are all O(log n)
+    (expected). Levels are added as the list grows.
+    """
+    def __init__(self):
+        self.size = 0
+        self._levels = 1
+        self._head = _SkipNode(None, [_NIL], [1])
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, i):
+        if not 0 <= i < self.size:
+            raise IndexError('skiplist index out of range')
+        node = self._head
+        i += 1
+        for level in range(self._levels - 1, -1, -1):
+            while node.width[level] <= i:
+                i -= node.width[level]
+                node = node.next[level]
+        return node.value
+
+    def insert(self, value):
+        if self.size >= 1 << self._levels:
+            # A new top level links the head straight to the end.
+            self._head.next.append(_NIL)
+            self._head.width.append(self.size + 1)
+            self._levels += 1
+        levels = self._levels
+
+        # Find the last node before `value` on each level, and how far along
+        # the list it is.
+        chain = [None] * levels
+        steps_at_level = [0] * levels
+        node = self._head
+        for level in range(levels - 1, -1, -1):
+            while node.next[level].value <= value:
+                steps_at_level[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+
+        height = min(levels, 1 - int(math.log(1.0 - random.random(), 2.0)))
+        new = _SkipNode(value, [None] * height, [None] * height)
+        steps = 0
+        for level in range(height):
+            previous = chain[level]
+            new.next[level] = previous.next[level]
+            previous.next[level] = new
+            new.width[level] = previous.width[level] - steps
+            previous.width[level] = steps + 1
+            steps += steps_at_level[level]
+        for level in range(height, levels):
+            chain[level].width[level] += 1
+        self.size += 1
+
+    def remove(self, value):
+        levels = self._levels
+        chain = [None] * levels
+        node = self._head
+        for level in range(levels - 1, -1, -1):
+            while node.next[level].value < value:
+                node = node.next[level]
+            chain[level] = node
+        found = chain[0].next[0]
+        if found is _NIL or found.value != value:
+            raise ValueError('value not in skiplist')
+
+        for level in range(len(found.next)):
+            previous = chain[level]
+            previous.width[level] += found.width[level] - 1
+            previous.next[level] = found.next[level]
+        for level in range(len(found.next), levels):
+            chain[level].width[level] -= 1
+        self.size -= 1
+
+
+
+class WindowStats(object):
+    """
+    Running statistics over a first-in, first-out window of values.
+
+    `add` and `remove` are O(1) for the count, sum, mean, and standard
+    deviation (Welford's method, run backwards for removals), and amortized
+    O(1) for the min and max (monotonic deques). Percentiles are read from a
+    sorted copy of the window in an indexable skiplist, O(log n) to update
+    and to read, and are only tracked if asked for. Values must be removed in
+    the order they were added.
+    """
+    def __init__(self, percentiles=()):
+        self.percentiles = tuple(percentiles)
+        self.clear()
+
+    def clear(self):
+        self.count = 0
+        self.sum = 0.0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._added = 0
+        self._removed = 0
+        self._mins = deque()
+        self._maxes = deque()
+        self._sorted = _IndexableSkiplist() if self.percentiles else None
+
+    def add(self, value):
+        self.count += 1
+        self.sum += value
+        delta = value - self._mean
+        self._mean += delta / self.count
+        self._m2 += delta * (value - self._mean)
+
+        n = self._added
+        self._added += 1
+        mins = self._mins
+        while mins and mins[-1][1] >= value:
+            mins.pop()
+        mins.append((n, value))
+        maxes = self._maxes
+        while maxes and maxes[-1][1] <= value:
+            maxes.pop()
+        maxes.append((n, value))
+
+        if self._sorted is not None:
+            self._sorted.insert(value)
+
+    def remove(self, value):
+        if self.count <= 1:
+            self.clear()
+            return
+        self.count -= 1
+        self.sum -= value
+        delta = value - self._mean
+        self._mean -= delta / self.count
+        self._m2 = max(self._m2 - delta * (value - self._mean), 0.0)
+
+        n = self._removed
+        self._removed += 1
+        if self._mins and self._mins[0][0] == n:
+            self._mins.popleft()
+        if self._maxes and self._maxes[0][0] == n:
+            self._maxes.popleft()
+
+        if self._sorted is not None:
+            self._sorted.remove(value)
+
+    @property
+    def mean(self):
+        return self._mean if self.count else None
+
+    @property
+    def min(self):
+        return self._mins[0][1] if self._mins else None
+
+    @property
+    def max(self):
+        return self._maxes[0][1] if self._maxes else None
+
+    @property
+    def stddev(self):
+        return math.sqrt(self._m2 / self.count) if self.count else None
+
+    def percentile(self, p):
+        values = self._sorted
+        if not values:
+            return None
+        position = (len(values) - 1) * p / 100.0
+        low = int(position)
+        high = min(low + 1, len(values) - 1)
+        return values[low] + (values[high] - values[low]) * (position - low)
+
+    def asDict(self):
+        summary = {
+            'count'     : self.count,
+            'sum'       : self.sum,
+            'mean'      : self.mean,
+            'min'       : self.min,
+            'max'       : self.max,
+            'stddev'    : self.stddev,
+        }
+        if self.percentiles:
+            summary['percentiles'] = dict((p, self.percentile(p)) for p in self.percentiles)
+        return summary
+
+
+
+class _Window(Node, HasInput, HasOutput):
+    """
+    Shared setup for the window nodes. Windows are either `size` items long
+    or `duration` seconds long, but not both. The value of an item is
+    `value(data)` (`readingValue` by default: the reading's `data`, or the
+    data itself, as a float), and its time is `timestamp(data)` as seconds
+    since the epoch (`readingTime` by default: the reading's `last_read`, or
+    the arrival time).
+    """
+    def __init__(self, *args, **kwargs):
+        super(_Window, self).__init__(*args, **kwargs)
+        self._size = kwargs.get('size', None)
+        self._duration = kwargs.get('duration', None)
+        if (self._size is None) == (self._duration is None):
+            raise ValueError('Either size or duration must be specified, but not both.')
+        if self._size is not None and self._size <= 0:
+            raise ValueError('size must be an int greater than 0')
+        if self._duration is not None and self._duration <= 0:
+            raise ValueError('duration must be greater than 0')
+
+        self._value = kwargs.get('value', readingValue)
+        self._timestamp = kwargs.get('timestamp', readingTime)
+
+    def _now(self, data):
+        return self._timestamp(data)
+
+    def _summary(self, start, end):
+        summary = self.stats.asDict()
+        summary['start'] = start
+        summary['end'] = end
+        return summary
+
+
+
+class TumblingWindow(_Window):
+    """
+    Public (I/O): aggregates its input over back-to-back, non-overlapping
+    windows, emitting one summary dict as each window closes.
+
+    Time windows are aligned to multiples of `duration`. A window closes when
+    an item from a later window arrives, or when `poll()` is called after the
+    window's end. With the default `timestamp`, a timer on `scheduler` (the
+    shared `Scheduler` by default) also closes each live window at its end,
+    so the last window is emitted even if no more data arrives; windows that
+    ended more than a `duration` ago, as when replaying a log, are left to
+    the data.
+    """
+    def __init__(self, *args, **kwargs):
+        super(TumblingWindow, self).__init__(*args, **kwargs)
+        self.stats = WindowStats(percentiles=kwargs.get('percentiles', ()))
+        self._start = None
+        self._end = None
+        self._lock = threading.RLock()
+        self._end_timer = None
+        if self._duration is not None and kwargs.get('timestamp') is None:
+            self._end_timer = _PollTimer(self.poll, kwargs.get('scheduler'))
+
+    def receiveData(self, data, from_id):
+        value = self._value(data)
+        now = self._now(data)
+
+        with self._lock:
+            if self._duration is not None:
+                if self._end is not None and now >= self._end:
+                    self._close()
+                if self._start is None:
+                    self._start = now - (now % self._duration)
+                    self._end = self._start + self._duration
+                    remaining = self._end - time.time()
+                    if self._end_timer and remaining > -self._duration:
+                        self._end_timer.arm(remaining)
+                self.stats.add(value)
+            else:
+                if self._start is None:
+                    self._start = now
+                self.stats.add(value)
+                self._end = now
+                if self.stats.count >= self._size:
+                    self._close()
+
+    def poll(self, now=None):
+        with self._lock:
+            if self._duration is not None and self._end is not None:
+                remaining = self._end - (now if now is not None else time.time())
+                if remaining <= 0:
+                    self._close()
+                elif self._end_timer:
+                    self._end_timer.arm(remaining)
+
+    def _close(self):
+        if self._end_timer:
+            self._end_timer.cancel()
+        summary = self._summary(self._start, self._end)
+        self.stats.clear()
+        self._start = None
+        self._end = None
+        self.o.emit(summary)
+
+
+
+class SlidingWindow(_Window):
+    """
+    Public (I/O): aggregates its input over the last `size` items or the last
+    `duration` seconds, emitting an updated summary dict every `every` items
+    (every item by default).
+    """
+    def __init__(self, *args, **kwargs):
+        super(SlidingWindow, self).__init__(*args, **kwargs)
+        self.stats = WindowStats(percentiles=kwargs.get('percentiles', ()))
+        self._every = kwargs.get('every', 1)
+        self._items = deque()
+        self._since_emit = 0
+
+    def receiveData(self, data, from_id):
+        value = self._value(data)
+        now = self._now(data)
+        items = self._items
+        stats = self.stats
+
+        items.append((now, value))
+        stats.add(value)
+        if self._size is not None:
+            while len(items) > self._size:
+                stats.remove(items.popleft()[1])
+        else:
+            cutoff = now - self._duration
+            while items[0][0] <= cutoff:
+                stats.remove(items.popleft()[1])
+
+        self._since_emit += 1
+        if self._since_emit >= self._every:
+            self._since_emit = 0
+            self.o.emit(self._summary(items[0][0], now))
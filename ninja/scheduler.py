@@ -0,0 +1,344 @@
+import heapq, itertools, sys, threading, time
+from Queue import Queue
+
+
+# The id of CLOCK_MONOTONIC for clock_gettime, by platform.
+_CLOCK_MONOTONIC = {
+    'linux'     : 1,
+    'darwin'    : 6,
+    'freebsd'   : 4,
+    'openbsd'   : 3,
+    'netbsd'    : 3,
+}
+
+def _monotonicClock():
+    """
+    A clock that only ever moves forward, so timers are not thrown off by
+    changes to the system clock: `time.monotonic` where there is one (Python
+    3), or else `clock_gettime(CLOCK_MONOTONIC)` through ctypes. Falls back to
+    `time.time` if neither is available.
+    """
+    if hasattr(time, 'monotonic'):
+        return time.monotonic
+    clock_id = None
+    for prefix, value in _CLOCK_MONOTONIC.items():
+        if sys.platform.startswith(prefix):
+            clock_id = value
+    if clock_id is None:
+        return time.time
+    try:
+        import ctypes, ctypes.util
+        library = ctypes.util.find_library('rt') or ctypes.util.find_library('c')
+        clock_gettime = ctypes.CDLL(library, use_errno=True).clock_gettime
+    except (OSError, AttributeError, TypeError):
+        return time.time
+
+    class timespec(ctypes.Structure):
+        _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+
+    def monotonic():
+        t = timespec()
+        if clock_gettime(clock_id, ctypes.byref(t)) != 0:
+            raise OSError(ctypes.get_errno(), 'clock_gettime failed')
+        return t.tv_sec + t.tv_nsec * 1e-9
+
+    try:
+        monotonic()
+    except OSError:
+        return time.time
+    return monotonic
+
+monotonic = _monotonicClock()
+
+
+
+class Timer(object):
+    """
+    A call scheduled on a `Scheduler`. `cancel()` stops it from running (if
+    it hasn't already), and `wait()` blocks until it has run or been
+    cancelled.
+    """
+    def __init__(self, scheduler, when, fn, args):
+        self.scheduler  = scheduler
+        self.when       = when
+        self.fn         = fn
+        self.args       = args
+        self.cancelled  = False
+        self._done      = threading.Event()
+
+    def cancel(self):
+        self.cancelled = True
+        self._done.set()
+
+    def wait(self, timeout=None):
+        # Wait in slices, so a blocked thread still sees KeyboardInterrupt.
+        end = None if timeout is None else time.time() + timeout
+        while not self._done.is_set():
+            remaining = 1.0 if end is None else min(end - time.time(), 1.0)
+            if remaining <= 0:
+                break
+            self._done.wait(remaining)
+        return self._done.is_set()
+
+    def _run(self):
+        try:
+            self.fn(*self.args)
+        finally:
+            self._done.set()
+
+
+
+class Repeat(Timer):
+    """
+    A call repeated every `period` seconds on a `Scheduler`, `times` times
+    (forever by default) or until it is cancelled.
+
+    Each run is scheduled from the time the previous one was due, not from
+    when it finished, so the timing does not drift. If a run is late by more
+    than a whole period, the missed runs are skipped (and counted in
+    `skipped`) rather than run back to back. Only the runs made count towards
+    `times`, so a slow call still runs `times` times.
+
+    An exception raised by the call is counted in `errors` (and kept as
+    `last_error`); with `stop_on_error=True` it also cancels the repeat.
+    """
+    def __init__(self, scheduler, when, fn, args, period, times=None, background=False,
+            stop_on_error=False):
+        super(Repeat, self).__init__(scheduler, when, fn, args)
+        self.period         = period
+        self.times          = times
+        self.background     = background
+        self.stop_on_error  = stop_on_error
+        self.runs           = 0
+        self.skipped        = 0
+        self.errors         = 0
+        self.last_error     = None
+        self._running       = False
+
+    def _run(self):
+        try:
+            if not self.background:
+                self.runs += 1
+                self._runOnce()
+            elif self._running:
+                self.skipped += 1
+            else:
+                self._running = True
+                self.runs += 1
+                self.scheduler._runInWorker(self._runOnce)
+        finally:
+            self._reschedule()
+
+    def _runOnce(self):
+        try:
+            self.fn(*self.args)
+        except Exception as e:
+            self.errors += 1
+            self.last_error = e
+            if self.stop_on_error:
+                self.cancel()
+            raise
+        finally:
+            self._running = False
+            if self.times is not None and self.runs >= self.times:
+                self._done.set()
+
+    def _reschedule(self):
+        if self.cancelled or self.scheduler._stopped:
+            return
+        if self.times is not None and self.runs >= self.times:
+            # A last run still going on a worker finishes it instead.
+            if not self._running:
+                self._done.set()
+            return
+        when = self.when + self.period
+        now = self.scheduler.clock()
+        if when <= now:
+            missed = int((now - when) // self.period) + 1
+            self.skipped += missed
+            when += missed * self.period
+        self.when = when
+        self.scheduler._push(self)
+
+
+
+class Scheduler(object):
+    """
+    Runs timed calls for any number of callers on a single thread, instead of
+    a thread (or a `time.sleep` loop) per caller. Pending calls are kept in a
+    heap ordered by due time, so the thread only wakes for the next one due.
+
+        timer = scheduler.callLater(5, fn, arg)
+        timer.cancel()
+
+    The thread is a daemon, started with the first call scheduled. Calls run
+    on it one at a time, so they should be quick; an exception raised by a
+    call is counted in `errors` (and kept as `last_error`) and the scheduler
+    carries on. With `threaded=False` no thread is started, and the owner
+    runs the due calls with `runPending()` instead.
+
+    Calls that block, like network requests, should be repeated with
+    `background=True`. They are then handed to a pool of `workers` threads
+    (4 by default), so they cannot hold up every other timer.
+
+    On Python 2, waiting on a `threading.Condition` with a timeout polls,
+    sleeping up to 50 ms at a time. Calls due at the end of a wait run on
+    time, but a call scheduled earlier than every pending one, while the
+    thread waits, can start up to 50 ms late.
+    """
+    def __init__(self, clock=monotonic, threaded=True, workers=4):
+        self.clock      = clock
+        self.threaded   = threaded
+        self.workers    = workers
+        self._work      = None
+        self._heap      = []
+        self._sequence  = itertools.count()
+        self._cond      = threading.Condition()
+        self._thread    = None
+        self._stopped   = False
+        self.errors     = 0
+        self.last_error = None
+
+    def now(self):
+        return self.clock()
+
+    def callLater(self, delay, fn, *args):
+        return self.callAt(self.clock() + delay, fn, *args)
+
+    def callAt(self, when, fn, *args):
+        timer = Timer(self, when, fn, args)
+        self._push(timer)
+        return timer
+
+    def repeat(self, period, fn, *args, **kwargs):
+        """
+        Call `fn(*args)` every `period` seconds, and return the `Repeat`.
+        The first call is after `delay` seconds (one period by default).
+        `times`, `background` and `stop_on_error` are passed to `Repeat`.
+        """
+        if period <= 0:
+            raise ValueError('period must be greater than 0')
+        delay = kwargs.get('delay', period)
+        timer = Repeat(self, self.clock() + delay, fn, args, period,
+            times=kwargs.get('times', None), background=kwargs.get('background', False),
+            stop_on_error=kwargs.get('stop_on_error', False))
+        self._push(timer)
+        return timer
+
+    def _runInWorker(self, fn):
+        with self._cond:
+            if self._work is None:
+                self._work = Queue()
+                for i in range(self.workers):
+                    worker = threading.Thread(target=self._runWorker, args=(self._work,))
+                    worker.daemon = True
+                    worker.start()
+        self._work.put(fn)
+
+    def _runWorker(self, work):
+        while True:
+            fn = work.get()
+            if fn is None:
+                return
+            try:
+                fn()
+            except Exception as e:
+                self.errors += 1
+                self.last_error = e
+
+    def _push(self, timer):
+        with self._cond:
+            heapq.heappush(self._heap, (timer.when, next(self._sequence), timer))
+            self._stopped = False
+            if self.threaded and self._thread is None:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+            self._cond.notify()
+
+    @property
+    def pending(self):
+        return sum(1 for entry in self._heap if not entry[2].cancelled)
+
+    def _popDue(self, now):
+        heap = self._heap
+        while heap and (heap[0][2].cancelled or heap[0][0] <= now):
+            timer = heapq.heappop(heap)[2]
+            if not timer.cancelled:
+                return timer
+        return None
+
+    def _call(self, timer):
+        try:
+            timer._run()
+        except Exception as e:
+            self.errors += 1
+            self.last_error = e
+
+    def runPending(self, now=None):
+        """
+        Run every call due by `now` (the current clock time by default), in
+        order, and return how many ran.
+        """
+        if now is None:
+            now = self.clock()
+        ran = 0
+        while True:
+            with self._cond:
+                timer = self._popDue(now)
+            if timer is None:
+                return ran
+            self._call(timer)
+            ran += 1
+
+    def _run(self):
+        cond = self._cond
+        while True:
+            with cond:
+                while True:
+                    if self._stopped:
+                        return
+                    timer = self._popDue(self.clock())
+                    if timer is not None:
+                        break
+                    if self._heap:
+                        # Condition waits are timed by the system clock, so
+                        # wait in slices in case it is changed.
+                        cond.wait(min(max(self._heap[0][0] - self.clock(), 0), 1.0))
+                    else:
+                        cond.wait()
+            self._call(timer)
+
+    def stop(self):
+        """
+        Stop the threads and cancel every pending call.
+        """
+        with self._cond:
+            self._stopped = True
+            for entry in self._heap:
+                entry[2].cancel()
+            self._heap = []
+            thread, self._thread = self._thread, None
+            work, self._work = self._work, None
+            self._cond.notify()
+        if work is not None:
+            for i in range(self.workers):
+                work.put(None)
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def sharedScheduler():
+    """
+    The `Scheduler` shared by default by everything that needs timers.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = Scheduler()
+    return _scheduler
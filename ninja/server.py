@@ -0,0 +1,317 @@
+"""
+A small dashboard and JSON server for device state.
+
+    from ninja.api      import NinjaAPI
+    from ninja.server   import DashboardServer
+
+    server = DashboardServer(NinjaAPI(ACCESS_TOKEN), period=10, port=8000)
+    server.serveForever()
+
+Devices are heartbeated by one background `Watcher`, however many clients are
+connected. Each device's state is serialized to JSON once per heartbeat and
+kept in a `DeviceStore`, so requests only copy bytes out of memory. Browsers can
+follow changes as Server-Sent Events from `/events` instead of polling.
+
+Endpoints:
+
+    /                       a live-updating table of the devices
+    /user.json              the user (fetched once, at startup)
+    /devices.json           every device, keyed by guid
+    /devices/<guid>.json    one device
+    /events                 an event stream, one `device` event per change
+"""
+
+import json, threading
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from Queue          import Queue, Empty, Full
+from SocketServer   import ThreadingMixIn
+
+from .api import Watcher
+from .devices import Device
+
+
+
+class DeviceStore(object):
+    """
+    The latest state of each device, held as pre-serialized JSON. `update`
+    serializes a device's `asDict(for_json=True)` once; every read after that
+    is a dict lookup. The device's `last_heartbeat` is left out, since it
+    changes every time; an update that leaves the rest as it was is not
+    stored, and returns False. Subscribers get each stored update's JSON on a
+    queue (see `subscribe`). `version` counts the stored updates, for use as
+    an ETag.
+    """
+    def __init__(self):
+        self._devices = {}
+        self._all = None
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self.version = 0
+        self.missed = 0
+
+    def update(self, device):
+        fields = device.asDict(for_json=True)
+        del fields['last_heartbeat']
+        content = json.dumps(fields, separators=(',', ':'))
+        with self._lock:
+            if self._devices.get(device.guid) == content:
+                return False
+            self._devices[device.guid] = content
+            self._all = None
+            self.version += 1
+            subscribers = list(self._subscribers)
+        for queue in subscribers:
+            try:
+                queue.put_nowait(content)
+            except Full:
+                # A client too slow to keep up misses updates, rather than
+                # holding up the watcher.
+                self.missed += 1
+        return True
+
+    def get(self, guid):
+        return self._devices.get(guid)
+
+    def guids(self):
+        return self._devices.keys()
+
+    def all(self):
+        """
+        Every device, as a JSON object keyed by guid. Rebuilt only after an
+        update.
+        """
+        with self._lock:
+            if self._all is None:
+                self._all = '{%s}' % (','.join('%s:%s' % (json.dumps(guid), content)
+                    for guid, content in sorted(self._devices.items())),)
+            return self._all
+
+    def subscribe(self, maxsize=256):
+        """
+        Return a queue that receives the JSON of every update from now on.
+        Pass it to `unsubscribe` when done.
+        """
+        queue = Queue(maxsize)
+        with self._lock:
+            self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        with self._lock:
+            self._subscribers.discard(queue)
+
+
+
+PAGE_HTML = """<!DOCTYPE html>
+<meta charset="utf-8">
+<title>Devices</title>
+<style>
+    body { max-width: 800px; margin: 0 auto; padding-top: 1em; }
+    table { font-family: monospace; }
+    td { padding-right: 1em; }
+</style>
+<table><tbody id="devices"></tbody></table>
+<script>
+    var devices = {};
+    // Cells are filled with textContent, so device names and data are never
+    // parsed as HTML.
+    function render() {
+        var body = document.getElementById('devices');
+        while (body.firstChild) {
+            body.removeChild(body.firstChild);
+        }
+        for (var guid in devices) {
+            var d = devices[guid];
+            var row = document.createElement('tr');
+            [d.name, guid, d.data, d.last_read].forEach(function (value) {
+                var cell = document.createElement('td');
+                cell.textContent = value == null ? '' : String(value);
+                row.appendChild(cell);
+            });
+            body.appendChild(row);
+        }
+    }
+    var source = new EventSource('events');
+    source.addEventListener('snapshot', function (e) { devices = JSON.parse(e.data); render(); });
+    source.addEventListener('device', function (e) {
+        var d = JSON.parse(e.data);
+        devices[d.guid] = d;
+        render();
+    });
+</script>
+"""
+
+
+
+class DashboardRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # See `ninja.simulation.FleetRequestHandler`.
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        if self.server.dashboard.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def do_GET(self):
+        dashboard = self.server.dashboard
+        store = dashboard.store
+        path = self.path.split('?')[0]
+
+        if path == '/':
+            self._send(PAGE_HTML, 'text/html; charset=utf-8')
+        elif path == '/events':
+            self._stream(store)
+        elif path == '/user.json':
+            self._send(dashboard.user_json or 'null')
+        elif path == '/devices.json':
+            self._sendVersioned(store, store.all)
+        elif path.startswith('/devices/') and path.endswith('.json'):
+            content = store.get(path[len('/devices/'):-len('.json')])
+            if content is None:
+                self._send('{"error":"not found"}', status=404)
+            else:
+                self._send(content)
+        else:
+            self._send('{"error":"not found"}', status=404)
+
+    def _sendVersioned(self, store, read):
+        etag = '"%s"' % (store.version,)
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self._send(read(), headers={ 'ETag': etag })
+
+    def _send(self, content, content_type='application/json', status=200, headers={}):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        self.send_header('Cache-Control', 'no-cache')
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _stream(self, store):
+        queue = store.subscribe()
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            self.wfile.write('event: snapshot\ndata: %s\n\n' % (store.all(),))
+            self.wfile.flush()
+            keepalive = self.server.dashboard.keepalive
+            while not self.server.dashboard.stopped:
+                try:
+                    content = queue.get(timeout=keepalive)
+                except Empty:
+                    self.wfile.write(': keepalive\n\n')
+                else:
+                    self.wfile.write('event: device\ndata: %s\n\n' % (content,))
+                self.wfile.flush()
+        except IOError:
+            # The client went away.
+            pass
+        finally:
+            store.unsubscribe(queue)
+            self.close_connection = 1
+
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+
+class DashboardServer(object):
+    """
+    Serves the state of `devices` (every device of the user, by default) over
+    HTTP on `host`:`port`, heartbeating them every `period` seconds on a
+    background `Watcher`. With `port=0` a free port is picked; `url` has the
+    address either way.
+
+    `start()` runs the watcher and the server on daemon threads and returns;
+    `serveForever()` does the same and then blocks. `stop()` shuts both down.
+    An error in a heartbeat round is counted in `errors` (and kept as
+    `last_error`), and the next round is tried a period later.
+    """
+    def __init__(self, api=None, devices=None, period=10, host='127.0.0.1', port=8000, **kwargs):
+        self.api = api
+        if devices is None:
+            if api is None:
+                raise ValueError('Either api or devices must be specified')
+            devices = api.getDevices()
+        self.devices = list(devices)
+        self.period = period
+        self.keepalive = kwargs.get('keepalive', 15)
+        self.verbose = kwargs.get('verbose', False)
+        self.errors = 0
+        self.last_error = None
+        self.stopped = False
+        self._stopping = threading.Event()
+
+        self.user_json = None
+        if api is not None and kwargs.get('user', True):
+            user = api.getUser()
+            self.user_json = json.dumps({
+                'id'    : user.id,
+                'name'  : user.name,
+                'email' : user.email,
+            })
+
+        self.store = DeviceStore()
+        for device in self.devices:
+            self.store.update(device)
+            # Every heartbeat, not just changes of data, since a heartbeat
+            # with the same data still moves `last_read` on.
+            device.on(Device.Events.HEARTBEAT, self._onHeartbeat)
+        self.watcher = Watcher(*self.devices)
+
+        self.httpd = _ThreadingHTTPServer((host, port), DashboardRequestHandler)
+        self.httpd.dashboard = self
+        self.url = 'http://%s:%s/' % self.httpd.server_address[:2]
+
+    def _onHeartbeat(self, device, *args):
+        self.store.update(device)
+
+    def _watch(self):
+        while not self.stopped:
+            try:
+                self.watcher.start(period=self.period)
+            except Exception as e:
+                self.errors += 1
+                self.last_error = e
+                self._stopping.wait(self.period)
+
+    def start(self):
+        self.stopped = False
+        self._stopping.clear()
+        self._watch_thread = threading.Thread(target=self._watch)
+        self._serve_thread = threading.Thread(target=self.httpd.serve_forever)
+        for thread in (self._watch_thread, self._serve_thread):
+            thread.daemon = True
+            thread.start()
+        return self
+
+    def serveForever(self):
+        self.start()
+        try:
+            while not self.stopped:
+                self._serve_thread.join(1)
+        except KeyboardInterrupt:
+            self.stop()
+
+    def stop(self):
+        # The watcher thread finishes its current round of heartbeats on its
+        # own; it is a daemon, so it is not waited for.
+        self.stopped = True
+        self._stopping.set()
+        self.watcher.stop()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self._serve_thread.join()
@@ -0,0 +1,450 @@
+"""
+Simulation mode: a synthetic fleet of devices behind a `NinjaAPI`, for
+developing and load-testing graphs without an account or any hardware.
+
+    from ninja.simulation import Fleet, SimulatedNinjaAPI
+
+    api = SimulatedNinjaAPI(Fleet({ 'temperature': 1000, 'button': 10 }))
+    devices = api.getDevices()
+
+`FleetServer` serves a fleet over HTTP instead, so the real `NinjaAPI`
+transport can be exercised and benchmarked offline:
+
+    server = FleetServer(Fleet(), endpoints={ 'heartbeat': { 'latency': 0.05 } }).start()
+    api = NinjaAPI(ACCESS_TOKEN, api_root_url=server.url)
+
+Readings are generated as they are asked for: temperatures, humidity and
+light levels follow random walks, buttons are pressed at random, and
+accelerometers report noise around a resting orientation. Values PUT to
+actuators (LEDs and relays) show up in their later heartbeats. A device's
+state is only created when it is first heartbeated, and is a few numbers, so
+a fleet of 100,000 devices fits comfortably in memory.
+"""
+
+import json, math, random, threading, time
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer   import ThreadingMixIn
+from urlparse       import parse_qs, urlparse
+
+from .api       import NinjaAPI, NinjaAPIError
+from .devices   import TYPE_MAP
+from .scheduler import monotonic
+
+
+# Simulated device ids (the `D` of a guid) for each device type.
+DEVICE_IDS = {
+    'temperature'   : 9,
+    'humidity'      : 8,
+    'light'         : 6,
+    'orientation'   : 2,
+    'button'        : 5,
+    'rgbled'        : 1000,
+    'relay'         : 11,
+}
+DEVICE_TYPES = dict((did, device_type) for device_type, did in DEVICE_IDS.items())
+
+ACTUATORS = ('rgbled', 'relay')
+
+
+
+class Fleet(object):
+    """
+    The simulated devices and their state. `counts` maps each device type to
+    how many of it there are (one of each type in `TYPE_MAP` by default). The
+    readings are pseudo-random, from `seed`, with time taken from `clock`.
+
+    `handle(method, path, data)` answers a request for the REST path under
+    the API version (eg `'device/<guid>/heartbeat'`) with `(status, body)`,
+    so the same fleet can sit behind `SimulatedNinjaAPI` or an HTTP server.
+    """
+    def __init__(self, counts=None, seed=0, clock=time.time, **kwargs):
+        if counts is None:
+            counts = dict((device_type, 1) for device_type in TYPE_MAP)
+        for device_type in counts:
+            if device_type not in DEVICE_IDS:
+                raise ValueError('Unknown device type: %s' % (device_type,))
+        self.counts = counts
+        self.clock = clock
+        self.press_rate = kwargs.get('press_rate', 0.01)
+        self.user = {
+            'id'            : 'simulated',
+            'name'          : kwargs.get('user_name', 'Simulated User'),
+            'email'         : 'simulated@example.com',
+            'pusherChannel' : 'simulated',
+        }
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._state = {}
+        self._callbacks = {}
+
+        # Devices are numbered contiguously, type by type.
+        self._ranges = []
+        start = 0
+        for device_type in sorted(counts):
+            self._ranges.append((device_type, start, start + counts[device_type]))
+            start += counts[device_type]
+        self.size = start
+
+    def __len__(self):
+        return self.size
+
+    def guids(self):
+        for device_type, start, end in self._ranges:
+            did = DEVICE_IDS[device_type]
+            for index in xrange(start, end):
+                yield 'SIM%07d_0_0_%d' % (index, did)
+
+    def _parseGUID(self, guid):
+        # Returns (device_type, index), or None if the guid is not in the fleet.
+        try:
+            block, gid, vid, did = guid.split('_')
+            index, device_type = int(block[3:]), DEVICE_TYPES[int(did)]
+        except (ValueError, KeyError):
+            return None
+        for range_type, start, end in self._ranges:
+            if range_type == device_type and start <= index < end and block.startswith('SIM'):
+                return device_type, index
+        return None
+
+    def info(self, guid):
+        device_type, index = self._parseGUID(guid)
+        name = '%s %d' % (device_type.capitalize(), index)
+        return {
+            'default_name'  : device_type.capitalize(),
+            'device_type'   : device_type,
+            'did'           : str(DEVICE_IDS[device_type]),
+            'gid'           : '0',
+            'vid'           : '0',
+            'is_sensor'     : 0 if device_type in ACTUATORS else 1,
+            'is_actuator'   : 1 if device_type in ACTUATORS else 0,
+            'is_silent'     : 0,
+            'meta'          : {},
+            'shortName'     : name,
+            'subDevices'    : {},
+        }
+
+    def _initialState(self, device_type, index):
+        # Every device gets its own resting level, spread by its index.
+        spread = (index * 2654435761 % 1000) / 1000.0
+        if device_type == 'temperature':
+            return [18 + spread * 8, None]
+        elif device_type in ('humidity', 'light'):
+            return [20 + spread * 60, None]
+        elif device_type == 'orientation':
+            return [(int(spread * 400) - 200, -186, -167), None]
+        elif device_type == 'button':
+            return [1, None]
+        elif device_type == 'rgbled':
+            return ['000000', None]
+        return ['0', None]
+
+    def _advance(self, device_type, state, now):
+        # Move a device's reading on by the time since its last heartbeat.
+        rand = self._random
+        elapsed = now - state[1] if state[1] is not None else 1.0
+        elapsed = min(max(elapsed, 0.0), 3600.0)
+        scale = math.sqrt(elapsed)
+        if device_type == 'temperature':
+            state[0] += rand.gauss(0, 0.05) * scale
+            return round(state[0], 1)
+        elif device_type in ('humidity', 'light'):
+            state[0] = min(max(state[0] + rand.gauss(0, 0.5) * scale, 0.0), 100.0)
+            return int(state[0])
+        elif device_type == 'orientation':
+            return ','.join(str(int(axis + rand.gauss(0, 3))) for axis in state[0])
+        elif device_type == 'button':
+            # Pressed (0) if a press landed since the last heartbeat.
+            pressed = rand.random() < 1 - math.exp(-self.press_rate * elapsed)
+            return 0 if pressed else 1
+        return state[0]
+
+    def heartbeat(self, guid):
+        parsed = self._parseGUID(guid)
+        if parsed is None:
+            return None
+        device_type, index = parsed
+        now = self.clock()
+        with self._lock:
+            state = self._state.get(guid)
+            if state is None:
+                state = self._state[guid] = self._initialState(device_type, index)
+            value = self._advance(device_type, state, now)
+            state[1] = now
+        return {
+            'result'    : 1,
+            'error'     : None,
+            'id'        : 0,
+            'data'      : {
+                'G'         : '0',
+                'V'         : 0,
+                'D'         : DEVICE_IDS[device_type],
+                'DA'        : value,
+                'GUID'      : guid,
+                'timestamp' : int(now * 1000),
+            },
+        }
+
+    def put(self, guid, value):
+        parsed = self._parseGUID(guid)
+        if parsed is None or parsed[0] not in ACTUATORS:
+            return False
+        with self._lock:
+            state = self._state.get(guid)
+            if state is None:
+                state = self._state[guid] = self._initialState(*parsed)
+            state[0] = value
+        return True
+
+    def handle(self, method, path, data=None):
+        """
+        Answer a REST request for `path` with `(status, body)`.
+        """
+        parts = path.strip('/').split('/')
+        if parts == ['user'] and method == 'GET':
+            return 200, self.user
+        if parts == ['devices'] and method == 'GET':
+            return 200, {
+                'result': 1, 'error': None, 'id': 0,
+                'data': dict((guid, self.info(guid)) for guid in self.guids()),
+            }
+        if len(parts) < 2 or parts[0] != 'device' or self._parseGUID(parts[1]) is None:
+            return 404, { 'result': 0, 'error': 'Unknown device', 'id': 404 }
+
+        guid = parts[1]
+        endpoint = parts[2] if len(parts) > 2 else None
+        ok = { 'result': 1, 'error': None, 'id': 0 }
+        if endpoint == 'heartbeat' and method == 'GET':
+            return 200, self.heartbeat(guid)
+        if endpoint is None and method == 'PUT':
+            if self.put(guid, (data or {}).get('DA')):
+                return 200, ok
+            return 400, { 'result': 0, 'error': 'Not an actuator', 'id': 400 }
+        if endpoint == 'callback':
+            url = (data or {}).get('url')
+            with self._lock:
+                exists = guid in self._callbacks
+                if method == 'GET':
+                    if not exists:
+                        return 404, { 'result': 0, 'error': 'No callback', 'id': 404 }
+                    return 200, dict(ok, data={ 'url': self._callbacks[guid] })
+                if method == 'POST':
+                    if exists:
+                        # The API reports a conflict in the body.
+                        return 200, { 'result': 0, 'error': 'Callback exists', 'id': 409 }
+                    self._callbacks[guid] = url
+                    return 200, ok
+                if method == 'PUT' and exists:
+                    self._callbacks[guid] = url
+                    return 200, ok
+                if method == 'DELETE' and exists:
+                    del self._callbacks[guid]
+                    return 200, ok
+                return 404, { 'result': 0, 'error': 'No callback', 'id': 404 }
+        return 405, { 'result': 0, 'error': 'Method not allowed', 'id': 405 }
+
+
+
+class SimulatedNinjaAPI(NinjaAPI):
+    """
+    A `NinjaAPI` that answers from a `Fleet` instead of the network. Each
+    request takes `latency` seconds (plus up to `jitter` more, at random), and
+    fails with a 500 status with probability `error_rate`. Counts of the
+    requests made are kept in `requests`, by method.
+    """
+    def __init__(self, fleet=None, latency=0.0, jitter=0.0, error_rate=0.0, seed=None):
+        super(SimulatedNinjaAPI, self).__init__('simulated')
+        self.fleet = fleet or Fleet()
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self.requests = { 'GET': 0, 'POST': 0, 'PUT': 0, 'DELETE': 0 }
+
+    def _request(self, method, url, data=None):
+        self.requests[method] += 1
+        delay = self.latency
+        if self.jitter:
+            delay += self._random.random() * self.jitter
+        if delay:
+            time.sleep(delay)
+        if self.error_rate and self._random.random() < self.error_rate:
+            return 500, None
+        return self.fleet.handle(method, url.split(self.API_VERSION, 1)[-1], data)
+
+    def _check(self, status, content):
+        if status != 200:
+            raise NinjaAPIError('Got status code %s, expected 200' % (status,), status)
+        return content
+
+    def _makeGETRequest(self, url, binary=False):
+        return self._check(*self._request('GET', url))
+
+    def _makePOSTRequest(self, url, data):
+        content = self._check(*self._request('POST', url, data))
+        if content['id'] != 0:
+            raise NinjaAPIError('Got status code %s, expected 200' % (content['id'],), content['id'])
+        return content
+
+    def _makePUTRequest(self, url, data):
+        return self._check(*self._request('PUT', url, data))
+
+    def _makeDELETERequest(self, url):
+        return self._check(*self._request('DELETE', url))
+
+
+
+class EndpointProfile(object):
+    """
+    How a `FleetServer` endpoint behaves: each request waits `latency` seconds
+    (plus up to `jitter` more, at random), at most `max_rate` requests a
+    second are let through (the rest wait their turn), and a request fails
+    with a 500 status with probability `failure_rate`.
+    """
+    def __init__(self, latency=0.0, jitter=0.0, max_rate=None, failure_rate=0.0):
+        if max_rate is not None and max_rate <= 0:
+            raise ValueError('max_rate must be greater than 0')
+        self.latency = latency
+        self.jitter = jitter
+        self.max_rate = max_rate
+        self.failure_rate = failure_rate
+        self.requests = 0
+        self.failures = 0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def admit(self, rand):
+        """
+        Delay a request as configured, and return whether it should fail.
+        """
+        with self._lock:
+            self.requests += 1
+            wait = self.latency + (rand.random() * self.jitter if self.jitter else 0.0)
+            if self.max_rate:
+                now = monotonic()
+                start = max(now, self._next)
+                self._next = start + 1.0 / self.max_rate
+                wait += start - now
+            fail = self.failure_rate and rand.random() < self.failure_rate
+            if fail:
+                self.failures += 1
+        if wait > 0:
+            time.sleep(wait)
+        return fail
+
+
+
+class FleetRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # The headers and body go out in separate writes; with Nagle's algorithm
+    # on, each response on a kept-alive connection would wait for the client
+    # to delay its ACK (~40 ms).
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _handle(self, method):
+        server = self.server.fleet_server
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        data = None
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            data = dict((k, v[0]) for k, v in parse_qs(self.rfile.read(length)).items())
+
+        prefix = '/rest/' + NinjaAPI.API_VERSION
+        if not url.path.startswith(prefix):
+            return self._send(404, { 'result': 0, 'error': 'Not found', 'id': 404 })
+        if not query.get('user_access_token'):
+            return self._send(401, { 'result': 0, 'error': 'Unauthorized', 'id': 401 })
+        path = url.path[len(prefix):]
+
+        profile = server.profileFor(method, path)
+        if profile.admit(server._random):
+            return self._send(500, { 'result': 0, 'error': 'Simulated failure', 'id': 500 })
+        status, body = server.fleet.handle(method, path, data)
+        self._send(status, body)
+
+    def _send(self, status, body):
+        content = json.dumps(body)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+
+
+class FleetServer(object):
+    """
+    Serves a `Fleet` (one of each device type by default) over HTTP on
+    `host`:`port`, with the REST paths `NinjaAPI` uses. Point an API at it
+    with `NinjaAPI(token, api_root_url=server.url)`; any access token is
+    accepted, but one must be given.
+
+    Each endpoint (`'user'`, `'devices'`, `'heartbeat'`, `'actuate'` for
+    device PUTs, and `'callback'`) behaves as set in `endpoints`, a dict of
+    `EndpointProfile`s or of their keyword arguments; the others use
+    `default`. With `port=0` a free port is picked.
+    """
+    ENDPOINTS = ('user', 'devices', 'heartbeat', 'actuate', 'callback')
+
+    def __init__(self, fleet=None, host='127.0.0.1', port=0, endpoints=None, default=None, seed=None):
+        self.fleet = fleet or Fleet()
+        self._random = random.Random(seed)
+        self.profiles = {}
+        endpoints = endpoints or {}
+        for name in endpoints:
+            if name not in self.ENDPOINTS:
+                raise ValueError('Unknown endpoint: %s' % (name,))
+        for name in self.ENDPOINTS:
+            profile = endpoints.get(name, default) or {}
+            if isinstance(profile, dict):
+                profile = EndpointProfile(**profile)
+            self.profiles[name] = profile
+
+        self.httpd = _ThreadingHTTPServer((host, port), FleetRequestHandler)
+        self.httpd.fleet_server = self
+        self.url = 'http://%s:%s/rest/' % self.httpd.server_address[:2]
+        self._thread = None
+
+    def profileFor(self, method, path):
+        parts = path.strip('/').split('/')
+        if parts[0] in ('user', 'devices'):
+            return self.profiles[parts[0]]
+        if len(parts) > 2 and parts[2] in ('heartbeat', 'callback'):
+            return self.profiles[parts[2]]
+        return self.profiles['actuate']
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
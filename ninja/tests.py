@@ -60,7 +60,7 @@ class Mock_NinjaAPI(object):
     def getDeviceHeartbeat(self, guid):
         content = HEARTBEATS[guid]
         content['data']['timestamp'] = int(datetime.now().strftime('%s')) * 1000 # because JavaScript
-        return Mock_Response(content=json.dumps(content))
+        return json.loads(json.dumps(content))
 
     # def get404(self, *args):
 
@@ -119,14 +119,54 @@ class Test_Temperature(unittest.TestCase):
 
 
 
-# class Test_NinjaAPI(unittest.TestCase):
-#     def setUp(self):
-#         from .api import NinjaAPI
-#         self.NinjaAPI = NinjaAPI
+class Test_NinjaAPI(unittest.TestCase):
+    def setUp(self):
+        from .api           import NinjaAPI
+        from .simulation    import FleetServer
+        self.NinjaAPI = NinjaAPI
+        self.server = FleetServer(endpoints={
+            'heartbeat' : { 'failure_rate': 0.5 },
+            'devices'   : { 'max_rate': 20 },
+        }, seed=1).start()
+        self.api = NinjaAPI('token', api_root_url=self.server.url)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def testRequireAccessToken(self):
+        self.assertRaises(ValueError, self.NinjaAPI)
+        self.assertRaises(ValueError, self.NinjaAPI, 1, 2, 3)
+
+    def testFleetServer(self):
+        import time
+        from .api import NinjaAPIError
+        self.assertEqual(self.api.getUser().name, 'Simulated User')
+        devices = dict((d.type, d) for d in self.api.getDevices())
+        self.assertEqual(len(devices), 7)
+
+        devices['rgbled'].setColor('00FF00')
+        devices['button'].setWebhookURL('http://example.com/a')
+        devices['button'].setWebhookURL('http://example.com/b')
+        self.assertEqual(devices['button'].getWebhookURL(), 'http://example.com/b')
+
+        failed = 0
+        for i in range(20):
+            try:
+                devices['rgbled'].heartbeat()
+            except NinjaAPIError:
+                failed += 1
+        self.assertTrue(0 < failed < 20)
+        self.assertEqual(devices['rgbled'].data, '00FF00')
+
+        # Three requests at 20 a second take at least 0.1s.
+        start = time.time()
+        for i in range(3):
+            self.api.getDevices()
+        self.assertTrue(time.time() - start >= 0.09)
+
+        self.assertRaises(NinjaAPIError, self.NinjaAPI('', api_root_url=self.server.url).getUser)
+
 
-#     def testRequireAccessToken(self):
-#         self.assertRaises(ValueError, self.NinjaAPI)
-#         self.assertRaises(ValueError, self.NinjaAPI, 1, 2, 3)
 
 class Test_Device(unittest.TestCase):
     def setUp(self):
@@ -136,12 +176,1567 @@ class Test_Device(unittest.TestCase):
 
     def testHeartbeat(self):
         guid = '1'
-        d = self.Devices(self.api, guid)
-        heartbeat_was_called = False
+        d = self.Device(self.api, guid)
+        calls = []
         def cb(inst, data):
-            self.assertEqual(data, HEARTBEATS[guid])
-            global heartbeat_was_called
-            heartbeat_was_called = True
-        # d.heartbeat()
-        self.assertTrue(heartbeat_was_called)
+            self.assertTrue(inst is d)
+            calls.append(data)
+        d.onHeartbeat(cb)
+        d.heartbeat()
+        self.assertEqual(calls, [HEARTBEATS[guid]['data']['DA']])
+        self.assertEqual(d.data, 24.2)
+
+    def testChangedClearedOnFailure(self):
+        from .api import NinjaAPIError
+        d = self.Device(self.api, '1')
+        d.heartbeat()
+        self.assertTrue(d.changed)
+        def fail(guid):
+            raise NinjaAPIError('Got status code 500, expected 200')
+        self.api.getDeviceHeartbeat = fail
+        self.assertRaises(NinjaAPIError, d.heartbeat)
+        self.assertFalse(d.changed)
+
+
+
+
+class Test_Connectors(unittest.TestCase):
+    def testIds(self):
+        from .nodes import Source, registry
+        a, b = Source(1), Source(2)
+        self.assertNotEqual(a.id, b.id)
+        self.assertTrue(registry.lookup(a.id) is a)
+        self.assertEqual(len(a.uuid), 36)
+        self.assertEqual(a.uuid, a.uuid)
+
+    def testIdsReused(self):
+        import gc
+        from .nodes import Source, registry
+        a = Source(1)
+        a_id = a.id
+        size = len(registry._nodes)
+        del a
+        gc.collect()
+        self.assertEqual(registry.lookup(a_id), None)
+        for n in range(100):
+            # Nodes and their connectors refer to each other, so they are
+            # freed by the cycle collector.
+            Source(n)
+            gc.collect()
+        self.assertTrue(len(registry._nodes) <= size + 1)
+        b = Source(2)
+        self.assertTrue(registry.lookup(b.id) is b)
+
+    def testConnectDisconnect(self):
+        from .nodes import Channel, Source
+        source, x, y = Source(1), Channel(), Channel()
+        x.i.connect(source.o)
+        y.i.connect(source.o)
+        self.assertEqual(source.o.targets, (x.i, y.i))
+        self.assertTrue(source.o.connected[y.id] is y.i)
+        source.emitData()
+        self.assertEqual(x.i.readAll(), [1])
+
+        source.o.disconnect(x.i)
+        self.assertEqual(source.o.targets, (y.i,))
+        self.assertEqual(x.i.targets, ())
+        self.assertFalse(x.id in source.o.connected)
+        self.assertRaises(Exception, source.o.disconnect, x.i)
+
+
+
+class Test_ExecutionPlan(unittest.TestCase):
+    def setUp(self):
+        from .nodes import Channel, Sink, Source, compileGraph, GraphCycleError
+        self.Channel = Channel
+        self.Sink = Sink
+        self.Source = Source
+        self.compileGraph = compileGraph
+        self.GraphCycleError = GraphCycleError
+
+    def _chain(self, length):
+        source = self.Source(0)
+        received = []
+        previous = source
+        for i in range(length):
+            channel = self.Channel(transform=lambda d: d + 1)
+            channel.i.connect(previous.o)
+            previous = channel
+        sink = self.Sink(on_receive=received.append)
+        sink.i.connect(previous.o)
+        return source, received
+
+    def testDeepChain(self):
+        source, received = self._chain(5000)
+        self.assertRaises(RuntimeError, source.emitData)
+        plan = self.compileGraph(source)
+        self.assertEqual(plan.sources, [source])
+        plan.tick()
+        self.assertEqual(received[-1], 5000)
+
+    def testOrderMatchesRecursive(self):
+        source = self.Source('x')
+        seen = []
+        fan = [self.Channel(label=str(n), transform=lambda d, n=n: seen.append(n) or d) for n in range(5)]
+        for channel in fan:
+            channel.i.connect(source.o)
+            channel.o.connect(self.Sink(on_receive=lambda d, c=channel: seen.append(c.label)).i)
+
+        source.emitData()
+        recursive_order = list(seen)
+        del seen[:]
+        plan = self.compileGraph(source)
+        source.emitData()
+        self.assertEqual(seen, recursive_order)
+
+        plan.release()
+        self.assertFalse('emit' in source.o.__dict__)
+
+    def testMultipleEmitsKeepOrder(self):
+        import itertools
+        from .nodes import Buffer
+        def build():
+            counter = itertools.count()
+            source = self.Source(lambda: next(counter))
+            buf = Buffer(flush_at=3)
+            buf.i.connect(source.o)
+            seen = []
+            for name in 'ab':
+                channel = self.Channel(transform=lambda d, name=name: seen.append((name, d)) or d)
+                channel.i.connect(buf.o)
+                channel.o.connect(self.Sink(on_receive=lambda d: seen.append(('sink', d))).i)
+            return source, seen
+
+        source, recursive = build()
+        for n in range(6):
+            source.emitData()
+        self.assertEqual([d for name, d in recursive if name == 'sink'], [0, 0, 1, 1, 2, 2, 3, 3, 4, 4, 5, 5])
+
+        source, compiled = build()
+        self.compileGraph(source)
+        for n in range(6):
+            source.emitData()
+        self.assertEqual(compiled, recursive)
+
+    def testCycle(self):
+        a = self.Channel(label='a')
+        b = self.Channel(label='b')
+        a.o.connect(b.i)
+        b.o.connect(a.i)
+        self.assertRaises(self.GraphCycleError, self.compileGraph, a)
+
+
+
+class Test_QueuedEdge(unittest.TestCase):
+    def setUp(self):
+        import threading
+        from .nodes import Source, Sink, queueEdge
+        self.gate = threading.Event()
+        self.received = []
+        def slowReceive(data):
+            self.gate.wait()
+            self.received.append(data)
+        self.source = Source(None)
+        self.sink = Sink(on_receive=slowReceive)
+        self.queueEdge = queueEdge
+
+    def _emit(self, values):
+        for value in values:
+            self.source._data_to_emit = value
+            self.source.emitData()
+
+    def testOrderPreserved(self):
+        edge = self.queueEdge(self.source.o, self.sink.i, maxsize=1000)
+        self._emit(range(100))
+        self.gate.set()
+        edge.close()
+        self.assertEqual(self.received, list(range(100)))
+        self.assertEqual(edge.stats()['delivered'], 100)
+        self.assertTrue(self.source.o.connected[self.sink.id] is self.sink.i)
+
+    def testDrop(self):
+        edge = self.queueEdge(self.source.o, self.sink.i, maxsize=5, overflow='drop')
+        self._emit(range(20))
+        self.gate.set()
+        edge.close()
+        # One item may already be held by the worker, outside the queue.
+        self.assertTrue(len(self.received) in (5, 6))
+        self.assertEqual(edge.dropped + len(self.received), 20)
+
+    def testCoalesce(self):
+        edge = self.queueEdge(self.source.o, self.sink.i, maxsize=2, overflow='coalesce')
+        self._emit(range(20))
+        self.gate.set()
+        edge.close()
+        self.assertEqual(self.received[-1], 19)
+        self.assertEqual(self.received, sorted(self.received))
+
+    def testBlockedEmitterOnClose(self):
+        import threading, time
+        edge = self.queueEdge(self.source.o, self.sink.i, maxsize=2)
+        emitter = threading.Thread(target=self._emit, args=(range(10),))
+        emitter.start()
+        while edge.depth < 2:
+            time.sleep(0.001)
+        edge.close(wait=False)
+        # Later emits go straight to the sink, which is gated too.
+        self.gate.set()
+        emitter.join()
+        edge._thread.join()
+        self.assertEqual(edge.delivered + edge.dropped, edge.received)
+        self.assertEqual(len(self.received), 10 - edge.dropped)
+
+
+
+class Test_Buffer(unittest.TestCase):
+    def setUp(self):
+        from .nodes import Buffer, Sink
+        self.Buffer = Buffer
+        self.received = []
+        self.sink = Sink(on_receive=self.received.append)
+
+    def _buffer(self, **kwargs):
+        buf = self.Buffer(**kwargs)
+        buf.o.connect(self.sink.i)
+        return buf
+
+    def testKeep(self):
+        buf = self._buffer(keep=3)
+        for i in range(10):
+            buf.i(i)
+        self.assertEqual(self.received, [])
+        buf.flush()
+        self.assertEqual(self.received, [7, 8, 9])
+
+    def testFlushAtBatch(self):
+        from .nodes import BatchSink
+        batches = []
+        buf = self.Buffer(flush_at=4, batch=True)
+        buf.o.connect(BatchSink(on_receive=batches.append).i, self.sink.i)
+        for i in range(10):
+            buf.i(i)
+        self.assertEqual(batches, [[0, 1, 2, 3], [4, 5, 6, 7]])
+        # Nodes without receiveBatch still get one item at a time.
+        self.assertEqual(self.received, range(8))
+
+    def testBatchThroughChannel(self):
+        import os, tempfile
+        from .nodes import BatchSink, Channel, JSONLinesWriter
+        batches = []
+        channel = Channel(transform=lambda d: d * 10)
+        path = os.path.join(tempfile.mkdtemp(), 'batch.jsonl')
+        writer = JSONLinesWriter(file=path, commit_every=5)
+        channel.o.connect(BatchSink(on_receive=batches.append).i, writer.i)
+        buf = self._buffer(flush_at=5, batch=True)
+        buf.o.connect(channel.i)
+        for i in range(5):
+            buf.i(i)
+        writer.close()
+        self.assertEqual(batches, [[0, 10, 20, 30, 40]])
+        self.assertEqual(open(path).read(), '0\n10\n20\n30\n40\n')
+
+    def testFlushBytes(self):
+        buf = self._buffer(flush_bytes=10, sizeof=len)
+        for s in ('abcd', 'efgh', 'ijkl', 'm'):
+            buf.i(s)
+        self.assertEqual(self.received, ['abcd', 'efgh', 'ijkl'])
+
+    def testFlushAge(self):
+        buf = self._buffer(flush_age=0.01)
+        buf.i(1)
+        buf.poll()
+        self.assertEqual(self.received, [])
+        import time; time.sleep(0.02)
+        buf.poll()
+        self.assertEqual(self.received, [1])
+
+    def testFlushAgeWhenQuiet(self):
+        import time
+        from .scheduler import Scheduler
+        scheduler = Scheduler()
+        buf = self._buffer(flush_age=0.02, scheduler=scheduler)
+        buf.i(1)
+        buf.i(2)
+        deadline = time.time() + 2
+        while not self.received and time.time() < deadline:
+            time.sleep(0.005)
+        self.assertEqual(self.received, [1, 2])
+        buf.i(3)
+        buf.flush()
+        self.assertEqual(scheduler.pending, 0)
+        scheduler.stop()
+
+    def testExclusive(self):
+        self.assertRaises(ValueError, self.Buffer, keep=2, flush_age=1)
+
+
+
+class Test_Windows(unittest.TestCase):
+    def setUp(self):
+        from .nodes import SlidingWindow, TumblingWindow, Sink
+        self.SlidingWindow = SlidingWindow
+        self.TumblingWindow = TumblingWindow
+        self.received = []
+        self.sink = Sink(on_receive=self.received.append)
+
+    def testSlidingCount(self):
+        import random
+        window = self.SlidingWindow(size=50, percentiles=(50, 90))
+        window.o.connect(self.sink.i)
+        values = [random.uniform(-10, 10) for i in range(500)]
+        for i, v in enumerate(values):
+            window.i(v)
+            recent = values[max(0, i - 49):i + 1]
+            summary = self.received[-1]
+            self.assertEqual(summary['count'], len(recent))
+            self.assertEqual(summary['min'], min(recent))
+            self.assertEqual(summary['max'], max(recent))
+            self.assertAlmostEqual(summary['mean'], sum(recent) / len(recent))
+            mean = sum(recent) / len(recent)
+            stddev = (sum((r - mean) ** 2 for r in recent) / len(recent)) ** 0.5
+            self.assertAlmostEqual(summary['stddev'], stddev)
+        ordered = sorted(values[-50:])
+        self.assertAlmostEqual(self.received[-1]['percentiles'][50], (ordered[24] + ordered[25]) / 2)
+
+    def testSkiplistMatchesSorted(self):
+        import random
+        from .nodes.windows import _IndexableSkiplist
+        skiplist = _IndexableSkiplist()
+        values = []
+        for n in range(2000):
+            if values and random.random() < 0.4:
+                value = values.pop(random.randrange(len(values)))
+                skiplist.remove(value)
+            else:
+                value = random.randint(0, 50)
+                values.append(value)
+                skiplist.insert(value)
+            self.assertEqual(len(skiplist), len(values))
+        self.assertEqual([skiplist[i] for i in range(len(skiplist))], sorted(values))
+        self.assertRaises(ValueError, skiplist.remove, 51)
+        self.assertRaises(IndexError, skiplist.__getitem__, len(values))
+
+    def testSlidingDuration(self):
+        window = self.SlidingWindow(duration=10, timestamp=lambda d: d[0], value=lambda d: d[1])
+        window.o.connect(self.sink.i)
+        for t in range(30):
+            window.i((t, t))
+        self.assertEqual(self.received[-1]['count'], 10)
+        self.assertEqual(self.received[-1]['min'], 20)
+
+    def testTumbling(self):
+        window = self.TumblingWindow(duration=10, timestamp=lambda d: d, value=float)
+        window.o.connect(self.sink.i)
+        for t in range(5, 35):
+            window.i(t)
+        self.assertEqual([s['count'] for s in self.received], [5, 10, 10])
+        self.assertEqual(self.received[1]['sum'], sum(range(10, 20)))
+        window.poll(now=40)
+        self.assertEqual(self.received[-1]['start'], 30)
+
+        window = self.TumblingWindow(size=3)
+        window.o.connect(self.sink.i)
+        for v in range(7):
+            window.i(v)
+        self.assertEqual(self.received[-1]['max'], 5)
+
+    def testReadings(self):
+        from .scheduler import Scheduler
+        scheduler = Scheduler(threaded=False)
+        window = self.TumblingWindow(duration=10, scheduler=scheduler)
+        window.o.connect(self.sink.i)
+        for s in range(0, 30, 5):
+            window.i({ 'guid': 'a', 'data': s, 'last_read': datetime(2013, 1, 1, 0, 0, s) })
+        self.assertEqual([r['sum'] for r in self.received], [5, 25])
+        self.assertEqual(self.received[0]['start'], 1356998400)
+        # Replayed windows are closed by the data, not the timer.
+        self.assertEqual(scheduler.pending, 0)
+
+    def testTumblingClosesWhenQuiet(self):
+        import time
+        from .scheduler import Scheduler
+        scheduler = Scheduler()
+        window = self.TumblingWindow(duration=0.05, scheduler=scheduler)
+        window.o.connect(self.sink.i)
+        window.i(1)
+        window.i(2)
+        deadline = time.time() + 2
+        # The two items may fall in different windows.
+        while sum(s['count'] for s in self.received) < 2 and time.time() < deadline:
+            time.sleep(0.005)
+        self.assertEqual(sum(s['count'] for s in self.received), 2)
+        scheduler.stop()
+
+
+
+class Test_Join(unittest.TestCase):
+    def setUp(self):
+        from .nodes import Join, Source, Sink, MISSING
+        self.Join = Join
+        self.MISSING = MISSING
+        self.a = Source(None)
+        self.b = Source(None)
+        self.received = []
+        self.sink = Sink(on_receive=self.received.append)
+
+    def _join(self, **kwargs):
+        join = self.Join(**kwargs)
+        join.i.connect(self.a.o, self.b.o)
+        join.o.connect(self.sink.i)
+        return join
+
+    def _send(self, source, data):
+        source._data_to_emit = data
+        source.emitData()
+
+    def testAligned(self):
+        self._join(key=lambda d: d[0])
+        self._send(self.a, (1, 'a1'))
+        self._send(self.a, (2, 'a2'))
+        self._send(self.b, (2, 'b2'))
+        # Completing group 2 also emits the partial group 1, in order.
+        self.assertEqual(len(self.received), 2)
+        self.assertEqual(self.received[0][self.a.id], (1, 'a1'))
+        self.assertTrue(self.received[0][self.b.id] is self.MISSING)
+        self.assertEqual(self.received[1][self.b.id], (2, 'b2'))
+
+        before = self.received[:]
+        self._send(self.b, (1, 'b1'))
+        self.assertEqual(self.received, before)
+
+    def testTimeoutLatest(self):
+        import time
+        from .scheduler import Scheduler
+        join = self._join(key=lambda d: d[0], timeout=0.01, mode='latest',
+            scheduler=Scheduler(threaded=False))
+        self._send(self.a, (1, 'a1'))
+        self._send(self.b, (1, 'b1'))
+        self._send(self.a, (2, 'a2'))
+        join.poll()
+        self.assertEqual(len(self.received), 1)
+        time.sleep(0.02)
+        join.poll()
+        self.assertEqual(self.received[1][self.b.id], (1, 'b1'))
+        self.assertEqual(join.late, 0)
+
+    def testTimeoutWhenQuiet(self):
+        import time
+        from .scheduler import Scheduler
+        scheduler = Scheduler()
+        self._join(key=lambda d: d[0], timeout=0.02, scheduler=scheduler)
+        self._send(self.a, (1, 'a1'))
+        deadline = time.time() + 2
+        while not self.received and time.time() < deadline:
+            time.sleep(0.005)
+        self.assertEqual(len(self.received), 1)
+        self.assertTrue(self.received[0][self.b.id] is self.MISSING)
+        self._send(self.a, (2, 'a2'))
+        self._send(self.b, (2, 'b2'))
+        self.assertEqual(scheduler.pending, 0)
+        scheduler.stop()
+
+    def testMaxPending(self):
+        self._join(key=lambda d: d, max_pending=3)
+        for i in range(10):
+            self._send(self.a, i)
+        self.assertEqual(len(self.received), 7)
+        self.assertEqual(self.received[0][self.a.id], 0)
+
+
+
+class Test_CSVWriter(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        from .nodes import CSVWriter
+        self.CSVWriter = CSVWriter
+        self.dir = tempfile.mkdtemp()
+        self.path = self.dir + '/log.csv'
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.dir)
+
+    def _lines(self, path=None):
+        return open(path or self.path).read().splitlines()
+
+    def testBatching(self):
+        writer = self.CSVWriter(file=self.path, headers=['a', 'b'], batch_size=3)
+        writer.i([1, 2])
+        writer.i([3, 4])
+        self.assertEqual(self._lines(), ['a,b', '1,2', '3,4'])
+        writer.i([5, 6])
+        writer.i([7, 8])
+        self.assertEqual(len(self._lines()), 3)
+        writer.close()
+        self.assertEqual(self._lines()[-1], '7,8')
+
+        # Reopening appends without repeating the headers.
+        writer.i([9, 10])
+        writer.close()
+        self.assertEqual(self._lines(), ['a,b', '1,2', '3,4', '5,6', '7,8', '9,10'])
+
+    def testRotation(self):
+        import glob, gzip
+        writer = self.CSVWriter(file=self.path, headers=['n'], rotate_bytes=20, compress=True, fsync='batch')
+        for n in range(20):
+            writer.i([n])
+        writer.close()
+        rotated = sorted(glob.glob(self.path + '.*.gz'))
+        self.assertTrue(len(rotated) >= 2)
+        rows = []
+        for path in rotated:
+            lines = gzip.open(path).read().splitlines()
+            self.assertEqual(lines[0], 'n')
+            rows += lines[1:]
+        rows += self._lines()[1:]
+        self.assertEqual(rows, [str(n) for n in range(20)])
+
+    def testFlushIntervalWhenQuiet(self):
+        import time
+        from .scheduler import Scheduler
+        scheduler = Scheduler()
+        writer = self.CSVWriter(file=self.path, headers=['n'], batch_size=100,
+            flush_interval=0.02, scheduler=scheduler)
+        writer.i([1])
+        deadline = time.time() + 2
+        while len(self._lines()) < 2 and time.time() < deadline:
+            time.sleep(0.005)
+        self.assertEqual(self._lines(), ['n', '1'])
+        writer.i([2])
+        writer.close()
+        self.assertEqual(scheduler.pending, 0)
+        scheduler.stop()
+
+
+
+class Test_JSONLinesWriter(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        from .nodes import JSONLinesWriter
+        self.JSONLinesWriter = JSONLinesWriter
+        self.dir = tempfile.mkdtemp()
+        self.path = self.dir + '/log.jsonl'
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.dir)
+
+    def testGroupCommit(self):
+        import os
+        from .units import Temperature
+        writer = self.JSONLinesWriter(file=self.path, commit_every=2)
+        writer.i({'when': datetime(2013, 1, 2, 3, 4, 5), 'temp': Temperature(c=20)})
+        self.assertFalse(os.path.exists(self.path))
+        writer.i({'n': 2})
+        writer.i({'n': 3})
+        lines = open(self.path).read().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(json.loads(lines[0]), {'when': '2013-01-02T03:04:05', 'temp': 293.15})
+
+        writer.snapshot(self.dir + '/snapshot.json')
+        writer.close()
+        self.assertEqual(json.load(open(self.dir + '/snapshot.json'))[2], {'n': 3})
+        self.assertEqual(len(open(self.path).read().splitlines()), 3)
+
+    def testJSONWriterKeepsMode(self):
+        import os, stat
+        from .nodes import JSONWriter
+        path = self.dir + '/state.json'
+        open(path, 'w').close()
+        os.chmod(path, 0644)
+        JSONWriter().i({'file': path, 'data': {'n': 1}})
+        self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0644)
+        self.assertEqual(json.load(open(path)), {'n': 1})
+
+    def testPendingWrittenOnExit(self):
+        from .nodes.fileio import closeWriters
+        writer = self.JSONLinesWriter(file=self.path, commit_every=100)
+        for n in range(5):
+            writer.i({'n': n})
+        closeWriters()
+        self.assertEqual(len(open(self.path).read().splitlines()), 5)
+
+    def testCommitIntervalWhenQuiet(self):
+        import os, time
+        from .scheduler import Scheduler
+        scheduler = Scheduler()
+        writer = self.JSONLinesWriter(file=self.path, commit_every=100, commit_interval=0.02,
+            scheduler=scheduler)
+        writer.i({'n': 1})
+        deadline = time.time() + 2
+        while not (os.path.exists(self.path) and os.path.getsize(self.path)) and time.time() < deadline:
+            time.sleep(0.005)
+        self.assertEqual(open(self.path).read().splitlines(), ['{"n":1}'])
+        writer.i({'n': 2})
+        writer.close()
+        self.assertEqual(scheduler.pending, 0)
+        scheduler.stop()
+
+
+
+class Test_TimeSeriesStore(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        from .nodes import TimeSeriesStore
+        self.TimeSeriesStore = TimeSeriesStore
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.dir)
+
+    def testRangeQuery(self):
+        from .units import Temperature
+        store = self.TimeSeriesStore(directory=self.dir, index_every=16)
+        for n in range(1000):
+            store.i({
+                'guid'      : 'temp',
+                'last_read' : datetime.utcfromtimestamp(1000000 + n),
+                'data'      : Temperature(n),
+            })
+        store.append('temp', 0, 0)
+        self.assertEqual(store.out_of_order, 1)
+
+        reader = store.reader()
+        timestamps, values = reader.read('temp', 1000100, 1000199.5)
+        self.assertEqual(len(values), 100)
+        self.assertEqual(timestamps[0], 1000100)
+        self.assertEqual(list(values)[-1], 199)
+        self.assertEqual(len(reader.read('temp')[0]), 1000)
+        self.assertEqual(len(reader.read('temp', end=999999)[0]), 0)
+        self.assertEqual(len(reader.read('other')[0]), 0)
+        store.close()
+        reader.close()
+
+        # Appends pick up where the files left off, trimming a torn record.
+        with open(self.dir + '/temp.ts', 'ab') as f:
+            f.write(b'\0\0\0')
+        store = self.TimeSeriesStore(directory=self.dir, index_every=16)
+        store.append('temp', 1001000, 1000)
+        store.append('temp', 5, 5)
+        reader = store.reader()
+        timestamps, values = reader.read('temp', 1000990)
+        self.assertEqual(list(values), [float(v) for v in range(990, 1001)])
+        store.close()
+
+    def testReadWhileGrowing(self):
+        store = self.TimeSeriesStore(directory=self.dir)
+        store.append('temp', 1, 1)
+        reader = store.reader()
+        timestamps, values = reader.read('temp')
+        store.append('temp', 2, 2)
+        store.flush()
+        self.assertEqual(list(reader.read('temp')[1]), [1, 2])
+        self.assertEqual(list(values), [1])
+        store.close()
+        reader.close()
+
+    def testGuids(self):
+        import os
+        store = self.TimeSeriesStore(directory=self.dir)
+        for n, guid in enumerate(['a/b', 'a_b', 'a b', 'a%20b', '1012BB013000_0101_0_31']):
+            store.append(guid, 0, n)
+        reader = store.reader()
+        self.assertEqual(reader.guids(), sorted(['a/b', 'a_b', 'a b', 'a%20b', '1012BB013000_0101_0_31']))
+        self.assertEqual(list(reader.read('a b')[1]), [2])
+        self.assertEqual(list(reader.read('a%20b')[1]), [3])
+        self.assertTrue(os.path.exists(os.path.join(self.dir, '1012BB013000_0101_0_31.ts')))
+        store.close()
+        reader.close()
+
+
+
+class Test_Readers(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        from . import nodes
+        self.nodes = nodes
+        self.dir = tempfile.mkdtemp()
+        self.received = []
+        self.sink = nodes.Sink(on_receive=self.received.append)
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.dir)
+
+    def testCSV(self):
+        path = self.dir + '/log.csv'
+        writer = self.nodes.CSVWriter(file=path, headers=['t', 'v'])
+        for n in range(5):
+            writer.i([n, n * 2])
+        writer.close()
+
+        reader = self.nodes.CSVReader(file=path, headers=True, parse=lambda r: int(r['v']))
+        reader.o.connect(self.sink.i)
+        self.assertTrue(reader.emitData())
+        self.assertEqual(self.received, [0])
+        self.assertEqual(reader.replay(), 5)
+        self.assertEqual(self.received[1:], [0, 2, 4, 6, 8])
+
+    def testJSONPaced(self):
+        import time
+        path = self.dir + '/log.jsonl'
+        writer = self.nodes.JSONLinesWriter(file=path)
+        for n in range(5):
+            writer.i({ 't': n * 0.01 })
+        writer.close()
+
+        reader = self.nodes.JSONReader(file=path, speed=1, timestamp=lambda r: r['t'])
+        reader.o.connect(self.sink.i)
+        started = time.time()
+        reader.replay()
+        self.assertTrue(time.time() - started >= 0.035)
+        self.assertEqual(len(self.received), 5)
+
+        reader = self.nodes.JSONReader(file=path, speed=100, timestamp=lambda r: r['t'])
+        reader.o.connect(self.sink.i)
+        self.assertEqual(reader.replay(limit=2), 2)
+
+    def testSeries(self):
+        store = self.nodes.TimeSeriesStore(directory=self.dir)
+        for n in range(10):
+            store.append('a', n, n)
+            store.append('b', n + 0.5, -n)
+        store.close()
+        reader = self.nodes.SeriesReader(directory=self.dir, chunk=3)
+        reader.o.connect(self.sink.i)
+        self.assertEqual(reader.replay(), 20)
+        self.assertEqual([r['guid'] for r in self.received[:4]], ['a', 'b', 'a', 'b'])
+        self.assertEqual(self.received[-1]['data'], -9)
+
+    def testSeriesManyDevices(self):
+        import resource
+        store = self.nodes.TimeSeriesStore(directory=self.dir)
+        for n in range(300):
+            store.append('d%03d' % (n,), n, n)
+            store.close()
+        reader = self.nodes.SeriesReader(directory=self.dir)
+        reader.o.connect(self.sink.i)
+        limits = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (256, limits[1]))
+        try:
+            self.assertEqual(reader.replay(), 300)
+        finally:
+            resource.setrlimit(resource.RLIMIT_NOFILE, limits)
+        self.assertEqual(self.received[-1]['guid'], 'd299')
+
+
+
+def _serve(handler_class):
+    """
+    Start a threaded local HTTP server for `handler_class` and return it with
+    its root URL.
+    """
+    import threading
+    from BaseHTTPServer import HTTPServer
+    from SocketServer import ThreadingMixIn
+
+    class Server(ThreadingMixIn, HTTPServer):
+        daemon_threads = True
+
+    server = Server(('127.0.0.1', 0), handler_class)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server, 'http://127.0.0.1:%d' % (server.server_port,)
+
+class Test_HTTPReader(unittest.TestCase):
+    def setUp(self):
+        from BaseHTTPServer import BaseHTTPRequestHandler
+        from .nodes import HTTPReader, HTTPCache, Sink
+
+        test = self
+        self.hits = []
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            def do_GET(self):
+                test.hits.append(self.path)
+                if self.path == '/missing':
+                    self.send_response(404)
+                    self.send_header('Content-Length', '9')
+                    self.end_headers()
+                    self.wfile.write('not found')
+                    return
+                if self.headers.get('If-None-Match') == '"v1"':
+                    self.send_response(304)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                body = 'body of ' + self.path
+                self.send_response(200)
+                self.send_header('ETag', '"v1"')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            def log_message(self, *args):
+                pass
+
+        self.server, self.root = _serve(Handler)
+
+        self.HTTPReader = HTTPReader
+        self.cache = HTTPCache(max_entries=2)
+        self.received = []
+        self.sink = Sink(on_receive=self.received.append)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def testConditional(self):
+        reader = self.HTTPReader(url=self.root + '/a', cache=self.cache, changed_only=True)
+        reader.o.connect(self.sink.i)
+        reader.emitData()
+        reader.emitData()
+        self.assertEqual(self.received, ['body of /a'])
+        self.assertEqual(reader.not_modified, 1)
+
+        reader.setOptions(url=self.root + '/a', cache=self.cache, ttl=60)
+        reader.emitData()
+        self.assertEqual(reader.cache_hits, 1)
+        self.assertEqual(len(self.hits), 2)
+
+    def testMany(self):
+        urls = [self.root + '/' + str(n) for n in range(5)]
+        reader = self.HTTPReader(url=urls, cache=self.cache, max_workers=3)
+        reader.o.connect(self.sink.i)
+        reader.emitData()
+        self.assertEqual(self.received[0][urls[3]], 'body of /3')
+        self.assertEqual(len(self.cache), 2)
+
+        # The worker threads are kept for the next pull.
+        import requests
+        for n in range(3):
+            reader.emitData()
+        self.assertEqual(reader._pool._threads, 3)
+        self.assertEqual(len(self.received), 4)
+
+        reader.setOptions(url=urls + [self.root + '/missing'], cache=self.cache)
+        self.assertRaises(requests.HTTPError, reader.emitData)
+
+    def testErrorStatus(self):
+        import requests
+        reader = self.HTTPReader(url=self.root + '/missing', cache=self.cache)
+        reader.o.connect(self.sink.i)
+        self.assertRaises(requests.HTTPError, reader.emitData)
+        self.assertEqual(self.received, [])
+        self.assertEqual(len(self.cache), 0)
+
+
+
+class Test_HTTPWriter(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        from BaseHTTPServer import BaseHTTPRequestHandler
+        from .nodes import HTTPWriter
+
+        test = self
+        self.batches = []
+        self.failing = 0
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            def do_POST(self):
+                import gzip
+                from cStringIO import StringIO
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                if self.headers.get('Content-Encoding') == 'gzip':
+                    body = gzip.GzipFile(fileobj=StringIO(body)).read()
+                status = 200
+                if test.failing:
+                    test.failing -= 1
+                    status = 503
+                else:
+                    test.batches.append(json.loads(body))
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+            def log_message(self, *args):
+                pass
+
+        self.server, self.root = _serve(Handler)
+        self.HTTPWriter = HTTPWriter
+        self.spill_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        import shutil
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.spill_dir)
+
+    def testBatches(self):
+        writer = self.HTTPWriter(url=self.root + '/metrics', batch_size=3, gzip=True)
+        for n in range(7):
+            writer.i({ 'n': n, 'at': datetime(2013, 1, 1) })
+        writer.close()
+        self.assertEqual([len(b) for b in self.batches], [3, 3, 1])
+        self.assertEqual(self.batches[0][0], { 'n': 0, 'at': '2013-01-01T00:00:00' })
+
+    def testRetryAndSpill(self):
+        import os
+        writer = self.HTTPWriter(url=self.root + '/metrics', batch_size=2, retries=1,
+            backoff=0.001, spill_dir=self.spill_dir)
+        self.failing = 1
+        writer.i(1); writer.i(2)
+        self.assertEqual(self.batches, [[1, 2]])
+        self.assertEqual(writer.failures, 1)
+
+        self.failing = 2
+        writer.i(3); writer.i(4)
+        self.assertEqual(writer.spilled, 1)
+        writer.i(5); writer.i(6)
+        self.assertEqual(self.batches, [[1, 2], [5, 6], [3, 4]])
+        self.assertEqual(os.listdir(self.spill_dir), [])
+
+    def testBatchIntervalWhenQuiet(self):
+        import time
+        from .scheduler import Scheduler
+        scheduler = Scheduler()
+        writer = self.HTTPWriter(url=self.root + '/metrics', batch_size=100,
+            batch_interval=0.02, scheduler=scheduler)
+        writer.i(1)
+        writer.i(2)
+        deadline = time.time() + 2
+        while not self.batches and time.time() < deadline:
+            time.sleep(0.005)
+        self.assertEqual(self.batches, [[1, 2]])
+        writer.i(3)
+        writer.close()
+        self.assertEqual(scheduler.pending, 0)
+        scheduler.stop()
+
+
+
+class Stub_NinjaAPI(object):
+    """
+    Serves heartbeats from a dict of guid -> list of readings, one reading per
+    heartbeat (repeating the last one).
+    """
+    def __init__(self, readings):
+        self.readings = readings
+        self.heartbeats = 0
+        self.timestamp = 1356998400000
+
+    def getDeviceHeartbeat(self, guid):
+        self.heartbeats += 1
+        values = self.readings[guid]
+        value = values.pop(0) if len(values) > 1 else values[0]
+        return {
+            'id'    : 0,
+            'data'  : { 'DA': value, 'timestamp': self.timestamp },
+        }
+
+
+class Test_Ticker(unittest.TestCase):
+    def setUp(self):
+        from .nodes import AccelerometerNode, Sink, Ticker
+        self.api = Stub_NinjaAPI({
+            'a': ['1,1,1', '1,1,1', '2,2,2', '2,2,2'],
+            'b': ['0,0,0'],
+            'led': ['FF0000'],
+        })
+        self.received = []
+        sink = Sink(on_receive=lambda d: self.received.append((d['guid'], d['data'])))
+        self.a = AccelerometerNode(api=self.api, guid='a')
+        self.b = AccelerometerNode(api=self.api, guid='b')
+        sink.i.connect(self.a.o, self.b.o)
+        self.Ticker = Ticker
+
+    def testChangedOnly(self):
+        ticker = self.Ticker(self.a, self.b, changed_only=True)
+        ticker.start(period=0.25, duration=1)
+        self.assertEqual(ticker.counter, 4)
+        self.assertEqual(self.api.heartbeats, 8)
+        self.assertEqual(sorted(self.received), [('a', '1,1,1'), ('a', '2,2,2'), ('b', '0,0,0')])
+
+    def testFullRefresh(self):
+        ticker = self.Ticker(self.a, self.b, changed_only=True, full_refresh=2)
+        ticker.start(period=0.25, duration=1)
+        # The unchanged 'b' is emitted again on the refresh tick.
+        self.assertEqual(self.received.count(('b', '0,0,0')), 2)
+        self.assertEqual(len(self.received), 4)
+
+    def testBatch(self):
+        from .nodes import BatchSink
+        batches = []
+        ticker = self.Ticker(self.a, self.b, changed_only=True, batch=True)
+        ticker.readings.o.connect(BatchSink(on_receive=batches.append).i)
+        ticker.start(period=0.25, duration=1)
+        self.assertEqual(self.received, [])
+        self.assertEqual([sorted(r['guid'] for r in batch) for batch in batches],
+            [['a', 'b'], ['a']])
+
+    def testBatchSkipsInputOnly(self):
+        from .nodes import BatchSink, LEDNode
+        batches = []
+        ticker = self.Ticker(self.a, LEDNode(api=self.api, guid='led'), batch=True)
+        ticker.readings.o.connect(BatchSink(on_receive=batches.append).i)
+        ticker.start(period=0.25, duration=0.5)
+        self.assertTrue(batches)
+        self.assertEqual(set(r['guid'] for batch in batches for r in batch), set(['a']))
+
+
+
+class Test_NodeProfiler(unittest.TestCase):
+    def setUp(self):
+        from .nodes import Channel, Input, NodeProfiler, Sink, Source, compileGraph
+        self.Input = Input
+        self.compileGraph = compileGraph
+        self.source = Source(1, label='source')
+        self.channel = Channel(label='double', transform=lambda d: d * 2)
+        def fail(d):
+            raise ValueError(d)
+        self.sink = Sink(label='sink', on_receive=fail)
+        self.channel.i.connect(self.source.o)
+        self.channel.o.connect(self.sink.i)
+        self.profiler = NodeProfiler()
+        self.plain_call = Input.__call__
+
+    def tearDown(self):
+        self.profiler.disable()
+
+    def _run(self, times):
+        for n in range(times):
+            self.assertRaises(ValueError, self.source.emitData)
+
+    def testCounts(self):
+        self._run(2)
+        self.assertEqual(self.profiler.snapshot(), {})
+
+        self.profiler.enable()
+        self._run(3)
+        snapshot = self.profiler.snapshot()
+        self.assertEqual(snapshot['double']['items_in'], 3)
+        self.assertEqual(snapshot['double']['items_out'], 3)
+        self.assertEqual(snapshot['source']['items_out'], 3)
+        self.assertEqual(snapshot['sink']['errors'], 3)
+        self.assertTrue(snapshot['double']['total_time'] >= snapshot['double']['self_time'])
+        self.assertTrue('double' in self.profiler.table())
+
+        self.profiler.disable()
+        self.assertTrue(self.Input.__call__ == self.plain_call)
+
+    def testCompiled(self):
+        self.profiler.enable()
+        plan = self.compileGraph(self.source)
+        self.assertRaises(ValueError, plan.tick)
+        plan.release()
+        snapshot = self.profiler.snapshot()
+        self.assertEqual(snapshot['double']['items_in'], 1)
+        self.assertEqual(snapshot['source']['items_out'], 1)
+
+
+
+class Test_ProcessPartition(unittest.TestCase):
+    def testRoundTrip(self):
+        import os
+        from .nodes import Channel, ProcessPartition, Sink, Source
+        source = Source(None)
+        square = Channel(transform=lambda d: (d * d, os.getpid()))
+        label = Channel(transform=lambda d: ('n', d))
+        received = []
+        sink = Sink(on_receive=received.append)
+        square.i.connect(source.o)
+        label.i.connect(square.o)
+        sink.i.connect(label.o)
+
+        partition = ProcessPartition(square, label, batch_size=10, flush_interval=0.01).start()
+        for n in range(25):
+            source._data_to_emit = n
+            source.emitData()
+        partition.stop()
+
+        self.assertEqual([d[1][0] for d in received], [n * n for n in range(25)])
+        self.assertNotEqual(received[0][1][1], os.getpid())
+        self.assertEqual(partition.errors, 0)
+        self.assertTrue(source.o.connected[square.id] is square.i)
+
+    def testBoundPlan(self):
+        import os
+        from .nodes import Channel, ProcessPartition, Sink, Source, compileGraph
+        source = Source(2)
+        square = Channel(transform=lambda d: (d * d, os.getpid()))
+        received = []
+        square.i.connect(source.o)
+        square.o.connect(Sink(on_receive=received.append).i)
+
+        plan = compileGraph(source)
+        partition = ProcessPartition(square, flush_interval=0.01)
+        self.assertRaises(ValueError, partition.start)
+        plan.release()
+
+        partition.start()
+        plan = compileGraph(source)
+        plan.tick()
+        plan.release()
+        partition.stop()
+        self.assertEqual(received[0][0], 4)
+        self.assertNotEqual(received[0][1], os.getpid())
+
+
+
+class Test_Rules(unittest.TestCase):
+    def setUp(self):
+        from .nodes import Rules, Sink
+        self.Sink = Sink
+        self.rules = Rules(value=lambda d: d['v'], timestamp=lambda d: d['t'])
+        self.matches = []
+        self.rules.o.connect(Sink(on_receive=lambda m: self.matches.append(m['rule'])).i)
+        self.t = 0
+
+    def _read(self, guid, value):
+        self.t += 1
+        self.rules.i({ 'guid': guid, 'v': value, 't': self.t })
+        matches, self.matches = self.matches, []
+        return sorted(matches)
+
+    def testRules(self):
+        rules = self.rules
+        rules.addRange('comfort', 'temp', low=18, high=24)
+        rules.addThreshold('hot', 'temp', 30)
+        rules.addThreshold('freezing', 'temp', 0, direction='below')
+        rules.addThreshold('twenty', 'temp', 20, direction='both')
+        rules.addRateOfChange('spike', 'temp', 5)
+        for n in range(1000):
+            rules.addRange('other-%d' % n, 'guid-%d' % n, low=0)
+
+        hot = []
+        rules.output('hot').connect(self.Sink(on_receive=hot.append).i)
+
+        self.assertEqual(self._read('temp', 21), [])
+        self.assertEqual(self._read('temp', 19), ['twenty'])
+        self.assertEqual(self._read('temp', 23), ['twenty'])
+        self.assertEqual(self._read('temp', 31), ['comfort', 'hot', 'spike'])
+        self.assertEqual(hot[0]['v'], 31)
+        self.assertEqual(self._read('temp', 30), ['comfort'])
+        self.assertEqual(self._read('temp', 32), ['comfort'])
+        self.assertEqual(self._read('temp', 28), ['comfort'])
+        self.assertEqual(self._read('temp', 26), ['comfort'])
+        self.assertEqual(self._read('temp', 22), [])
+        self.assertEqual(self._read('temp', 18), ['twenty'])
+        self.assertEqual(self._read('temp', 14), ['comfort'])
+        self.assertEqual(self._read('temp', 10), ['comfort'])
+        self.assertEqual(self._read('temp', 6), ['comfort'])
+        self.assertEqual(self._read('temp', 2), ['comfort'])
+        self.assertEqual(self._read('temp', 0), ['comfort', 'freezing'])
+        self.assertEqual(self._read('guid-5', -1), ['other-5'])
+        self.assertEqual(self._read('unknown', -1), [])
+
+        rules.removeRule('comfort')
+        self.assertEqual(self._read('temp', -1), [])
+        self.assertRaises(ValueError, rules.addThreshold, 'hot', 'temp', 1)
+
+
+
+class Mock_Clock(object):
+    def __init__(self):
+        self.time = 0.0
+
+    def __call__(self):
+        return self.time
+
+
+
+class Test_Scheduler(unittest.TestCase):
+    def setUp(self):
+        from .scheduler import Scheduler
+        self.Scheduler = Scheduler
+
+    def testOrderAndCancel(self):
+        clock = Mock_Clock()
+        scheduler = self.Scheduler(clock=clock, threaded=False)
+        calls = []
+        scheduler.callLater(2, calls.append, 'b')
+        scheduler.callLater(1, calls.append, 'a')
+        timer = scheduler.callLater(1.5, calls.append, 'x')
+        timer.cancel()
+        self.assertEqual(scheduler.runPending(), 0)
+        clock.time = 5
+        self.assertEqual(scheduler.runPending(), 2)
+        self.assertEqual(calls, ['a', 'b'])
+        self.assertEqual(scheduler.pending, 0)
+
+    def testThreaded(self):
+        import threading
+        scheduler = self.Scheduler()
+        done = threading.Event()
+        scheduler.callLater(0.01, lambda: 1 / 0)
+        scheduler.callLater(0.02, done.set)
+        self.assertTrue(done.wait(2))
+        self.assertEqual(scheduler.errors, 1)
+        scheduler.stop()
+
+    def testRepeat(self):
+        clock = Mock_Clock()
+        scheduler = self.Scheduler(clock=clock, threaded=False)
+        calls = []
+        timer = scheduler.repeat(1, lambda: calls.append(clock.time), delay=0)
+        for t in (0, 0.9, 1.2, 2.0, 5.5, 6.0):
+            clock.time = t
+            scheduler.runPending()
+        # The late run due at 3 stays on the grid: 4 and 5 are skipped.
+        self.assertEqual(calls, [0, 1.2, 2.0, 5.5, 6.0])
+        self.assertEqual(timer.skipped, 2)
+        timer.cancel()
+        clock.time = 10
+        self.assertEqual(scheduler.runPending(), 0)
+        self.assertTrue(timer.wait(0))
+
+    def testCounterAndPulse(self):
+        import time
+        from .devices   import Device
+        from .nodes     import Counter, Sink
+        scheduler = self.Scheduler()
+        received = []
+        counter = Counter()
+        counter.o.connect(Sink(on_receive=received.append).i)
+        counter.startCounter(to=3, delay=0.01, scheduler=scheduler)
+        self.assertEqual(received, [0, 1, 2])
+
+        device = Device(Stub_NinjaAPI({'a': ['1', '2', '3']}), 'a')
+        beats = []
+        device.onHeartbeat(lambda d, data: beats.append(data))
+        timer = device.pulse(0.01, wait=False, scheduler=scheduler)
+        while len(beats) < 3:
+            time.sleep(0.01)
+        timer.cancel()
+        self.assertEqual(beats[:3], ['1', '2', '3'])
+        scheduler.stop()
+
+
+    def testSlowRunsStillCount(self):
+        import time
+        from .nodes import Counter, Sink
+        scheduler = self.Scheduler()
+        received = []
+        counter = Counter()
+        counter.o.connect(Sink(on_receive=lambda d: received.append(d) or time.sleep(0.025)).i)
+        timer = counter.startCounter(to=5, delay=0.01, scheduler=scheduler)
+        self.assertEqual(received, [0, 1, 2, 3, 4])
+        self.assertTrue(timer.skipped > 0)
+        scheduler.stop()
+
+    def testPulseRaises(self):
+        from .devices import Device
+        class Failing_NinjaAPI(object):
+            def getDeviceHeartbeat(self, guid):
+                raise ValueError('bad token')
+        scheduler = self.Scheduler()
+        device = Device(Failing_NinjaAPI(), 'a')
+        self.assertRaises(ValueError, device.pulse, 0.01, scheduler=scheduler)
+        timer = device.pulse(0.01, wait=False, scheduler=scheduler)
+        timer.cancel()
+        scheduler.stop()
+
+    def testMonotonic(self):
+        import sys, time
+        from .scheduler import monotonic
+        if sys.platform.startswith('linux'):
+            self.assertFalse(monotonic is time.time)
+        first = monotonic()
+        self.assertTrue(monotonic() >= first)
+
+
+
+class Test_Flow(unittest.TestCase):
+    def setUp(self):
+        from .nodes     import Sink
+        from .scheduler import Scheduler
+        self.clock = Mock_Clock()
+        self.scheduler = Scheduler(clock=self.clock, threaded=False)
+        self.received = []
+        self.sink = Sink(on_receive=self.received.append)
+
+    def _node(self, node_class, **kwargs):
+        node = node_class(scheduler=self.scheduler, **kwargs)
+        node.o.connect(self.sink.i)
+        return node
+
+    def _advance(self, to):
+        self.clock.time = to
+        self.scheduler.runPending()
+
+    def testDedupe(self):
+        from .nodes import Dedupe
+        dedupe = self._node(Dedupe, key=lambda d: d[1], group=lambda d: d[0])
+        for d in [('a', 1), ('a', 1), ('b', 1), ('a', 2), ('a', 2), ('a', 1)]:
+            dedupe.i(d)
+        self.assertEqual(self.received, [('a', 1), ('b', 1), ('a', 2), ('a', 1)])
+        self.assertEqual(dedupe.suppressed, 2)
+
+    def testThrottle(self):
+        from .nodes import Throttle
+        throttle = self._node(Throttle, limit=2, interval=1, trailing=True)
+        for i in range(5):
+            throttle.i(i)
+        self.assertEqual(self.received, [0, 1])
+        self._advance(1)
+        self.assertEqual(self.received, [0, 1, 4])
+        self.assertEqual(throttle.dropped, 2)
+        # The trailing item started a new interval, with room for one more.
+        throttle.i(5)
+        throttle.i(6)
+        self.assertEqual(self.received, [0, 1, 4, 5])
+        self._advance(2)
+        self._advance(3)
+        self.assertEqual(self.received, [0, 1, 4, 5, 6])
+
+    def testDebounce(self):
+        from .nodes import Debounce
+        debounce = self._node(Debounce, quiet=1, max_wait=2.5)
+        for t in (0, 0.5, 1.0, 1.5):
+            self._advance(t)
+            debounce.i(t)
+        self._advance(2.4)
+        self.assertEqual(self.received, [])
+        self._advance(2.5)
+        self.assertEqual(self.received, [1.5])
+        debounce.i('x')
+        self._advance(3.4)
+        debounce.i('y')
+        self._advance(4.4)
+        self.assertEqual(self.received, [1.5, 'y'])
+
+    def testSample(self):
+        from .nodes import Sample
+        sample = self._node(Sample, interval=1)
+        sample.i(1)
+        sample.i(2)
+        self._advance(1)
+        self._advance(2)
+        sample.i(3)
+        sample.flush()
+        self._advance(3)
+        self.assertEqual(self.received, [2, 3])
+
+
+
+class Test_Downsample(unittest.TestCase):
+    def setUp(self):
+        from .nodes import Sink
+        self.received = []
+        self.sink = Sink(on_receive=self.received.append)
+        # A flat line with one spike.
+        self.points = [(i, 100.0 if i == 37 else 0.0) for i in range(100)]
+
+    def testRecordedTimes(self):
+        import shutil, tempfile
+        from .nodes import JSONLinesWriter, JSONReader, readingTime
+        from .nodes.core import parseTime
+        record = {'guid': 'a', 'last_read': datetime(2013, 1, 2, 3, 4, 5, 250000), 'data': 1}
+        self.assertEqual(parseTime('2013-01-02T03:04:05.250000'), readingTime(record))
+        self.assertEqual(parseTime('2013-01-02T05:04:05+02:00'), parseTime('2013-01-02T03:04:05Z'))
+        self.assertRaises(ValueError, parseTime, 'yesterday')
+
+        directory = tempfile.mkdtemp()
+        try:
+            writer = JSONLinesWriter(file=directory + '/log.jsonl')
+            writer.i(record)
+            writer.close()
+            reader = JSONReader(file=directory + '/log.jsonl')
+            reader.o.connect(self.sink.i)
+            reader.replay()
+        finally:
+            shutil.rmtree(directory)
+        self.assertEqual(readingTime(self.received[0]), readingTime(record))
+
+    def testLTTB(self):
+        from .nodes import lttb
+        sampled = lttb(self.points, 10)
+        self.assertEqual(len(sampled), 10)
+        self.assertEqual(sampled[0], (0, 0.0))
+        self.assertEqual(sampled[-1], (99, 0.0))
+        self.assertTrue((37, 100.0) in sampled)
+        self.assertEqual(lttb(self.points[:5], 10), self.points[:5])
+        self.assertRaises(ValueError, lttb, self.points, 2)
+
+    def testMinMaxBuckets(self):
+        from .nodes import minMaxBuckets
+        sampled = minMaxBuckets(self.points, 5)
+        self.assertTrue(len(sampled) <= 10)
+        self.assertTrue((37, 100.0) in sampled)
+        self.assertEqual(sampled, sorted(sampled))
+
+    def testStream(self):
+        from .nodes import Downsample
+        for method in ('lttb', 'minmax'):
+            node = Downsample(size=50, points=10, method=method)
+            node.o.connect(self.sink.i)
+            self.received[:] = []
+            for i, value in self.points:
+                node.i({ 'guid': 'a', 'data': value, 'n': i })
+                node.i({ 'guid': 'b', 'data': -value, 'n': i })
+            node.flush()
+            for guid in ('a', 'b'):
+                kept = [d['n'] for d in self.received if d['guid'] == guid]
+                self.assertTrue(len(kept) <= 22, (method, kept))
+                self.assertTrue(37 in kept, (method, kept))
+                self.assertEqual(kept, sorted(kept))
+                if method == 'lttb':
+                    self.assertEqual((kept[0], kept[-1]), (0, 99))
+
+
+
+class Test_AnomalyDetector(unittest.TestCase):
+    def setUp(self):
+        from .nodes import AnomalyDetector, Sink
+        self.AnomalyDetector = AnomalyDetector
+        self.normal = []
+        self.anomalies = []
+        self.normal_sink = Sink(on_receive=self.normal.append)
+        self.anomaly_sink = Sink(on_receive=self.anomalies.append)
+
+    def _detector(self, **kwargs):
+        detector = self.AnomalyDetector(**kwargs)
+        detector.o.connect(self.normal_sink.i)
+        detector.anomaly.connect(self.anomaly_sink.i)
+        return detector
+
+    def testSpike(self):
+        import random
+        rand = random.Random(1)
+        detector = self._detector()
+        for i in range(200):
+            detector.i({ 'guid': 'a', 'data': 20 + rand.gauss(0, 0.5) })
+        self.anomalies[:] = []
+        detector.i({ 'guid': 'a', 'data': 35 })
+        self.assertEqual(len(self.anomalies), 1)
+        report = self.anomalies[0]
+        self.assertEqual(report['guid'], 'a')
+        self.assertEqual(sorted(report['reasons']), ['robust', 'zscore'])
+        self.assertAlmostEqual(detector.statsFor('a').median, 20, delta=1)
+
+    def testStuckAndBounded(self):
+        detector = self._detector(stuck_after=5, max_devices=2)
+        for i in range(6):
+            detector.i({ 'guid': 'light', 'data': 300 })
+        self.assertEqual([r['reasons'] for r in self.anomalies], [['stuck']])
+        detector.i({ 'guid': 'b', 'data': 1 })
+        detector.i({ 'guid': 'c', 'data': 1 })
+        self.assertEqual(detector.evicted, 1)
+        self.assertEqual(detector.statsFor('light'), None)
+
+    def testLargeFleetRoundRobin(self):
+        import random
+        rand = random.Random(1)
+        detector = self._detector()
+        for tick in range(12):
+            for guid in range(12000):
+                detector.i({ 'guid': guid, 'data': 20 + rand.gauss(0, 0.5) })
+        self.assertEqual(detector.evicted, 0)
+        self.anomalies[:] = []
+        detector.i({ 'guid': 5, 'data': 1e6 })
+        self.assertEqual([r['guid'] for r in self.anomalies], [5])
+
+
+
+class Test_DashboardServer(unittest.TestCase):
+    def setUp(self):
+        from .devices import Device
+        from .server  import DashboardServer
+        self.api = Stub_NinjaAPI({ 'a': ['20', '20', '21'], 'b': ['5'] })
+        self.devices = [Device(self.api, guid) for guid in ('a', 'b')]
+        self.server = DashboardServer(devices=self.devices, period=0.05, port=0).start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def _get(self, path, headers={}):
+        import urllib2
+        return urllib2.urlopen(urllib2.Request(self.server.url + path, headers=headers), timeout=5)
+
+    def testDevicesAndEvents(self):
+        import httplib, time, urllib2
+        host, port = self.server.httpd.server_address[:2]
+        connection = httplib.HTTPConnection(host, port, timeout=5)
+        connection.request('GET', '/events')
+        stream = connection.getresponse().fp
+        devices = {}
+        while devices.get('a', {}).get('data') != '21':
+            event = stream.readline()
+            data = json.loads(stream.readline()[len('data: '):])
+            stream.readline()
+            if event == 'event: snapshot\n':
+                devices.update(data)
+            else:
+                self.assertEqual(event, 'event: device\n')
+                devices[data['guid']] = data
+        self.assertEqual(devices['b']['data'], '5')
+        connection.close()
+
+        # Only changes are serialized; unchanged heartbeats leave the version.
+        time.sleep(0.2)
+        version = self.server.store.version
+        response = self._get('devices.json')
+        self.assertEqual(sorted(json.loads(response.read())), ['a', 'b'])
+        etag = response.info().getheader('ETag')
+        try:
+            self._get('devices.json', { 'If-None-Match': etag })
+            self.fail('expected 304')
+        except urllib2.HTTPError as e:
+            self.assertEqual(e.code, 304)
+        self.assertEqual(self.server.store.version, version)
+        self.assertEqual(json.loads(self._get('devices/a.json').read())['data'], '21')
+
+    def testLastReadRefreshed(self):
+        import time
+        self.api.timestamp += 60000
+        deadline = time.time() + 2
+        while time.time() < deadline:
+            device = json.loads(self.server.store.get('b'))
+            if device['last_read'] == '2013-01-01T00:01:00':
+                break
+            time.sleep(0.01)
+        self.assertEqual(device['last_read'], '2013-01-01T00:01:00')
+        self.assertEqual(device['data'], '5')
+
+
+
+class Test_Simulation(unittest.TestCase):
+    def setUp(self):
+        from .simulation import Fleet, SimulatedNinjaAPI
+        self.clock = Mock_Clock()
+        self.Fleet = Fleet
+        self.SimulatedNinjaAPI = SimulatedNinjaAPI
+        self.api = SimulatedNinjaAPI(Fleet(clock=self.clock))
+
+    def testDevices(self):
+        from .devices import TYPE_MAP
+        devices = self.api.getDevices()
+        self.assertEqual(sorted(d.__class__ for d in devices), sorted(TYPE_MAP.values()))
+        temps = []
+        for d in devices:
+            d.heartbeat()
+            self.assertTrue(d.data is not None)
+            if d.type == 'temperature':
+                temps.append(float(d.data.c))
+                self.clock.time += 60
+                d.heartbeat()
+                temps.append(float(d.data.c))
+        self.assertTrue(10 < temps[0] < 30 and abs(temps[1] - temps[0]) < 5)
+        self.assertEqual(self.api.getUser().name, 'Simulated User')
+
+    def testActuators(self):
+        devices = dict((d.type, d) for d in self.api.getDevices())
+        devices['rgbled'].setColor('FF0000')
+        devices['rgbled'].heartbeat()
+        self.assertEqual(devices['rgbled'].data, 'FF0000')
+        devices['relay'].turn_on()
+        self.assertEqual(devices['relay'].state, True)
+
+        button = devices['button']
+        button.setWebhookURL('http://example.com/a')
+        button.setWebhookURL('http://example.com/b')
+        self.assertEqual(button.getWebhookURL(), 'http://example.com/b')
+        button.clearWebhookURL()
+
+    def testErrorsAndScale(self):
+        from .api import NinjaAPIError
+        api = self.SimulatedNinjaAPI(error_rate=1.0)
+        self.assertRaises(NinjaAPIError, api.getUser)
 
+        fleet = self.Fleet({ 'temperature': 100000, 'button': 100000 })
+        guids = fleet.guids()
+        first = next(guids)
+        self.assertEqual(len(fleet), 200000)
+        self.assertEqual(fleet.heartbeat(first)['data']['GUID'], first)
+        self.assertEqual(fleet.heartbeat('SIM0200000_0_0_5'), None)
+        self.assertEqual(fleet.handle('GET', 'device/%s/heartbeat' % (first,))[0], 200)